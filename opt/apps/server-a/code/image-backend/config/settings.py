@@ -92,6 +92,17 @@ GOOGLE_SERVICE_ACCOUNT_FILE = os.environ.get(
     str(BASE_DIR / "secrets" / "google-service-account.json"),
 )
 
+DRIVE_API_BASE_URL = os.environ.get("DRIVE_API_BASE_URL", "https://www.googleapis.com")
+DRIVE_HTTP_POOL_SIZE = int(os.environ.get("DRIVE_HTTP_POOL_SIZE", "10"))
+DRIVE_HTTP_RETRIES = int(os.environ.get("DRIVE_HTTP_RETRIES", "3"))
+DRIVE_HTTP_BACKOFF_SECONDS = float(os.environ.get("DRIVE_HTTP_BACKOFF_SECONDS", "0.5"))
+
+DRIVE_INDEX_LRU_SIZE = int(os.environ.get("DRIVE_INDEX_LRU_SIZE", "10000"))
+DRIVE_INDEX_LRU_SECONDS = int(os.environ.get("DRIVE_INDEX_LRU_SECONDS", "300"))
+DRIVE_INDEX_NEGATIVE_SECONDS = int(os.environ.get("DRIVE_INDEX_NEGATIVE_SECONDS", "60"))
+DRIVE_INDEX_SYNC_INTERVAL_SECONDS = int(os.environ.get("DRIVE_INDEX_SYNC_INTERVAL_SECONDS", "300"))
+DRIVE_INDEX_FULL_SYNC_EVERY = int(os.environ.get("DRIVE_INDEX_FULL_SYNC_EVERY", "288"))
+
 GNH_IMAGE_CACHE_DIR = os.environ.get("GNH_IMAGE_CACHE_DIR", str(BASE_DIR / "media" / "gnh_images"))
 GOOD_IMAGE_CACHE_DIR = os.environ.get("GOOD_IMAGE_CACHE_DIR", str(BASE_DIR / "media" / "good_images_cache"))
 GNH_IMAGE_CACHE_MAX_BYTES = int(os.environ.get("GNH_IMAGE_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
@@ -101,6 +112,34 @@ GOOD_IMAGE_CACHE_MAX_DAYS = int(os.environ.get("GOOD_IMAGE_CACHE_MAX_DAYS", "7")
 
 MEDIA_ROOT = os.environ.get("MEDIA_ROOT", str(BASE_DIR / "media"))
 
+# Single-flight lock files live outside the cache dirs, one per stripe (keys are hashed into
+# IMAGE_LOCK_STRIPES files); a failed fill is returned to the requests queued behind it for
+# IMAGE_MISS_FAILURE_SECONDS instead of being retried by each.
+IMAGE_LOCK_DIR = os.environ.get("IMAGE_LOCK_DIR", "/tmp/image-locks")
+IMAGE_LOCK_STRIPES = int(os.environ.get("IMAGE_LOCK_STRIPES", "1024"))
+IMAGE_MISS_FAILURE_SECONDS = int(os.environ.get("IMAGE_MISS_FAILURE_SECONDS", "5"))
+
+# Browser/CDN caching per image source: max-age seconds (0 sends "no-cache") and whether
+# the response is marked immutable. ETags come from size+mtime, or a sha256 sidecar file.
+IMAGE_IMMUTABLE_SOURCES = {s.strip() for s in os.environ.get("IMAGE_IMMUTABLE_SOURCES", "").split(",") if s.strip()}
+IMAGE_CACHE_POLICIES = {
+    source: {
+        "max_age": int(os.environ.get(f"IMAGE_MAX_AGE_{source.upper()}", default)),
+        "immutable": source in IMAGE_IMMUTABLE_SOURCES,
+    }
+    for source, default in (("drive", "86400"), ("s3", "86400"), ("local", "3600"))
+}
+IMAGE_ETAG_SIDECAR = os.environ.get("IMAGE_ETAG_SIDECAR", "0") in {"1", "true", "True"}
+
+# Optional nginx offload: "<dir>=<internal location>" pairs, comma separated, e.g.
+# "/tmp/image-cache=/_image_cache". Files under a mapped dir are answered with X-Accel-Redirect.
+IMAGE_X_ACCEL_LOCATIONS = {}
+for pair in os.environ.get("IMAGE_X_ACCEL_LOCATIONS", "").split(","):
+    if "=" in pair:
+        root, location = pair.split("=", 1)
+        if root.strip() and location.strip():
+            IMAGE_X_ACCEL_LOCATIONS[os.path.realpath(root.strip())] = location.strip().rstrip("/")
+
 USE_X_FORWARDED_HOST = os.environ.get("USE_X_FORWARDED_HOST", "false").lower() in {"1", "true"}
 proxy_header = os.environ.get("SECURE_PROXY_SSL_HEADER")
 if proxy_header:
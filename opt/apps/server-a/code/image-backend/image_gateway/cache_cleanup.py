@@ -6,6 +6,7 @@ from .cleanup_log import write_cleanup_log
 
 _CLEANUP_LOCK = threading.Lock()
 _LAST_CLEANUP = {}
+TMP_FILE_GRACE_SECONDS = 3600
 
 
 def _dir_size_bytes(root):
@@ -19,17 +20,25 @@ def _dir_size_bytes(root):
     return total
 
 
-def _cleanup_cache_dir(cache_dir, max_bytes, max_days):
+def _cache_files(cache_dir, now):
+    # Temp files of in-flight atomic writes are left alone unless a crash orphaned them.
     files = []
-    now = time.time()
     for base, _, names in os.walk(cache_dir):
         for name in names:
             path = os.path.join(base, name)
             try:
                 st = os.stat(path)
+                if name.startswith(".tmp-") and now - st.st_mtime < TMP_FILE_GRACE_SECONDS:
+                    continue
                 files.append((path, st.st_mtime, st.st_size))
             except Exception:
                 pass
+    return files
+
+
+def _cleanup_cache_dir(cache_dir, max_bytes, max_days):
+    now = time.time()
+    files = _cache_files(cache_dir, now)
     bytes_before = sum(f[2] for f in files)
     files_deleted = 0
 
@@ -43,15 +52,7 @@ def _cleanup_cache_dir(cache_dir, max_bytes, max_days):
                 except Exception:
                     pass
 
-    files = []
-    for base, _, names in os.walk(cache_dir):
-        for name in names:
-            path = os.path.join(base, name)
-            try:
-                st = os.stat(path)
-                files.append((path, st.st_mtime, st.st_size))
-            except Exception:
-                pass
+    files = _cache_files(cache_dir, now)
     files.sort(key=lambda x: x[1])
     total = sum(f[2] for f in files)
 
@@ -1,20 +1,11 @@
 import os
-import time
 
-from google.auth.transport.requests import AuthorizedSession
-from google.oauth2.service_account import Credentials
 from PIL import Image
 from io import BytesIO
 
-
-_CACHE = {}
-_CACHE_TTL = 600
-
-
-def _get_session(sa_file):
-    scopes = ["https://www.googleapis.com/auth/drive.readonly"]
-    creds = Credentials.from_service_account_file(sa_file, scopes=scopes)
-    return AuthorizedSession(creds)
+from .drive_index import forget_drive_file, lookup_drive_file
+from .drive_session import DRIVE_READONLY_SCOPES, drive_api_url, get_drive_session
+from .single_flight import single_flight, write_atomic
 
 
 def _ensure_dir(path):
@@ -52,7 +43,31 @@ def _resize_image(content, width, ext):
     return out.getvalue()
 
 
-def load_drive_image(file_path, folder_id, sa_file, cache_dir, width=None):
+def download_drive_file(session, file_id):
+    dl_url = drive_api_url(f"drive/v3/files/{file_id}?alt=media")
+    return session.get(dl_url, timeout=30)
+
+
+def _fetch_drive_image(filename, folder_id, sa_file, ext, width):
+    entry = lookup_drive_file(folder_id, filename, sa_file)
+    if not entry:
+        return None
+
+    dl_resp = download_drive_file(get_drive_session(sa_file, DRIVE_READONLY_SCOPES), entry["file_id"])
+    if dl_resp.status_code == 404:
+        # Replaced or deleted since it was indexed; the next request lists Drive again.
+        forget_drive_file(folder_id, filename)
+        return None
+    if dl_resp.status_code != 200:
+        return None
+
+    content = dl_resp.content
+    if width:
+        content = _resize_image(content, width, ext)
+    return content
+
+
+def resolve_drive_image(file_path, folder_id, sa_file, cache_dir, width=None):
     if not file_path or not folder_id or not sa_file or not os.path.isfile(sa_file):
         return None, None
 
@@ -64,43 +79,21 @@ def load_drive_image(file_path, folder_id, sa_file, cache_dir, width=None):
     cache_name = f"{base_name}.w{width}{ext}" if width else f"{base_name}{ext}"
     cache_path = os.path.join(cache_dir, cache_name)
     if os.path.isfile(cache_path):
-        with open(cache_path, "rb") as f:
-            return f.read(), _image_mime_by_ext(ext)
-
-    cache_key = f"drv:{folder_id}:{filename}"
-    now_ts = time.time()
-    cache_entry = _CACHE.get(cache_key)
-
-    file_id = None
-    if cache_entry and (now_ts - cache_entry["ts"] < _CACHE_TTL):
-        file_id = cache_entry.get("id")
-    else:
-        authed = _get_session(sa_file)
-        q = f"'{folder_id}' in parents and name='{filename}' and trashed=false"
-        list_url = "https://www.googleapis.com/drive/v3/files"
-        list_resp = authed.get(list_url, params={"q": q, "fields": "files(id,mimeType)"}, timeout=15)
-        if list_resp.status_code == 200:
-            files = list_resp.json().get("files", [])
-            if files:
-                file_id = files[0]["id"]
-                _CACHE[cache_key] = {"id": file_id, "ts": now_ts}
-            else:
-                _CACHE[cache_key] = {"id": None, "ts": now_ts}
-
-    if not file_id:
-        return None, None
-
-    authed = _get_session(sa_file)
-    dl_url = f"https://www.googleapis.com/drive/v3/files/{file_id}?alt=media"
-    dl_resp = authed.get(dl_url, timeout=30)
-    if dl_resp.status_code != 200:
-        return None, None
-
-    content = dl_resp.content
-    if width:
-        content = _resize_image(content, width, ext)
-
-    with open(cache_path, "wb") as f:
-        f.write(content)
-
-    return content, _image_mime_by_ext(ext)
+        return cache_path, _image_mime_by_ext(ext)
+
+    # Concurrent misses for the same image wait here for the first one to fill the cache.
+    with single_flight(("drive", f"{folder_id}/{filename}", width)) as flight:
+        if not os.path.isfile(cache_path):
+            if flight.failed_recently():
+                return None, None
+            try:
+                content = _fetch_drive_image(filename, folder_id, sa_file, ext, width)
+            except Exception:
+                flight.mark_failed()
+                raise
+            if content is None:
+                flight.mark_failed()
+                return None, None
+            write_atomic(cache_path, content)
+
+    return cache_path, _image_mime_by_ext(ext)
@@ -0,0 +1,274 @@
+import datetime
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from pymongo import DeleteMany, UpdateOne
+
+from .drive_session import DRIVE_READONLY_SCOPES, drive_api_url, get_drive_session
+from .mongo import get_collection
+
+
+COLLECTION = "drive_file_index"
+SYNC_COLLECTION = "drive_folder_sync"
+LIST_FIELDS = "nextPageToken,files(id,name,mimeType,md5Checksum,modifiedTime,trashed)"
+CHANGES_FIELDS = (
+    "nextPageToken,newStartPageToken,"
+    "changes(fileId,removed,file(name,mimeType,md5Checksum,modifiedTime,trashed,parents))"
+)
+
+
+class _LruCache:
+    # Per-process front cache; misses are kept for a shorter time so new uploads show up.
+    def __init__(self):
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return False, None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._items[key]
+                return False, None
+            self._items.move_to_end(key)
+            return True, value
+
+    def put(self, key, value):
+        if value is None:
+            ttl = getattr(settings, "DRIVE_INDEX_NEGATIVE_SECONDS", 60)
+        else:
+            ttl = getattr(settings, "DRIVE_INDEX_LRU_SECONDS", 300)
+        max_size = getattr(settings, "DRIVE_INDEX_LRU_SIZE", 10000)
+        with self._lock:
+            self._items[key] = (time.monotonic() + ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > max_size:
+                self._items.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+
+_LRU = _LruCache()
+
+
+def _quote(value):
+    return str(value).replace("\\", "\\\\").replace("'", "\\'")
+
+
+def _entry_from_file(folder_id, f, now):
+    return {
+        "folder_id": folder_id,
+        "name": f["name"],
+        "file_id": f["id"],
+        "mime_type": f.get("mimeType"),
+        "md5": f.get("md5Checksum"),
+        "modified_time": f.get("modifiedTime"),
+        "updated_at": now,
+    }
+
+
+def _public_entry(doc):
+    return {key: doc.get(key) for key in ("file_id", "mime_type", "md5", "modified_time")}
+
+
+def list_drive_file(session, folder_id, name):
+    # Returns (ok, file); ok is False when Drive could not answer, so nothing is cached.
+    q = f"'{_quote(folder_id)}' in parents and name='{_quote(name)}' and trashed=false"
+    params = {"q": q, "fields": LIST_FIELDS, "orderBy": "modifiedTime desc", "pageSize": 1}
+    resp = session.get(drive_api_url("drive/v3/files"), params=params, timeout=15)
+    if resp.status_code != 200:
+        return False, None
+    files = resp.json().get("files", [])
+    return True, files[0] if files else None
+
+
+def lookup_drive_file(folder_id, name, sa_file):
+    # LRU, then one indexed Mongo read; only names missing from the index go to Drive.
+    key = (folder_id, name)
+    found, entry = _LRU.get(key)
+    if found:
+        return entry
+
+    try:
+        doc = get_collection(COLLECTION).find_one(
+            {"folder_id": folder_id, "name": name, "trashed": {"$ne": True}},
+            {"_id": 0, "file_id": 1, "mime_type": 1, "md5": 1, "modified_time": 1},
+        )
+    except Exception:
+        doc = None
+    if doc:
+        entry = _public_entry(doc)
+        _LRU.put(key, entry)
+        return entry
+
+    ok, f = list_drive_file(get_drive_session(sa_file, DRIVE_READONLY_SCOPES), folder_id, name)
+    if not ok:
+        return None
+    if f is None:
+        _LRU.put(key, None)
+        return None
+    return record_drive_file(folder_id, f)
+
+
+def record_drive_file(folder_id, f):
+    entry = _entry_from_file(folder_id, f, datetime.datetime.utcnow())
+    public = _public_entry(entry)
+    _LRU.put((folder_id, entry["name"]), public)
+    try:
+        get_collection(COLLECTION).update_one(
+            {"folder_id": folder_id, "name": entry["name"]},
+            {"$set": entry, "$unset": {"trashed": ""}},
+            upsert=True,
+        )
+    except Exception:
+        pass
+    return public
+
+
+def forget_drive_file(folder_id, name):
+    _LRU.discard((folder_id, name))
+    try:
+        get_collection(COLLECTION).delete_many({"folder_id": folder_id, "name": name})
+    except Exception:
+        pass
+
+
+def _list_folder(session, q):
+    # Oldest first, so with duplicate names the most recently modified file is written last.
+    params = {"q": q, "fields": LIST_FIELDS, "orderBy": "modifiedTime", "pageSize": 1000}
+    while True:
+        resp = session.get(drive_api_url("drive/v3/files"), params=params, timeout=60)
+        resp.raise_for_status()
+        payload = resp.json()
+        yield payload.get("files", [])
+        page_token = payload.get("nextPageToken")
+        if not page_token:
+            return
+        params["pageToken"] = page_token
+
+
+def _apply_page(folder_id, files, now, sync_token=None):
+    ops = []
+    for f in files:
+        if not f.get("name") or not f.get("id"):
+            continue
+        key = {"folder_id": folder_id, "name": f["name"]}
+        if f.get("trashed"):
+            ops.append(UpdateOne({**key, "file_id": f["id"]}, {"$set": {"trashed": True}}))
+            continue
+        entry = _entry_from_file(folder_id, f, now)
+        if sync_token:
+            entry["sync_token"] = sync_token
+        ops.append(UpdateOne(key, {"$set": entry, "$unset": {"trashed": ""}}, upsert=True))
+    if ops:
+        get_collection(COLLECTION).bulk_write(ops, ordered=True)
+    return len(ops)
+
+
+def _start_page_token(session):
+    resp = session.get(drive_api_url("drive/v3/changes/startPageToken"), timeout=15)
+    resp.raise_for_status()
+    return resp.json().get("startPageToken")
+
+
+def warm_drive_index(folder_id, sa_file):
+    # Full paged listing of the folder; names that are gone from Drive are dropped afterwards.
+    # The changes cursor is taken first, so anything changed during the listing is replayed.
+    session = get_drive_session(sa_file, DRIVE_READONLY_SCOPES)
+    page_token = _start_page_token(session)
+    now = datetime.datetime.utcnow()
+    sync_token = now.strftime("%Y%m%d%H%M%S%f")
+    q = f"'{_quote(folder_id)}' in parents and trashed=false"
+    upserted = 0
+    for files in _list_folder(session, q):
+        upserted += _apply_page(folder_id, files, now, sync_token)
+    col = get_collection(COLLECTION)
+    # Entries written by live lookups or uploads during the listing are newer than ``now``.
+    stale = {"folder_id": folder_id, "sync_token": {"$ne": sync_token}, "updated_at": {"$lt": now}}
+    removed = col.delete_many(stale).deleted_count
+    _save_sync_state(folder_id, page_token, now, full=True)
+    return {"folder_id": folder_id, "mode": "full", "upserted": upserted, "removed": removed}
+
+
+def _list_changes(session, page_token):
+    params = {"pageToken": page_token, "fields": CHANGES_FIELDS, "includeRemoved": "true", "pageSize": 1000}
+    while True:
+        resp = session.get(drive_api_url("drive/v3/changes"), params=params, timeout=60)
+        if resp.status_code in (400, 404, 410):
+            # The saved cursor is no longer valid; the caller falls back to a full listing.
+            yield None, None
+            return
+        resp.raise_for_status()
+        payload = resp.json()
+        yield payload.get("changes", []), payload.get("newStartPageToken")
+        if not payload.get("nextPageToken"):
+            return
+        params["pageToken"] = payload["nextPageToken"]
+
+
+def _apply_changes(folder_id, changes, now):
+    # The feed covers every file the service account sees. Deleted, trashed and moved-away
+    # ones are dropped by file_id in one delete (a no-op for other folders' files); a
+    # rename drops the entry stored under the old name.
+    ops = []
+    gone_ids = []
+    for change in changes:
+        file_id = change.get("fileId")
+        if not file_id:
+            continue
+        f = change.get("file") or {}
+        if change.get("removed") or f.get("trashed") or folder_id not in (f.get("parents") or []) or not f.get("name"):
+            gone_ids.append(file_id)
+            continue
+        ops.append(DeleteMany({"folder_id": folder_id, "file_id": file_id, "name": {"$ne": f["name"]}}))
+        ops.append(
+            UpdateOne(
+                {"folder_id": folder_id, "name": f["name"]},
+                {"$set": _entry_from_file(folder_id, {**f, "id": file_id}, now), "$unset": {"trashed": ""}},
+                upsert=True,
+            )
+        )
+    col = get_collection(COLLECTION)
+    if ops:
+        col.bulk_write(ops, ordered=True)
+    removed = 0
+    if gone_ids:
+        removed = col.delete_many({"folder_id": folder_id, "file_id": {"$in": gone_ids}}).deleted_count
+    return len(ops) // 2, removed
+
+
+def refresh_drive_index(folder_id, sa_file):
+    # Replays the Drive changes feed since the saved cursor, which also reports deletions,
+    # trashing and moves out of the folder; falls back to a full warm-up when the folder
+    # was never synced or the cursor expired.
+    state = get_collection(SYNC_COLLECTION).find_one({"_id": folder_id}) or {}
+    page_token = state.get("page_token")
+    if not page_token:
+        return warm_drive_index(folder_id, sa_file)
+
+    session = get_drive_session(sa_file, DRIVE_READONLY_SCOPES)
+    now = datetime.datetime.utcnow()
+    upserted = removed = 0
+    new_token = None
+    for changes, next_token in _list_changes(session, page_token):
+        if changes is None:
+            return warm_drive_index(folder_id, sa_file)
+        page_upserted, page_removed = _apply_changes(folder_id, changes, now)
+        upserted += page_upserted
+        removed += page_removed
+        new_token = next_token or new_token
+    _save_sync_state(folder_id, new_token or page_token, now, full=False)
+    return {"folder_id": folder_id, "mode": "delta", "upserted": upserted, "removed": removed}
+
+
+def _save_sync_state(folder_id, page_token, now, full):
+    fields = {"page_token": page_token, "last_sync_at": now}
+    if full:
+        fields["last_full_sync_at"] = now
+    get_collection(SYNC_COLLECTION).update_one({"_id": folder_id}, {"$set": fields}, upsert=True)
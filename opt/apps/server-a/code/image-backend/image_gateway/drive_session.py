@@ -0,0 +1,62 @@
+import threading
+
+from django.conf import settings
+from google.auth.transport.requests import AuthorizedSession
+from google.oauth2.service_account import Credentials
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DRIVE_READONLY_SCOPES = ("https://www.googleapis.com/auth/drive.readonly",)
+DRIVE_SCOPES = ("https://www.googleapis.com/auth/drive",)
+
+_SESSIONS = {}
+_SESSIONS_LOCK = threading.Lock()
+
+
+def drive_api_url(path):
+    base = getattr(settings, "DRIVE_API_BASE_URL", "https://www.googleapis.com").rstrip("/")
+    return f"{base}/{path.lstrip('/')}"
+
+
+def _build_adapter():
+    # Uploads are POSTs and are never retried, so a slow response cannot create duplicates.
+    retries = Retry(
+        total=getattr(settings, "DRIVE_HTTP_RETRIES", 3),
+        backoff_factor=getattr(settings, "DRIVE_HTTP_BACKOFF_SECONDS", 0.5),
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD", "DELETE"}),
+        raise_on_status=False,
+    )
+    pool_size = getattr(settings, "DRIVE_HTTP_POOL_SIZE", 10)
+    return HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+
+
+def build_drive_session(sa_file, scopes):
+    creds = Credentials.from_service_account_file(sa_file, scopes=list(scopes))
+    session = AuthorizedSession(creds)
+    adapter = _build_adapter()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_drive_session(sa_file, scopes=DRIVE_READONLY_SCOPES):
+    # One AuthorizedSession per (service account, scopes) for the whole process: the access
+    # token is minted once and refreshed in place, and TLS connections stay in the pool.
+    key = (sa_file, tuple(scopes))
+    session = _SESSIONS.get(key)
+    if session is not None:
+        return session
+    with _SESSIONS_LOCK:
+        session = _SESSIONS.get(key)
+        if session is None:
+            session = _SESSIONS[key] = build_drive_session(sa_file, scopes)
+    return session
+
+
+def close_drive_sessions():
+    with _SESSIONS_LOCK:
+        sessions = list(_SESSIONS.values())
+        _SESSIONS.clear()
+    for session in sessions:
+        session.close()
@@ -2,14 +2,8 @@ import json
 import os
 import uuid
 
-from google.auth.transport.requests import AuthorizedSession
-from google.oauth2.service_account import Credentials
-
-
-def _get_session(sa_file):
-    scopes = ["https://www.googleapis.com/auth/drive"]
-    creds = Credentials.from_service_account_file(sa_file, scopes=scopes)
-    return AuthorizedSession(creds)
+from .drive_index import forget_drive_file, record_drive_file
+from .drive_session import DRIVE_SCOPES, drive_api_url, get_drive_session
 
 
 def _guess_mime(filename, default="application/octet-stream"):
@@ -37,20 +31,23 @@ def upload_bytes_to_drive(content, filename, folder_id, sa_file, mime_type=None)
     ).encode("utf-8") + content + f"\r\n--{boundary}--\r\n".encode("utf-8")
 
     headers = {"Content-Type": f"multipart/related; boundary={boundary}"}
-    session = _get_session(sa_file)
-    url = "https://www.googleapis.com/upload/drive/v3/files?uploadType=multipart&fields=id,name"
+    session = get_drive_session(sa_file, DRIVE_SCOPES)
+    url = drive_api_url("upload/drive/v3/files?uploadType=multipart&fields=id,name")
     resp = session.post(url, data=body, headers=headers, timeout=30)
     if resp.status_code in [200, 201]:
-        return resp.json()
+        res = resp.json()
+        if res.get("id"):
+            record_drive_file(folder_id, {"id": res["id"], "name": res.get("name") or filename, "mimeType": mime_type})
+        return res
     return None
 
 
 def delete_drive_file_by_name(filename, folder_id, sa_file):
     if not (filename and folder_id and sa_file and os.path.isfile(sa_file)):
         return False
-    session = _get_session(sa_file)
+    session = get_drive_session(sa_file, DRIVE_SCOPES)
     q = f"'{folder_id}' in parents and name='{filename}' and trashed=false"
-    list_url = "https://www.googleapis.com/drive/v3/files"
+    list_url = drive_api_url("drive/v3/files")
     list_resp = session.get(list_url, params={"q": q, "fields": "files(id)"}, timeout=15)
     if list_resp.status_code != 200:
         return False
@@ -60,8 +57,11 @@ def delete_drive_file_by_name(filename, folder_id, sa_file):
         file_id = f.get("id")
         if not file_id:
             continue
-        del_url = f"https://www.googleapis.com/drive/v3/files/{file_id}"
+        del_url = drive_api_url(f"drive/v3/files/{file_id}")
         del_resp = session.delete(del_url, timeout=15)
         if del_resp.status_code not in [200, 204]:
             ok = False
+    if ok:
+        # On a partial failure the entry stays; a stale file_id is dropped on its first 404.
+        forget_drive_file(folder_id, filename)
     return ok
@@ -0,0 +1,83 @@
+import hashlib
+import os
+
+from django.conf import settings
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .single_flight import write_atomic
+
+_SIDECAR_SUFFIX = ".etag"
+
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:32]
+
+
+def _sidecar_etag(path, st):
+    sidecar = path + _SIDECAR_SUFFIX
+    try:
+        if os.stat(sidecar).st_mtime_ns >= st.st_mtime_ns:
+            with open(sidecar, "r", encoding="ascii") as f:
+                value = f.read().strip()
+            if value:
+                return value
+    except OSError:
+        pass
+    value = _hash_file(path)
+    try:
+        write_atomic(sidecar, value.encode("ascii"))
+    except OSError:
+        pass
+    return value
+
+
+def image_validators(path, content, width=None, sidecar=False):
+    # Strong ETag plus Last-Modified (epoch seconds) for a file on disk, or a content
+    # hash for an image that only exists in memory. With width, path is the original a
+    # resized copy is made from, so the validator is known before resizing. Sidecars are
+    # only written into cache dirs, never next to local originals.
+    if path:
+        st = os.stat(path)
+        if sidecar and getattr(settings, "IMAGE_ETAG_SIDECAR", False):
+            etag = _sidecar_etag(path, st)
+        else:
+            etag = f"{st.st_size:x}-{st.st_mtime_ns:x}"
+        if width:
+            etag += f"-w{width}"
+        return f'"{etag}"', int(st.st_mtime)
+    if content:
+        return f'"{hashlib.sha256(content).hexdigest()[:32]}"', None
+    return None, None
+
+
+def cache_control_for(source):
+    policy = getattr(settings, "IMAGE_CACHE_POLICIES", {}).get(source) or {}
+    max_age = int(policy.get("max_age") or 0)
+    if max_age <= 0:
+        return "no-cache"
+    value = f"public, max-age={max_age}"
+    if policy.get("immutable"):
+        value += ", immutable"
+    return value
+
+
+def set_cache_headers(response, etag, last_modified, cache_control):
+    if etag:
+        response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified)
+    response["Cache-Control"] = cache_control
+    return response
+
+
+def not_modified_response(request, etag, last_modified, cache_control):
+    # 304 when If-None-Match / If-Modified-Since already match, otherwise None.
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        return None
+    return set_cache_headers(response, etag, last_modified, cache_control)
@@ -5,8 +5,9 @@ from PIL import Image
 from django.conf import settings
 
 from .cache_cleanup import maybe_cleanup_cache_async
-from .drive_image import load_drive_image
+from .drive_image import resolve_drive_image
 from .s3_store import get_s3_object
+from .single_flight import single_flight, write_atomic
 
 
 def _ensure_dir(path):
@@ -44,7 +45,16 @@ def _resize_image(content, width, ext):
     return out.getvalue()
 
 
-def fetch_cached_image(
+def local_image_path(file_path):
+    # Absolute path of a local original under MEDIA_ROOT, or None when it does not exist.
+    rel_path = str(file_path or "").lstrip("/\\")
+    if not rel_path:
+        return None
+    abs_path = os.path.join(settings.MEDIA_ROOT, rel_path)
+    return abs_path if os.path.isfile(abs_path) else None
+
+
+def resolve_image_file(
     file_path,
     *,
     source="drive",
@@ -55,33 +65,36 @@ def fetch_cached_image(
     cache_max_days=0,
     aws_bucket=None,
 ):
+    # Returns (path, content, mime). Anything already on disk (cache hits, freshly written
+    # cache files, local originals) comes back as a path so the view can stream it without
+    # reading it; content is only set for images that exist in memory alone.
     if not file_path:
-        return None, None
+        return None, None, None
 
     if source == "drive":
         if not (folder_id and cache_dir):
-            return None, None
+            return None, None, None
         _ensure_dir(cache_dir)
         maybe_cleanup_cache_async(cache_dir, cache_max_bytes, cache_max_days)
-        return load_drive_image(file_path, folder_id, settings.GOOGLE_SERVICE_ACCOUNT_FILE, cache_dir, width=width)
+        path, mime = resolve_drive_image(file_path, folder_id, settings.GOOGLE_SERVICE_ACCOUNT_FILE, cache_dir, width=width)
+        return path, None, mime
 
     if source == "local":
-        rel_path = file_path.lstrip("/\\")
-        abs_path = os.path.join(settings.MEDIA_ROOT, rel_path)
-        if not os.path.isfile(abs_path):
-            return None, None
+        abs_path = local_image_path(file_path)
+        if not abs_path:
+            return None, None, None
+        ext = _detect_ext(abs_path)
+        if not width:
+            return abs_path, None, _image_mime_by_ext(ext)
         with open(abs_path, "rb") as f:
             content = f.read()
-        ext = _detect_ext(abs_path)
-        if width:
-            content = _resize_image(content, width, ext)
-        return content, _image_mime_by_ext(ext)
+        return None, _resize_image(content, width, ext), _image_mime_by_ext(ext)
 
     if source == "s3":
         if not (cache_dir and aws_bucket):
-            return None, None
+            return None, None, None
         if not file_path.startswith(aws_bucket):
-            return None, None
+            return None, None, None
 
         _ensure_dir(cache_dir)
         maybe_cleanup_cache_async(cache_dir, cache_max_bytes, cache_max_days)
@@ -94,27 +107,34 @@ def fetch_cached_image(
         _ensure_dir(os.path.dirname(cache_path))
 
         if os.path.isfile(cache_path):
-            with open(cache_path, "rb") as f:
-                return f.read(), _image_mime_by_ext(ext)
-
-        try:
-            obj = get_s3_object(key)
-            if obj is None:
-                return None, None
-            content = obj["Body"].read()
-            mime = obj.get("ContentType") or _image_mime_by_ext(ext)
-        except Exception:
-            return None, None
-
-        if width:
-            content = _resize_image(content, width, ext)
-
-        try:
-            with open(cache_path, "wb") as f:
-                f.write(content)
-        except Exception:
-            pass
-
-        return content, mime
-
-    return None, None
+            return cache_path, None, _image_mime_by_ext(ext)
+
+        # Concurrent misses for the same object wait here for the first one to fill the cache.
+        with single_flight(("s3", key, width)) as flight:
+            if os.path.isfile(cache_path):
+                return cache_path, None, _image_mime_by_ext(ext)
+            if flight.failed_recently():
+                return None, None, None
+
+            try:
+                obj = get_s3_object(key)
+                if obj is None:
+                    flight.mark_failed()
+                    return None, None, None
+                content = obj["Body"].read()
+                mime = obj.get("ContentType") or _image_mime_by_ext(ext)
+            except Exception:
+                flight.mark_failed()
+                return None, None, None
+
+            if width:
+                content = _resize_image(content, width, ext)
+
+            try:
+                write_atomic(cache_path, content)
+            except Exception:
+                return None, content, mime
+
+        return cache_path, None, mime
+
+    return None, None, None
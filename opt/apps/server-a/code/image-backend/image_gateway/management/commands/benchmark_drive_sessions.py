@@ -0,0 +1,178 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from image_gateway.drive_image import download_drive_file
+from image_gateway.drive_index import list_drive_file
+from image_gateway.drive_session import (
+    DRIVE_READONLY_SCOPES,
+    build_drive_session,
+    close_drive_sessions,
+    get_drive_session,
+)
+
+BENCH_FILE_ID = "bench-file"
+BENCH_IMAGE = b"\xff\xd8\xff" + b"\x00" * 64 * 1024
+
+
+class _DriveStandIn(BaseHTTPRequestHandler):
+    # Minimal stand-in for the OAuth token endpoint and the two Drive calls of a cache miss.
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.count("connections")
+        # A plain-HTTP connect costs nothing, so charge the TLS handshake explicitly.
+        time.sleep(self.server.handshake_seconds)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type):
+        time.sleep(self.server.latency_seconds)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if urlsplit(self.path).path != "/token":
+            return self._send(404, b"{}", "application/json")
+        self.server.count("token_requests")
+        body = json.dumps({"access_token": "bench-token", "expires_in": 3600, "token_type": "Bearer"})
+        self._send(200, body.encode("utf-8"), "application/json")
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        self.server.count("api_requests")
+        if path == "/drive/v3/files":
+            body = json.dumps({"files": [{"id": BENCH_FILE_ID, "mimeType": "image/jpeg"}]})
+            return self._send(200, body.encode("utf-8"), "application/json")
+        if path == f"/drive/v3/files/{BENCH_FILE_ID}":
+            return self._send(200, BENCH_IMAGE, "image/jpeg")
+        self._send(404, b"{}", "application/json")
+
+
+class _StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency_seconds, handshake_seconds):
+        super().__init__(("127.0.0.1", 0), _DriveStandIn)
+        self.latency_seconds = latency_seconds
+        self.handshake_seconds = handshake_seconds
+        self.stats_lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.stats = {"connections": 0, "token_requests": 0, "api_requests": 0}
+
+    def count(self, name):
+        with self.stats_lock:
+            self.stats[name] += 1
+
+
+def _private_key_pem():
+    try:
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        return key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        ).decode("ascii")
+    except ImportError:
+        import rsa
+
+        _, key = rsa.newkeys(2048)
+        return key.save_pkcs1().decode("ascii")
+
+
+def _write_service_account(path, base_url):
+    info = {
+        "type": "service_account",
+        "project_id": "bench",
+        "private_key_id": "bench",
+        "private_key": _private_key_pem(),
+        "client_email": "bench@bench.iam.gserviceaccount.com",
+        "client_id": "0",
+        "token_uri": f"{base_url}/token",
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(info, f)
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = "Compare per-call and pooled Drive sessions on cache misses against a local Drive stand-in"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--misses", type=int, default=200)
+        parser.add_argument("--latency-ms", type=float, default=5.0)
+        parser.add_argument("--handshake-ms", type=float, default=20.0)
+
+    def _run_mode(self, server, sa_file, misses, session_factory):
+        # Every iteration is a full miss: list the name, then download the file, each call
+        # taking its session from session_factory the way the image views do.
+        server.reset()
+        timings = []
+        started = time.perf_counter()
+        for _ in range(misses):
+            t0 = time.perf_counter()
+            ok, f = list_drive_file(session_factory(sa_file, DRIVE_READONLY_SCOPES), "bench-folder", "bench.jpg")
+            resp = download_drive_file(session_factory(sa_file, DRIVE_READONLY_SCOPES), f["id"]) if ok and f else None
+            timings.append((time.perf_counter() - t0) * 1000)
+            if resp is None or resp.content != BENCH_IMAGE:
+                raise RuntimeError("Drive stand-in returned unexpected content")
+        elapsed = time.perf_counter() - started
+        return {
+            "misses": misses,
+            "seconds": round(elapsed, 3),
+            "per_miss_ms_p50": round(_percentile(timings, 50), 2),
+            "per_miss_ms_p95": round(_percentile(timings, 95), 2),
+            "per_miss_ms_mean": round(sum(timings) / len(timings), 2),
+            **server.stats,
+        }
+
+    def handle(self, *args, **options):
+        misses = max(1, options["misses"])
+        server = _StandInServer(options["latency_ms"] / 1000.0, options["handshake_ms"] / 1000.0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        work_dir = tempfile.mkdtemp(prefix="drive-bench-")
+        sa_file = os.path.join(work_dir, "service-account.json")
+        original_base = getattr(settings, "DRIVE_API_BASE_URL", "https://www.googleapis.com")
+        try:
+            _write_service_account(sa_file, base_url)
+            settings.DRIVE_API_BASE_URL = base_url
+            results = {
+                "per_call": self._run_mode(server, sa_file, misses, build_drive_session),
+                "pooled": self._run_mode(server, sa_file, misses, get_drive_session),
+            }
+        finally:
+            settings.DRIVE_API_BASE_URL = original_base
+            close_drive_sessions()
+            server.shutdown()
+            server.server_close()
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        self.stdout.write(json.dumps(results, indent=2))
+        per_call, pooled = results["per_call"]["per_miss_ms_mean"], results["pooled"]["per_miss_ms_mean"]
+        self.stdout.write(self.style.SUCCESS(f"Pooled sessions: {pooled}ms vs {per_call}ms per miss"))
@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 
 from image_gateway.cleanup_log import COLLECTION
+from image_gateway.drive_index import COLLECTION as DRIVE_INDEX_COLLECTION
 from image_gateway.mongo import get_collection
 
 
@@ -11,4 +12,8 @@ class Command(BaseCommand):
         col = get_collection(COLLECTION)
         col.create_index([("timeCreate", -1)], name="idx_timeCreate_desc")
         col.create_index([("status", 1), ("timeCreate", -1)], name="idx_status_time")
+        drive_index = get_collection(DRIVE_INDEX_COLLECTION)
+        drive_index.create_index([("folder_id", 1), ("name", 1)], name="idx_folder_name", unique=True)
+        drive_index.create_index([("folder_id", 1), ("sync_token", 1)], name="idx_folder_sync_token")
+        drive_index.create_index([("folder_id", 1), ("file_id", 1)], name="idx_folder_file_id")
         self.stdout.write(self.style.SUCCESS("Indexes created"))
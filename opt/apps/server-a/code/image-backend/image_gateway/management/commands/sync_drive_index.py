@@ -0,0 +1,60 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from image_gateway.drive_index import refresh_drive_index, warm_drive_index
+
+
+class Command(BaseCommand):
+    help = "Warm the Drive filename -> file_id index and keep it current from the Drive changes feed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--folder", action="append", help="Drive folder id (default: GNH and GOOD image folders)")
+        parser.add_argument("--full", action="store_true", help="Start with a full listing instead of replaying the changes feed")
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=settings.DRIVE_INDEX_SYNC_INTERVAL_SECONDS,
+            help="Seconds between passes",
+        )
+        parser.add_argument("--once", action="store_true", help="Run a single pass and exit")
+        parser.add_argument(
+            "--full-every",
+            type=int,
+            default=settings.DRIVE_INDEX_FULL_SYNC_EVERY,
+            help="Re-list whole folders every N passes as a safety net (0 disables)",
+        )
+
+    def handle(self, *args, **options):
+        folders = options["folder"] or [
+            folder_id
+            for folder_id in (settings.GNH_IMAGES_DRIVE_FOLDER_ID, settings.GOOD_IMAGES_DRIVE_FOLDER_ID)
+            if folder_id
+        ]
+        sa_file = settings.GOOGLE_SERVICE_ACCOUNT_FILE
+        passes = 0
+        while True:
+            started = time.monotonic()
+            if passes == 0:
+                full = options["full"]
+            else:
+                full = options["full_every"] > 0 and passes % options["full_every"] == 0
+            for folder_id in dict.fromkeys(folders):
+                try:
+                    if full:
+                        result = warm_drive_index(folder_id, sa_file)
+                    else:
+                        result = refresh_drive_index(folder_id, sa_file)
+                except Exception as exc:
+                    self.stderr.write(f"Drive index sync failed for {folder_id}: {exc}")
+                    continue
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f"{result['mode']} sync of {folder_id}: {result['upserted']} upserted, {result['removed']} removed"
+                    )
+                )
+            passes += 1
+            if options["once"]:
+                return
+            time.sleep(max(0.0, options["interval"] - (time.monotonic() - started)))
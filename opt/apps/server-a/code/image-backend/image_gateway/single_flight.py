@@ -0,0 +1,101 @@
+import fcntl
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+_LOCKS_GUARD = threading.Lock()
+_LOCKS = {}
+
+
+class _Flight:
+    # Handle on the flock'd stripe file. A failed fill writes "<expiry> <key digest>" into
+    # it, so callers queued behind it (threads or other workers) return the failure too;
+    # other keys sharing the stripe ignore a marker that is not theirs.
+    def __init__(self, fd, digest):
+        self._fd = fd
+        self._digest = digest
+
+    def failed_recently(self):
+        try:
+            expiry, _, digest = os.pread(self._fd, 128, 0).decode("ascii").partition(" ")
+            return digest == self._digest and float(expiry or 0) > time.time()
+        except (OSError, ValueError):
+            return False
+
+    def mark_failed(self):
+        expiry = time.time() + getattr(settings, "IMAGE_MISS_FAILURE_SECONDS", 5)
+        value = f"{expiry} {self._digest}".encode("ascii")
+        try:
+            os.ftruncate(self._fd, 0)
+            os.pwrite(self._fd, value, 0)
+        except OSError:
+            pass
+
+
+def _key_digest(key):
+    return hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+
+
+def _lock_path(digest):
+    # Keys hash into a fixed set of stripe files, so the lock dir never grows past
+    # IMAGE_LOCK_STRIPES files; keys sharing a stripe just serialize across workers.
+    lock_dir = getattr(settings, "IMAGE_LOCK_DIR", "") or os.path.join(tempfile.gettempdir(), "image-locks")
+    os.makedirs(lock_dir, exist_ok=True)
+    stripes = max(1, getattr(settings, "IMAGE_LOCK_STRIPES", 1024))
+    return os.path.join(lock_dir, "stripe-%d.lock" % (int(digest[:16], 16) % stripes))
+
+
+@contextmanager
+def _file_lock(digest):
+    fd = os.open(_lock_path(digest), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            yield _Flight(fd, digest)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def single_flight(key):
+    # One filler per key: threads of this worker queue on a shared Lock, other gunicorn
+    # workers on a flock of the key's stripe file in IMAGE_LOCK_DIR (outside the cache
+    # dirs, so cache cleanup never removes a held lock). Callers re-check the cache once inside,
+    # and return early when flight.failed_recently().
+    with _LOCKS_GUARD:
+        entry = _LOCKS.get(key)
+        if entry is None:
+            entry = _LOCKS[key] = [threading.Lock(), 0]
+        entry[1] += 1
+    try:
+        with entry[0]:
+            with _file_lock(_key_digest(key)) as flight:
+                yield flight
+    finally:
+        with _LOCKS_GUARD:
+            entry[1] -= 1
+            if not entry[1]:
+                _LOCKS.pop(key, None)
+
+
+def write_atomic(path, content, mode=0o644):
+    # Readers either see the previous file or the complete new one, never a partial write.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
@@ -1,15 +1,17 @@
 import base64
 import os
+from urllib.parse import quote
 
 from django.conf import settings
-from django.http import HttpResponse
+from django.http import FileResponse, HttpResponse
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from .drive_upload import delete_drive_file_by_name, upload_bytes_to_drive
 from .health import HealthView
-from .image_store import fetch_cached_image
+from .http_cache import cache_control_for, image_validators, not_modified_response, set_cache_headers
+from .image_store import local_image_path, resolve_image_file
 from .s3_store import delete_s3_by_url, upload_bytes_to_s3
 
 
@@ -30,6 +32,35 @@ def _read_upload_content(request):
         return None, filename, mime_type
 
 
+def _accel_redirect_uri(path):
+    real_path = os.path.realpath(path)
+    for root, location in getattr(settings, "IMAGE_X_ACCEL_LOCATIONS", {}).items():
+        if real_path.startswith(root + os.sep):
+            rel_path = os.path.relpath(real_path, root).replace(os.sep, "/")
+            return f"{location}/{quote(rel_path)}"
+    return None
+
+
+def _image_response(request, source, path, content, mime, validators=None):
+    mime = mime or "application/octet-stream"
+    etag, last_modified = validators or image_validators(path, content, sidecar=source != "local")
+    cache_control = cache_control_for(source)
+    not_modified = not_modified_response(request, etag, last_modified, cache_control)
+    if not_modified is not None:
+        return not_modified
+    if path:
+        accel_uri = _accel_redirect_uri(path)
+        if accel_uri:
+            response = HttpResponse(content_type=mime)
+            response["X-Accel-Redirect"] = accel_uri
+        else:
+            # Streamed via wsgi.file_wrapper (sendfile under gunicorn), never read into the worker.
+            response = FileResponse(open(path, "rb"), content_type=mime)
+    else:
+        response = HttpResponse(content, content_type=mime)
+    return set_cache_headers(response, etag, last_modified, cache_control)
+
+
 class GnhImageView(APIView):
     authentication_classes = []
     permission_classes = []
@@ -41,7 +72,7 @@ class GnhImageView(APIView):
         try:
             width = request.GET.get("w")
             width = int(width) if width and str(width).isdigit() else None
-            content, mime = fetch_cached_image(
+            path, content, mime = resolve_image_file(
                 file_path,
                 source="drive",
                 folder_id=getattr(settings, "GNH_IMAGES_DRIVE_FOLDER_ID", ""),
@@ -50,8 +81,8 @@ class GnhImageView(APIView):
                 cache_max_bytes=getattr(settings, "GNH_IMAGE_CACHE_MAX_BYTES", 0),
                 cache_max_days=getattr(settings, "GNH_IMAGE_CACHE_MAX_DAYS", 0),
             )
-            if content:
-                return HttpResponse(content, content_type=mime or "application/octet-stream")
+            if path or content:
+                return _image_response(request, "drive", path, content, mime)
             if getattr(settings, "DEBUG", False):
                 return HttpResponse("Drive file not found", status=404)
             return HttpResponse(status=404)
@@ -71,8 +102,10 @@ class GoodImageView(APIView):
             width = request.GET.get("w")
             width = int(width) if width and str(width).isdigit() else None
             drive_prefix = "drive:"
+            validators = None
             if file_path.startswith(drive_prefix):
-                content, mime = fetch_cached_image(
+                source = "drive"
+                path, content, mime = resolve_image_file(
                     file_path[len(drive_prefix) :],
                     source="drive",
                     folder_id=getattr(settings, "GOOD_IMAGES_DRIVE_FOLDER_ID", ""),
@@ -82,7 +115,8 @@ class GoodImageView(APIView):
                     cache_max_days=getattr(settings, "GOOD_IMAGE_CACHE_MAX_DAYS", 0),
                 )
             elif file_path.startswith("http://") or file_path.startswith("https://"):
-                content, mime = fetch_cached_image(
+                source = "s3"
+                path, content, mime = resolve_image_file(
                     file_path,
                     source="s3",
                     cache_dir=getattr(settings, "GOOD_IMAGE_CACHE_DIR", ""),
@@ -92,10 +126,18 @@ class GoodImageView(APIView):
                     aws_bucket=getattr(settings, "AWS_BUCKET", ""),
                 )
             else:
-                content, mime = fetch_cached_image(file_path, source="local", width=width)
-
-            if content:
-                return HttpResponse(content, content_type=mime or "application/octet-stream")
+                source = "local"
+                abs_path = local_image_path(file_path)
+                if abs_path:
+                    # Validators come from the original's stat, so a 304 skips the read and resize.
+                    validators = image_validators(abs_path, None, width=width)
+                    not_modified = not_modified_response(request, *validators, cache_control_for(source))
+                    if not_modified is not None:
+                        return not_modified
+                path, content, mime = resolve_image_file(file_path, source=source, width=width)
+
+            if path or content:
+                return _image_response(request, source, path, content, mime, validators)
             if getattr(settings, "DEBUG", False):
                 return HttpResponse("Image not found", status=404)
             return HttpResponse(status=404)
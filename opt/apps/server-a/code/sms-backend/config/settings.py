@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -99,12 +100,45 @@ JWT_AUDIENCE = os.environ.get("JWT_AUDIENCE", "").strip()
 
 LEASE_SECONDS = int(os.environ.get("LEASE_SECONDS", "300"))
 AGENT_RATE_LIMIT_PER_MIN = int(os.environ.get("AGENT_RATE_LIMIT_PER_MIN", "10"))
+AGENT_HEARTBEAT_MAX_STALENESS_SECONDS = float(os.environ.get("AGENT_HEARTBEAT_MAX_STALENESS_SECONDS", "15"))
+AGENT_LONG_POLL_MAX_SECONDS = int(os.environ.get("AGENT_LONG_POLL_MAX_SECONDS", "25"))
+AGENT_LONG_POLL_RECHECK_SECONDS = float(os.environ.get("AGENT_LONG_POLL_RECHECK_SECONDS", "2"))
+AGENT_LONG_POLL_CHANGE_STREAM = os.environ.get("AGENT_LONG_POLL_CHANGE_STREAM", "0") in {"1", "true", "True"}
+# Long-polls park a gthread each; every thread beyond the reserved ones may park, so the
+# fleet-wide capacity is GUNICORN_WORKERS * AGENT_LONG_POLL_MAX_PARKED per container.
+GUNICORN_WORKERS = int(os.environ.get("GUNICORN_WORKERS", "2"))
+GUNICORN_THREADS = int(os.environ.get("GUNICORN_THREADS", "64"))
+AGENT_LONG_POLL_RESERVED_THREADS = int(os.environ.get("AGENT_LONG_POLL_RESERVED_THREADS", "8"))
+AGENT_LONG_POLL_MAX_PARKED = int(
+    os.environ.get("AGENT_LONG_POLL_MAX_PARKED", str(max(0, GUNICORN_THREADS - AGENT_LONG_POLL_RESERVED_THREADS)))
+)
+AGENT_ROUTING_FRESH_SECONDS = int(os.environ.get("AGENT_ROUTING_FRESH_SECONDS", "120"))
+AGENT_ROUTING_MIN_BATTERY = int(os.environ.get("AGENT_ROUTING_MIN_BATTERY", "15"))
+AGENT_WORK_STEAL_AFTER_SECONDS = int(os.environ.get("AGENT_WORK_STEAL_AFTER_SECONDS", "600"))
+AGENT_PACING_BURST_SECONDS = int(os.environ.get("AGENT_PACING_BURST_SECONDS", "120"))
+AGENT_PACING_WINDOW_SECONDS = int(os.environ.get("AGENT_PACING_WINDOW_SECONDS", "120"))
+AGENT_PACING_MIN_SAMPLE = int(os.environ.get("AGENT_PACING_MIN_SAMPLE", "5"))
+AGENT_LEASE_SAFETY_FACTOR = float(os.environ.get("AGENT_LEASE_SAFETY_FACTOR", "1.5"))
+AGENT_LEASE_MAX_SECONDS = int(os.environ.get("AGENT_LEASE_MAX_SECONDS", "1800"))
+SMS_MAX_ATTEMPTS = int(os.environ.get("SMS_MAX_ATTEMPTS", "3"))
+SMS_RETRY_BASE_SECONDS = int(os.environ.get("SMS_RETRY_BASE_SECONDS", "60"))
+SMS_RETRY_MAX_DELAY_SECONDS = int(os.environ.get("SMS_RETRY_MAX_DELAY_SECONDS", "3600"))
+SMS_RETRY_LOOKBACK_HOURS = int(os.environ.get("SMS_RETRY_LOOKBACK_HOURS", "24"))
+SMS_SCHEDULER_INTERVAL_SECONDS = float(os.environ.get("SMS_SCHEDULER_INTERVAL_SECONDS", "15"))
+SMS_SCHEDULER_BATCH_SIZE = int(os.environ.get("SMS_SCHEDULER_BATCH_SIZE", "1000"))
+SMS_ARCHIVE_AFTER_DAYS = int(os.environ.get("SMS_ARCHIVE_AFTER_DAYS", "90"))
+SMS_ARCHIVE_EXPORT_DIR = os.environ.get("SMS_ARCHIVE_EXPORT_DIR", "")
 APIKEY_RATE_LIMIT_PER_DAY_DEFAULT = int(os.environ.get("APIKEY_RATE_LIMIT_PER_DAY_DEFAULT", "20000"))
 DEFAULT_COUNTRY_PREFIX = os.environ.get("DEFAULT_COUNTRY_PREFIX", "+84")
 BLOCK_INTERNATIONAL = os.environ.get("BLOCK_INTERNATIONAL", "1") in {"1", "true", "True"}
 ANTI_DUP_MINUTES = int(os.environ.get("ANTI_DUP_MINUTES", "3"))
 MAX_RECIPIENTS_PER_REQUEST = int(os.environ.get("MAX_RECIPIENTS_PER_REQUEST", "5000"))
 MAX_TEXT_LENGTH = int(os.environ.get("MAX_TEXT_LENGTH", "1600"))
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "5000"))
+EXPORT_CHUNK_BYTES = int(os.environ.get("EXPORT_CHUNK_BYTES", "65536"))
+CAMPAIGN_CHUNK_SIZE = int(os.environ.get("CAMPAIGN_CHUNK_SIZE", "1000"))
+CAMPAIGN_INGEST_STALE_SECONDS = int(os.environ.get("CAMPAIGN_INGEST_STALE_SECONDS", "300"))
+CAMPAIGN_SPOOL_DIR = os.environ.get("CAMPAIGN_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "sms_campaigns"))
 
 SEED_ADMIN = os.environ.get("SEED_ADMIN", "0") in {"1", "true", "True"}
 SEED_ADMIN_USERNAME = os.environ.get("SEED_ADMIN_USERNAME", "admin")
@@ -112,6 +146,17 @@ SEED_ADMIN_PASSWORD = os.environ.get("SEED_ADMIN_PASSWORD", "admin123")
 
 AGENT_REGISTRATION_SECRET = os.environ.get("AGENT_REGISTRATION_SECRET", "")
 
+AUTH_CACHE_TTL_SECONDS = int(os.environ.get("AUTH_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_MAX_ENTRIES = int(os.environ.get("AUTH_CACHE_MAX_ENTRIES", "1024"))
+AUTH_CACHE_VERSION_CHECK_SECONDS = float(os.environ.get("AUTH_CACHE_VERSION_CHECK_SECONDS", "5"))
+
+AUDIT_LOG_SYNC = os.environ.get("AUDIT_LOG_SYNC", "0") in {"1", "true", "True"}
+AUDIT_LOG_BATCH_SIZE = int(os.environ.get("AUDIT_LOG_BATCH_SIZE", "500"))
+AUDIT_LOG_FLUSH_SECONDS = float(os.environ.get("AUDIT_LOG_FLUSH_SECONDS", "1"))
+AUDIT_LOG_MAX_QUEUE = int(os.environ.get("AUDIT_LOG_MAX_QUEUE", "50000"))
+AUDIT_LOG_TTL_DAYS = int(os.environ.get("AUDIT_LOG_TTL_DAYS", "0"))
+AUDIT_LOG_CAPPED_BYTES = int(os.environ.get("AUDIT_LOG_CAPPED_BYTES", "0"))
+
 USE_X_FORWARDED_HOST = os.environ.get("USE_X_FORWARDED_HOST", "false").lower() in {"1", "true"}
 proxy_header = os.environ.get("SECURE_PROXY_SSL_HEADER")
 if proxy_header:
@@ -0,0 +1,8 @@
+import os
+
+# Shared with config/settings.py: the long-poll cap is derived from the same thread count.
+bind = "0.0.0.0:8000"
+workers = int(os.environ.get("GUNICORN_WORKERS", "2"))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "64"))
+timeout = 60
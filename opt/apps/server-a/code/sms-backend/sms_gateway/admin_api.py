@@ -11,7 +11,9 @@ from rest_framework.views import APIView
 from .auth import JWTOnlyPermission
 from .config_store import get_registration_secret, set_registration_secret
 from .constants import ActorType, AuditAction
+from .heartbeat_buffer import heartbeat_buffer
 from .mongo import get_collection
+from .principal_cache import invalidate_cached_principals, principal_cache
 from .utils import generate_token, now_utc, sha256_hex, write_audit_log
 
 
@@ -94,7 +96,9 @@ class AgentListView(APIView):
             query["is_active"] = False
 
         docs = list(get_collection("agents").find(query).sort("created_at", -1))
-        return Response({"items": [serialize_agent(doc) for doc in docs], "count": len(docs)})
+        return Response(
+            {"items": [serialize_agent(heartbeat_buffer.overlay(doc)) for doc in docs], "count": len(docs)}
+        )
 
 
 class AgentUnregisterView(APIView):
@@ -126,6 +130,7 @@ class AgentUnregisterView(APIView):
         )
         if not doc:
             return Response({"detail": "Agent not found"}, status=status.HTTP_404_NOT_FOUND)
+        invalidate_cached_principals()
 
         write_audit_log(
             ActorType.USER,
@@ -146,6 +151,7 @@ class ApiKeyDisableView(APIView):
         )
         if not doc:
             return Response({"detail": "API key not found"}, status=status.HTTP_404_NOT_FOUND)
+        invalidate_cached_principals()
         write_audit_log(ActorType.USER, request.user.user_id, AuditAction.DISABLE_API_KEY, {"api_key_id": key_id})
         return Response({"status": "ok"})
 
@@ -192,3 +198,11 @@ class AgentRegistrationSecretView(APIView):
                 "configured": bool(updated),
             }
         )
+
+
+class MetricsView(APIView):
+    permission_classes = [JWTOnlyPermission]
+
+    def get(self, request):
+        # Counters are per worker process; repeat the call to sample other workers.
+        return Response({"auth_cache": principal_cache.stats()})
@@ -1,20 +1,27 @@
 from __future__ import annotations
 
-from datetime import timedelta
+import math
+import time
 from typing import Any, Dict, List, Set
 
 from bson import ObjectId
 from django.conf import settings
-from pymongo import ReturnDocument
+from pymongo import UpdateOne
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from .auth import AgentOnlyPermission, AgentTokenAuthentication
 from .config_store import get_registration_secret
-from .constants import ActorType, AuditAction, MessageStatus
+from .constants import ActorType, AuditAction, MessageStatus, ReportResultCode
+from .heartbeat_buffer import heartbeat_buffer
+from .job_notifier import acquire_parking_slot, current_version, release_parking_slot, wait_for_jobs
+from .leasing import has_leasable_messages, lease_batch
 from .mongo import get_collection
-from .utils import ensure_uuid, generate_token, now_utc, sha256_hex, write_audit_log
+from .pacing import LeaseGrant, acquire_lease_tokens, record_sends, release_lease_tokens
+from .principal_cache import invalidate_cached_principals
+from .status_counts import apply_status_deltas, new_status_deltas, record_transition
+from .utils import ensure_uuid, generate_token, now_utc, parse_int, sha256_hex, write_audit_log
 
 VALID_MESSAGE_STATUSES: Set[str] = {status.value for status in MessageStatus}
 STATUS_TRANSITIONS: Dict[str, Set[str]] = {
@@ -24,6 +31,9 @@ STATUS_TRANSITIONS: Dict[str, Set[str]] = {
     MessageStatus.SENT.value: {MessageStatus.DELIVERED.value},
 }
 
+# Results that mean the phone actually tried to send; they feed the observed send rate.
+ATTEMPTED_STATUSES: Set[str] = {MessageStatus.SENT.value, MessageStatus.FAILED.value, MessageStatus.DELIVERED.value}
+
 
 def agent_doc(agent_id: str) -> Dict[str, Any]:
     return get_collection("agents").find_one({"_id": ObjectId(agent_id)})
@@ -85,6 +95,7 @@ class AgentRegisterView(APIView):
                     {"_id": existing["_id"]},
                     {"$set": update_fields},
                 )
+                invalidate_cached_principals()
                 return Response(
                     {"status": "rotated", "agent_id": str(existing["_id"]), "agent_token": plain_token},
                     status=status.HTTP_200_OK,
@@ -126,7 +137,7 @@ class AgentHeartbeatView(APIView):
             "app_version": payload.get("app_version"),
             "updated_at": now,
         }
-        get_collection("agents").update_one({"_id": ObjectId(request.user.agent_id)}, {"$set": update})
+        heartbeat_buffer.record(request.user.agent_id, update)
         return Response({"status": "ok"})
 
 
@@ -135,56 +146,50 @@ class AgentJobsNextView(APIView):
 
     def get(self, request):
         limit = min(int(request.query_params.get("limit", 50)), 200)
-        now = now_utc()
-        lease_seconds = settings.LEASE_SECONDS
-        lease_until = now + timedelta(seconds=lease_seconds)
-        collection = get_collection("sms_messages")
-        current_agent_id = request.user.agent_id
-        messages: List[Dict[str, Any]] = []
-        for _ in range(limit):
-            doc = collection.find_one_and_update(
-                {
-                    "$or": [
-                        {
-                            "agent_id": current_agent_id,
-                            "status": MessageStatus.PENDING.value,
-                            "$or": [
-                                {"schedule_at": None},
-                                {"schedule_at": {"$exists": False}},
-                                {"schedule_at": {"$lte": now}},
-                            ],
-                        },
-                        {
-                            "agent_id": current_agent_id,
-                            "status": {"$in": [MessageStatus.ASSIGNED.value, MessageStatus.SENDING.value]},
-                            "lease_until": {"$lte": now},
-                        },
-                    ]
-                },
-                {
-                    "$set": {
-                        "status": MessageStatus.ASSIGNED.value,
-                        "agent_id": current_agent_id,
-                        "lease_until": lease_until,
-                        "updated_at": now,
-                    },
-                    "$inc": {"attempts": 1},
-                },
-                sort=[("priority_weight", 1), ("created_at", 1)],
-                return_document=ReturnDocument.AFTER,
-            )
-            if not doc:
-                break
-            messages.append(
-                {
-                    "message_id": doc.get("message_id"),
-                    "request_id": doc.get("request_id"),
-                    "to": doc.get("to"),
-                    "text": doc.get("text"),
-                    "priority": doc.get("priority"),
-                    "schedule_at": doc.get("schedule_at").isoformat() if doc.get("schedule_at") else None,
-                }
-            )
+        wait_seconds = min(max(parse_int(request.query_params.get("wait"), 0), 0), settings.AGENT_LONG_POLL_MAX_SECONDS)
+        agent_id = request.user.agent_id
+        rate_per_min = request.user.rate_limit_per_min
+        parked = wait_seconds > 0 and acquire_parking_slot()
+        deadline = time.monotonic() + (wait_seconds if parked else 0)
+        grant = LeaseGrant(0, settings.LEASE_SECONDS, 0)
+        leased: List[Dict[str, Any]] = []
+        try:
+            while True:
+                version = current_version(agent_id)
+                # Tokens are only taken when there is something to lease, so an empty
+                # poll does not pay an acquire and a release write on agent_pacing.
+                if has_leasable_messages(agent_id, now_utc()):
+                    # The token bucket caps leasing at the agent's send rate, so a full
+                    # batch is never handed to a phone that cannot send it before expiry.
+                    grant = acquire_lease_tokens(agent_id, rate_per_min, limit, now_utc())
+                    leased = lease_batch(agent_id, grant.count, grant.lease_seconds, now_utc()) if grant.count else []
+                    release_lease_tokens(agent_id, grant.count - len(leased), rate_per_min)
+                    if not grant.count:
+                        break
+                remaining = deadline - time.monotonic()
+                if leased or remaining <= 0:
+                    break
+                # Park until this worker is notified about new work for the agent; the
+                # recheck cap covers messages enqueued through other workers.
+                wait_for_jobs(agent_id, version, min(remaining, settings.AGENT_LONG_POLL_RECHECK_SECONDS))
+        finally:
+            if parked:
+                release_parking_slot()
+        retry_after_seconds = grant.retry_after_seconds
+        if wait_seconds > 0 and not parked and not leased:
+            # No free long-poll slot: answer at once but keep the phone from re-polling in a tight loop.
+            retry_after_seconds = max(retry_after_seconds, math.ceil(settings.AGENT_LONG_POLL_RECHECK_SECONDS))
+        messages: List[Dict[str, Any]] = [
+            {
+                "message_id": doc.get("message_id"),
+                "request_id": doc.get("request_id"),
+                "to": doc.get("to"),
+                "text": doc.get("text"),
+                "priority": doc.get("priority"),
+                "schedule_at": doc.get("schedule_at").isoformat() if doc.get("schedule_at") else None,
+            }
+            for doc in leased
+        ]
 
         if messages:
             write_audit_log(
@@ -197,8 +202,10 @@ class AgentJobsNextView(APIView):
         return Response(
             {
                 "batch_id": ensure_uuid(),
-                "lease_seconds": lease_seconds,
-                "rate_limit_per_min": request.user.rate_limit_per_min,
+                "lease_seconds": grant.lease_seconds,
+                "rate_limit_per_min": rate_per_min,
+                "retry_after_seconds": retry_after_seconds,
+                "long_poll": bool(parked),
                 "messages": messages,
             }
         )
@@ -214,41 +221,128 @@ class AgentReportView(APIView):
             return Response({"detail": "messages required"}, status=status.HTTP_400_BAD_REQUEST)
         collection = get_collection("sms_messages")
         now = now_utc()
-        updated = 0
+        agent_id = request.user.agent_id
+        report_token = ensure_uuid()
 
+        message_ids = list({item.get("message_id") for item in results if item.get("message_id")})
+        current_docs = {
+            doc["message_id"]: doc
+            for doc in collection.find(
+                {"message_id": {"$in": message_ids}},
+                {
+                    "_id": 1,
+                    "message_id": 1,
+                    "request_id": 1,
+                    "status": 1,
+                    "agent_id": 1,
+                    "template_id": 1,
+                    "api_key_id": 1,
+                    "created_at": 1,
+                },
+            )
+        }
+
+        codes: Dict[str, str] = {}
+        staged: Dict[str, Dict[str, Any]] = {}
         for item in results:
             message_id = item.get("message_id")
             new_status = item.get("status")
-            if not message_id or new_status not in VALID_MESSAGE_STATUSES:
-                continue
-            doc = collection.find_one({"message_id": message_id})
-            if not doc or doc.get("agent_id") not in {None, request.user.agent_id}:
-                continue
-            current_status = doc.get("status")
-            if current_status == MessageStatus.DELIVERED.value:
+            if not message_id:
                 continue
-            if new_status not in STATUS_TRANSITIONS.get(current_status, set()):
+            doc = current_docs.get(message_id)
+            # Several results for one message in a single report chain in memory
+            # (e.g. SENT then DELIVERED) and are written as one guarded update; a
+            # rejected follow-up does not cancel an already staged change.
+            current_status = staged[message_id]["status"] if message_id in staged else (doc or {}).get("status")
+            if new_status not in VALID_MESSAGE_STATUSES:
+                rejection = ReportResultCode.INVALID
+            elif not doc:
+                rejection = ReportResultCode.NOT_FOUND
+            elif doc.get("agent_id") not in {None, agent_id}:
+                rejection = ReportResultCode.NOT_OWNER
+            elif new_status not in STATUS_TRANSITIONS.get(current_status, set()):
+                rejection = ReportResultCode.INVALID_TRANSITION
+            else:
+                rejection = None
+            if rejection is not None:
+                if message_id not in staged:
+                    codes[message_id] = rejection.value
                 continue
 
-            update: Dict[str, Any] = {
-                "status": new_status,
-                "updated_at": now,
-                "agent_id": request.user.agent_id,
-                "last_error": item.get("last_error"),
-            }
+            update = staged.setdefault(message_id, {})
+            update.update(
+                {
+                    "status": new_status,
+                    "updated_at": now,
+                    "agent_id": agent_id,
+                    "last_error": item.get("last_error"),
+                    "report_token": report_token,
+                }
+            )
             if new_status in {MessageStatus.SENT.value, MessageStatus.FAILED.value, MessageStatus.DELIVERED.value}:
                 update["lease_until"] = None
             if new_status == MessageStatus.SENT.value:
                 update["sent_at"] = now
             if new_status == MessageStatus.DELIVERED.value:
                 update["delivered_at"] = now
-            collection.update_one({"_id": doc["_id"]}, {"$set": update})
-            updated += 1
+            codes[message_id] = ReportResultCode.ACCEPTED.value
+
+        updated = 0
+        if staged:
+            operations = [
+                UpdateOne(
+                    {
+                        "_id": current_docs[message_id]["_id"],
+                        "status": current_docs[message_id].get("status"),
+                        "agent_id": {"$in": [None, agent_id]},
+                    },
+                    {"$set": update},
+                )
+                for message_id, update in staged.items()
+            ]
+            result = collection.bulk_write(operations, ordered=False)
+            updated = result.modified_count
+            if result.matched_count < len(operations):
+                # A concurrent report or lease changed some messages after our read, so
+                # their status guards did not match. Only messages carrying this report's
+                # token were written by us; a copy of the same result that won the race
+                # is a DUPLICATE and is not booked twice, anything else is a CONFLICT.
+                latest = {
+                    doc["message_id"]: doc
+                    for doc in collection.find(
+                        {"message_id": {"$in": list(staged)}},
+                        {"message_id": 1, "status": 1, "report_token": 1},
+                    )
+                }
+                for message_id, update in staged.items():
+                    doc = latest.get(message_id) or {}
+                    if doc.get("report_token") == report_token:
+                        continue
+                    if doc.get("status") == update["status"]:
+                        codes[message_id] = ReportResultCode.DUPLICATE.value
+                    else:
+                        codes[message_id] = ReportResultCode.CONFLICT.value
+
+            deltas = new_status_deltas()
+            attempted = 0
+            for message_id, update in staged.items():
+                if codes[message_id] == ReportResultCode.ACCEPTED.value:
+                    doc = current_docs[message_id]
+                    record_transition(deltas, doc, doc.get("status"), update["status"])
+                    if update["status"] in ATTEMPTED_STATUSES and doc.get("status") not in ATTEMPTED_STATUSES:
+                        attempted += 1
+            apply_status_deltas(deltas)
+            record_sends(agent_id, attempted, now)
 
         write_audit_log(
             ActorType.AGENT,
-            request.user.agent_id,
+            agent_id,
             AuditAction.AGENT_REPORT_RESULTS,
-            {"updated": updated, "agent_id": request.user.agent_id},
+            {"updated": updated, "agent_id": agent_id},
+        )
+        return Response(
+            {
+                "updated": updated,
+                "results": [{"message_id": message_id, "code": code} for message_id, code in codes.items()],
+            }
         )
-        return Response({"updated": updated})
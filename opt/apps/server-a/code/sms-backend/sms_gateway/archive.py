@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import gzip
+import heapq
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from bson import json_util
+from pymongo.errors import BulkWriteError
+
+from .config_store import advance_archive_watermark, get_archive_watermark
+from .constants import MessageStatus
+from .mongo import get_collection
+from .utils import now_utc
+
+ARCHIVE_COLLECTION = "sms_messages_archive"
+ARCHIVED_STATUSES = [MessageStatus.DELIVERED.value, MessageStatus.FAILED.value, MessageStatus.CANCELED.value]
+# Workers may keep serving an older watermark this long, so archive_messages waits it out.
+ARCHIVE_WATERMARK_CACHE_SECONDS = 30.0
+
+
+_watermark_lock = threading.Lock()
+_watermark_cache: Tuple[float, Optional[datetime]] = (0.0, None)
+
+
+def cached_archive_watermark() -> Optional[datetime]:
+    """``get_archive_watermark`` kept per worker for ``ARCHIVE_WATERMARK_CACHE_SECONDS``; listings call it on every page."""
+    global _watermark_cache
+    with _watermark_lock:
+        expires_at, cached = _watermark_cache
+        if time.monotonic() < expires_at:
+            return cached
+    watermark = get_archive_watermark()
+    with _watermark_lock:
+        _watermark_cache = (time.monotonic() + ARCHIVE_WATERMARK_CACHE_SECONDS, watermark)
+    return watermark
+
+
+def archive_may_match(query: Dict[str, Any]) -> bool:
+    """Whether ``sms_messages_archive`` can hold messages matching ``query``.
+
+    Only terminal messages created before the archive watermark are moved, so a status
+    filter on a live status, a ``created_at`` lower bound past the watermark, or a
+    ``request_id`` whose request was created after it skips the archive.
+    """
+    watermark = cached_archive_watermark()
+    if watermark is None:
+        return False
+    status = query.get("status")
+    if isinstance(status, str) and status not in ARCHIVED_STATUSES:
+        return False
+    created_at = query.get("created_at")
+    if isinstance(created_at, dict):
+        lower = created_at.get("$gte") or created_at.get("$gt")
+        if lower is not None and lower >= watermark:
+            return False
+    request_id = query.get("request_id")
+    if isinstance(request_id, str):
+        # Messages are never created before their request, so one indexed read can
+        # rule out the second query and merge for every recent request.
+        request_doc = get_collection("sms_requests").find_one({"request_id": request_id}, {"_id": 0, "created_at": 1})
+        if request_doc and request_doc.get("created_at") and request_doc["created_at"] >= watermark:
+            return False
+    return True
+
+
+def merge_sorted(sources: List[Iterable[Dict[str, Any]]], key_fields: List[str]) -> Iterator[Dict[str, Any]]:
+    """Lazily merge result streams that are each sorted ascending on ``key_fields``."""
+    if len(sources) == 1:
+        return iter(sources[0])
+    return heapq.merge(*sources, key=lambda doc: tuple(doc.get(field) for field in key_fields))
+
+
+def _export_batch(path: str, docs: List[Dict[str, Any]]) -> None:
+    with gzip.open(path, "at", encoding="utf-8") as handle:
+        for doc in docs:
+            handle.write(json_util.dumps(doc, json_options=json_util.RELAXED_JSON_OPTIONS))
+            handle.write("\n")
+
+
+def archive_messages(cutoff: datetime, batch_size: int = 1000, export_dir: Optional[str] = None) -> Dict[str, Any]:
+    """Move terminal messages created before ``cutoff`` into ``sms_messages_archive``.
+
+    Each batch is optionally appended to a gzip JSONL file first, then copied to the
+    archive and only then deleted from ``sms_messages``, so an interrupted run can simply
+    be repeated. The watermark is advanced up front so listings start merging at once.
+    """
+    hot = get_collection("sms_messages")
+    archive = get_collection(ARCHIVE_COLLECTION)
+    query = {"status": {"$in": ARCHIVED_STATUSES}, "created_at": {"$lt": cutoff}}
+    export_path = None
+    if export_dir:
+        os.makedirs(export_dir, exist_ok=True)
+        export_path = os.path.join(export_dir, f"sms_messages_before_{cutoff:%Y%m%d}_{now_utc():%Y%m%d%H%M%S}.jsonl.gz")
+
+    previous = get_archive_watermark()
+    advance_archive_watermark(cutoff)
+    if previous is None or previous < cutoff:
+        # Let every worker's cached watermark catch up before anything leaves sms_messages.
+        time.sleep(ARCHIVE_WATERMARK_CACHE_SECONDS)
+    moved = 0
+    while True:
+        docs = list(hot.find(query).limit(batch_size))
+        if not docs:
+            break
+        if export_path:
+            _export_batch(export_path, docs)
+        try:
+            archive.insert_many(docs, ordered=False)
+        except BulkWriteError as exc:
+            # Copies left behind by an interrupted run are fine; anything else is not.
+            if any(err.get("code") != 11000 for err in exc.details.get("writeErrors", [])):
+                raise
+        ids = [doc["_id"] for doc in docs]
+        result = hot.delete_many({"_id": {"$in": ids}, "status": {"$in": ARCHIVED_STATUSES}})
+        if result.deleted_count < len(ids):
+            # A message left its terminal state meanwhile (e.g. a retry); keep it hot only.
+            still_hot = [doc["_id"] for doc in hot.find({"_id": {"$in": ids}}, {"_id": 1})]
+            archive.delete_many({"_id": {"$in": still_hot}})
+        moved += result.deleted_count
+        if len(docs) < batch_size:
+            break
+    return {"moved": moved, "export_path": export_path if moved else None}
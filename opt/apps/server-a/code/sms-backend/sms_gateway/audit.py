@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import atexit
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from django.conf import settings
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError
+
+from .mongo import get_collection
+
+AUDIT_COLLECTION = "audit_logs"
+AUDIT_TTL_INDEX = "created_at_ttl_idx"
+
+
+class AuditSink:
+    """Buffers audit entries in memory and writes them with ``insert_many`` from a background thread.
+
+    A flush happens when ``AUDIT_LOG_BATCH_SIZE`` entries are queued or every
+    ``AUDIT_LOG_FLUSH_SECONDS``, and once more at worker exit. With
+    ``AUDIT_LOG_SYNC`` enabled every entry is inserted on the calling thread.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        # Bounded by AUDIT_LOG_MAX_QUEUE: while Mongo is unreachable the oldest entries
+        # fall off the left end instead of the queue growing without bound.
+        self._queue: Deque[Dict[str, Any]] = deque(maxlen=settings.AUDIT_LOG_MAX_QUEUE)
+        self._worker: Optional[threading.Thread] = None
+        self.dropped = 0
+
+    def submit(self, doc: Dict[str, Any]) -> None:
+        if settings.AUDIT_LOG_SYNC:
+            get_collection(AUDIT_COLLECTION).insert_one(doc)
+            return
+        with self._lock:
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1
+            self._queue.append(doc)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="sms-audit-writer", daemon=True)
+                self._worker.start()
+            if len(self._queue) >= settings.AUDIT_LOG_BATCH_SIZE:
+                self._wakeup.set()
+
+    def flush(self) -> int:
+        written = 0
+        while True:
+            with self._lock:
+                batch = [self._queue.popleft() for _ in range(min(len(self._queue), settings.AUDIT_LOG_BATCH_SIZE))]
+            if not batch:
+                return written
+            try:
+                get_collection(AUDIT_COLLECTION).insert_many(batch, ordered=False)
+            except BulkWriteError as exc:
+                # Entries already written by an earlier, interrupted attempt come back
+                # as duplicate keys; only retry the ones that genuinely failed.
+                retry = [batch[err["index"]] for err in exc.details.get("writeErrors", []) if err.get("code") != 11000]
+                self._requeue(retry)
+                written += len(batch) - len(retry)
+                if retry:
+                    return written
+                continue
+            except Exception:
+                self._requeue(batch)
+                raise
+            written += len(batch)
+
+    def _requeue(self, entries: List[Dict[str, Any]]) -> None:
+        """Put a failed batch back at the head of the queue, oldest first.
+
+        Entries submitted during the failed write may have filled the queue; ``extendleft``
+        on a full deque would push the newest entries off the right end, so the failed
+        batch (always older than anything queued) is trimmed from its own start instead.
+        """
+        with self._lock:
+            room = self._queue.maxlen - len(self._queue)
+            keep = entries[len(entries) - room :] if room < len(entries) else entries
+            self.dropped += len(entries) - len(keep)
+            self._queue.extendleft(reversed(keep))
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(settings.AUDIT_LOG_FLUSH_SECONDS)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                pass
+
+
+audit_sink = AuditSink()
+
+
+@atexit.register
+def _drain_audit_logs() -> None:
+    try:
+        audit_sink.flush()
+    except Exception:
+        pass
+
+
+def ensure_audit_collection() -> None:
+    """Apply the optional retention mode for ``audit_logs``.
+
+    ``AUDIT_LOG_CAPPED_BYTES`` makes it a capped collection (converting an existing one);
+    otherwise ``AUDIT_LOG_TTL_DAYS`` keeps a TTL index on ``created_at``. MongoDB does not
+    allow TTL indexes on capped collections, so the capped mode wins when both are set.
+    """
+    collection = get_collection(AUDIT_COLLECTION)
+    db = collection.database
+    capped_bytes = settings.AUDIT_LOG_CAPPED_BYTES
+    if capped_bytes > 0:
+        if AUDIT_COLLECTION not in db.list_collection_names():
+            db.create_collection(AUDIT_COLLECTION, capped=True, size=capped_bytes)
+        elif not collection.options().get("capped"):
+            db.command("convertToCapped", AUDIT_COLLECTION, size=capped_bytes)
+        return
+
+    existing = collection.index_information().get(AUDIT_TTL_INDEX)
+    ttl_seconds = settings.AUDIT_LOG_TTL_DAYS * 86400
+    if ttl_seconds <= 0:
+        if existing:
+            collection.drop_index(AUDIT_TTL_INDEX)
+    elif existing is None:
+        collection.create_index([("created_at", ASCENDING)], name=AUDIT_TTL_INDEX, expireAfterSeconds=ttl_seconds)
+    elif existing.get("expireAfterSeconds") != ttl_seconds:
+        db.command("collMod", AUDIT_COLLECTION, index={"name": AUDIT_TTL_INDEX, "expireAfterSeconds": ttl_seconds})
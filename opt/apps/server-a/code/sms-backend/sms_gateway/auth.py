@@ -8,6 +8,7 @@ from django.conf import settings
 from rest_framework import authentication, exceptions, permissions
 
 from .mongo import get_collection
+from .principal_cache import principal_cache
 from .utils import sha256_hex
 
 
@@ -57,9 +58,15 @@ class ApiKeyAuthentication(authentication.BaseAuthentication):
             return None
 
         key_hash = sha256_hex(api_key)
+        result = principal_cache.get_or_load(("api_key", key_hash), lambda: self._load(key_hash))
+        if result is None:
+            raise exceptions.AuthenticationFailed("Invalid API key")
+        return result
+
+    def _load(self, key_hash: str) -> Optional[Tuple[ApiKeyPrincipal, Dict[str, Any]]]:
         doc = get_collection("api_keys").find_one({"key_hash": key_hash})
         if not doc or not doc.get("is_active", True):
-            raise exceptions.AuthenticationFailed("Invalid API key")
+            return None
 
         principal = ApiKeyPrincipal(
             _id=str(doc.get("_id")),
@@ -86,16 +93,24 @@ class AgentTokenAuthentication(authentication.BaseAuthentication):
         if "." in token:
             return None
 
-        doc = get_collection("agents").find_one({"token_hash": sha256_hex(token), "is_active": True})
-        if not doc:
+        token_hash = sha256_hex(token)
+        result = principal_cache.get_or_load(("agent", token_hash), lambda: self._load(token_hash))
+        if result is None:
             raise exceptions.AuthenticationFailed("Invalid agent token")
+        principal, doc = result
+        return principal, {"type": "agent", "doc": doc, "token": token}
+
+    def _load(self, token_hash: str) -> Optional[Tuple[AgentPrincipal, Dict[str, Any]]]:
+        doc = get_collection("agents").find_one({"token_hash": token_hash, "is_active": True})
+        if not doc:
+            return None
 
         principal = AgentPrincipal(
             agent_id=str(doc.get("_id")),
             device_id=doc.get("device_id", ""),
             rate_limit_per_min=int(doc.get("rate_limit_per_min", settings.AGENT_RATE_LIMIT_PER_MIN)),
         )
-        return principal, {"type": "agent", "doc": doc, "token": token}
+        return principal, doc
 
 
 class JWTAuthentication(authentication.BaseAuthentication):
@@ -0,0 +1,369 @@
+"""Load-test scenarios for the SMS gateway.
+
+The scenarios call the real DRF views in-process through ``APIRequestFactory`` against a
+dedicated Mongo database, so they measure view, query and index cost without network or
+Gunicorn overhead. Run them with ``python manage.py benchmark_gateway``.
+"""
+from __future__ import annotations
+
+import itertools
+import math
+import re
+import threading
+import time
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from bson import ObjectId
+from django.conf import settings
+from pymongo import ReturnDocument
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from .agent_api import AgentJobsNextView, AgentReportView
+from .auth import AgentPrincipal, ApiKeyPrincipal, JWTUser
+from .constants import MessagePriority, MessageStatus
+from .leasing import lease_batch
+from .mongo import get_collection
+from .reports_api import ReportsExportView
+from .requests_api import SmsMessageAllListView, SmsMessageListView, SmsRequestCreateView, SmsRequestDetailView
+from .utils import PLACEHOLDER_PATTERN, compile_template, now_utc, render_compiled
+
+BENCH_TEMPLATE = "Xin chao {NAME}, ma don {ORDER} cua ban se duoc giao ngay {DATE}. Cam on ban da mua hang!"
+# Agents get an effectively unlimited send rate so pacing never throttles the measurement.
+BENCH_AGENT_RATE_PER_MIN = 1_000_000
+EXPORT_SEED_BATCH_SIZE = 5000
+
+factory = APIRequestFactory()
+_phone_numbers = itertools.count(900_000_000)
+_phone_lock = threading.Lock()
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of ``samples``."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def summarize(samples_ms: List[float], messages: int = 0, elapsed: float = 0.0) -> Dict[str, Any]:
+    result: Dict[str, Any] = {
+        "count": len(samples_ms),
+        "p50_ms": round(percentile(samples_ms, 50), 3),
+        "p95_ms": round(percentile(samples_ms, 95), 3),
+        "p99_ms": round(percentile(samples_ms, 99), 3),
+        "mean_ms": round(sum(samples_ms) / len(samples_ms), 3) if samples_ms else 0.0,
+    }
+    if messages:
+        result["messages"] = messages
+        result["messages_per_sec"] = round(messages / elapsed, 1) if elapsed else 0.0
+    return result
+
+
+def timed(call: Callable[[], Any], samples: List[float]) -> Any:
+    started = time.perf_counter()
+    result = call()
+    samples.append((time.perf_counter() - started) * 1000)
+    return result
+
+
+def next_phone() -> str:
+    with _phone_lock:
+        return f"0{next(_phone_numbers)}"
+
+
+class BenchFixture:
+    """Template, API key and agents seeded into the benchmark database."""
+
+    def __init__(self, phones: int) -> None:
+        now = now_utc()
+        template = get_collection("templates").insert_one(
+            {"name": "benchmark", "content": BENCH_TEMPLATE, "approved": True, "created_at": now, "updated_at": now}
+        )
+        self.template_id = str(template.inserted_id)
+        self.api_key = ApiKeyPrincipal(
+            _id=str(ObjectId()),
+            client_name="benchmark",
+            scopes=["sms:send", "sms:read"],
+            rate_limit_per_day=10**9,
+        )
+        self.admin = JWTUser(user_id="benchmark", username="benchmark", payload={})
+        self.agents: List[AgentPrincipal] = []
+        for index in range(phones):
+            agent = get_collection("agents").insert_one(
+                {
+                    "device_id": f"bench-{index}",
+                    "label": f"bench-{index}",
+                    "is_active": True,
+                    "rate_limit_per_min": BENCH_AGENT_RATE_PER_MIN,
+                    "battery_level": 100,
+                    "last_seen_at": now,
+                    "created_at": now,
+                    "updated_at": now,
+                }
+            )
+            self.agents.append(AgentPrincipal(str(agent.inserted_id), f"bench-{index}", BENCH_AGENT_RATE_PER_MIN))
+
+    def create_request(self, agent_id: str, size: int) -> Dict[str, Any]:
+        messages = [
+            {"to": next_phone(), "variables": {"NAME": f"Khach {i}", "ORDER": f"DH{i:06d}"}} for i in range(size)
+        ]
+        payload = {
+            "template_id": self.template_id,
+            "agent_id": agent_id,
+            "variables": {"DATE": "20/10"},
+            "messages": messages,
+        }
+        request = factory.post("/requests", payload, format="json")
+        force_authenticate(request, user=self.api_key)
+        response = SmsRequestCreateView.as_view()(request)
+        if response.status_code != 201:
+            raise RuntimeError(f"Request creation failed: {response.status_code} {response.data}")
+        return response.data
+
+
+def _get(view: Callable, path: str, user: Any, params: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Any:
+    request = factory.get(path, params or {})
+    force_authenticate(request, user=user)
+    response = view(request, **kwargs)
+    if response.status_code != 200:
+        raise RuntimeError(f"GET {path} failed: {response.status_code}")
+    return response
+
+
+def bench_request_create(fixture: BenchFixture, sizes: List[int], iterations: int) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    for size in sizes:
+        samples: List[float] = []
+        started = time.perf_counter()
+        for _ in range(iterations):
+            timed(lambda: fixture.create_request(fixture.agents[0].agent_id, size), samples)
+        results[f"recipients_{size}"] = summarize(samples, size * iterations, time.perf_counter() - started)
+    return results
+
+
+def bench_lease_report(fixture: BenchFixture, messages_per_phone: int, limit: int) -> Dict[str, Any]:
+    """Every simulated phone leases and reports ``SENT`` until its queue is drained, concurrently."""
+    for agent in fixture.agents:
+        remaining = messages_per_phone
+        while remaining > 0:
+            chunk = min(remaining, settings.MAX_RECIPIENTS_PER_REQUEST, 1000)
+            fixture.create_request(agent.agent_id, chunk)
+            remaining -= chunk
+
+    lease_samples: List[float] = []
+    report_samples: List[float] = []
+    sent = [0]
+    lock = threading.Lock()
+    jobs_view = AgentJobsNextView.as_view()
+    report_view = AgentReportView.as_view()
+
+    def phone(agent: AgentPrincipal) -> None:
+        local_lease: List[float] = []
+        local_report: List[float] = []
+        local_sent = 0
+        while True:
+            response = timed(lambda: _get(jobs_view, "/agent/jobs/next", agent, {"limit": limit}), local_lease)
+            leased = response.data["messages"]
+            if not leased:
+                break
+            payload = {"messages": [{"message_id": item["message_id"], "status": "SENT"} for item in leased]}
+            request = factory.post("/agent/messages/report", payload, format="json")
+            force_authenticate(request, user=agent)
+            timed(lambda: report_view(request), local_report)
+            local_sent += len(leased)
+        with lock:
+            lease_samples.extend(local_lease)
+            report_samples.extend(local_report)
+            sent[0] += local_sent
+
+    threads = [threading.Thread(target=phone, args=(agent,)) for agent in fixture.agents]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {
+        "phones": len(fixture.agents),
+        "lease": summarize(lease_samples),
+        "report": summarize(report_samples),
+        "end_to_end": summarize(lease_samples + report_samples, sent[0], elapsed),
+    }
+
+
+def bench_read_endpoints(fixture: BenchFixture, request_id: str, iterations: int) -> Dict[str, Any]:
+    detail, listing, walk = [], [], []
+    walked = [0]
+    detail_view = SmsRequestDetailView.as_view()
+    list_view = SmsMessageListView.as_view()
+    all_view = SmsMessageAllListView.as_view()
+    for _ in range(iterations):
+        timed(lambda: _get(detail_view, f"/requests/{request_id}", fixture.api_key, request_id=request_id), detail)
+        timed(lambda: _get(list_view, "/messages", fixture.api_key, {"request_id": request_id, "limit": 100}), listing)
+
+    def walk_all() -> None:
+        params: Dict[str, Any] = {"limit": 500}
+        while True:
+            data = _get(all_view, "/messages/all", fixture.admin, params).data
+            walked[0] += data["count"]
+            if not data["next_cursor"]:
+                return
+            params["cursor"] = data["next_cursor"]
+
+    started = time.perf_counter()
+    timed(walk_all, walk)
+    return {
+        "request_detail": summarize(detail),
+        "messages_list": summarize(listing),
+        "messages_all_cursor_walk": summarize(walk, walked[0], time.perf_counter() - started),
+    }
+
+
+def seed_export_rows(fixture: BenchFixture, rows: int, batch_size: int = EXPORT_SEED_BATCH_SIZE) -> int:
+    """Bulk-insert ``rows`` terminal messages spread over the last 30 days, ``batch_size`` per ``insert_many``.
+
+    Going through the create view would take far longer than the export being measured,
+    so the documents are written directly in the shape ``build_message_doc`` produces.
+    """
+    collection = get_collection("sms_messages")
+    now = now_utc()
+    request_id = str(ObjectId())
+    statuses = [MessageStatus.DELIVERED.value, MessageStatus.SENT.value, MessageStatus.FAILED.value]
+    seeded = 0
+    while seeded < rows:
+        docs = []
+        for index in range(seeded, min(rows, seeded + batch_size)):
+            created_at = now - timedelta(seconds=(rows - index) * 30 * 86400 / rows)
+            docs.append(
+                {
+                    "message_id": f"bench-export-{index}",
+                    "request_id": request_id,
+                    "api_key_id": fixture.api_key._id,
+                    "client_name": fixture.api_key.client_name,
+                    "template_id": fixture.template_id,
+                    "to": next_phone(),
+                    "text": BENCH_TEMPLATE,
+                    "status": statuses[index % len(statuses)],
+                    "priority": MessagePriority.NORMAL.value,
+                    "priority_weight": 1,
+                    "agent_id": fixture.agents[index % len(fixture.agents)].agent_id,
+                    "attempts": 1,
+                    "available_at": created_at,
+                    "created_at": created_at,
+                    "updated_at": created_at,
+                }
+            )
+        collection.insert_many(docs, ordered=False)
+        seeded += len(docs)
+    return seeded
+
+
+def bench_export(fixture: BenchFixture, iterations: int) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    view = ReportsExportView.as_view()
+    for label, headers in (("plain", {}), ("gzip", {"HTTP_ACCEPT_ENCODING": "gzip"})):
+        samples: List[float] = []
+        rows = 0
+        size = 0
+        started = time.perf_counter()
+        for _ in range(iterations):
+
+            def export() -> None:
+                nonlocal rows, size
+                request = factory.get("/reports/export.csv", **headers)
+                force_authenticate(request, user=fixture.admin)
+                body = b"".join(view(request).streaming_content)
+                size = len(body)
+                if label == "plain":
+                    rows += body.count(b"\n") - 1
+
+            timed(export, samples)
+        results[label] = {**summarize(samples, rows, time.perf_counter() - started), "bytes": size}
+    return results
+
+
+def _legacy_lease(agent_id: str, limit: int, lease_seconds: int) -> int:
+    """The original lease loop: one ``find_one_and_update`` round trip per message."""
+    now = now_utc()
+    collection = get_collection("sms_messages")
+    leased = 0
+    for _ in range(limit):
+        doc = collection.find_one_and_update(
+            {
+                "$or": [
+                    {
+                        "agent_id": agent_id,
+                        "status": MessageStatus.PENDING.value,
+                        "$or": [
+                            {"schedule_at": None},
+                            {"schedule_at": {"$exists": False}},
+                            {"schedule_at": {"$lte": now}},
+                        ],
+                    },
+                    {
+                        "agent_id": agent_id,
+                        "status": {"$in": [MessageStatus.ASSIGNED.value, MessageStatus.SENDING.value]},
+                        "lease_until": {"$lte": now},
+                    },
+                ]
+            },
+            {
+                "$set": {
+                    "status": MessageStatus.ASSIGNED.value,
+                    "agent_id": agent_id,
+                    "lease_until": now + timedelta(seconds=lease_seconds),
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("priority_weight", 1), ("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+        if not doc:
+            break
+        leased += 1
+    return leased
+
+
+def bench_lease_strategies(fixture: BenchFixture, limit: int, iterations: int) -> Dict[str, Any]:
+    """Compare the legacy per-message lease loop with ``lease_batch`` on the same ``limit``-sized backlog."""
+    agent_id = fixture.agents[0].agent_id
+    fixture.create_request(agent_id, limit)
+    collection = get_collection("sms_messages")
+    reset = {
+        "$set": {"status": MessageStatus.PENDING.value, "lease_until": None, "lease_token": None},
+    }
+    strategies = {
+        "legacy_find_one_and_update": lambda: _legacy_lease(agent_id, limit, settings.LEASE_SECONDS),
+        "lease_batch": lambda: len(lease_batch(agent_id, limit, settings.LEASE_SECONDS, now_utc())),
+    }
+    results: Dict[str, Any] = {}
+    for name, lease in strategies.items():
+        samples: List[float] = []
+        for _ in range(iterations):
+            collection.update_many({"agent_id": agent_id, "status": MessageStatus.ASSIGNED.value}, reset)
+            timed(lease, samples)
+        results[name] = summarize(samples)
+    collection.update_many({"agent_id": agent_id, "status": MessageStatus.ASSIGNED.value}, reset)
+    return {"limit": limit, **results}
+
+
+def bench_render(renders: int) -> Dict[str, Any]:
+    variables = {"NAME": "Nguyen Van A", "ORDER": "DH000123", "DATE": "20/10"}
+
+    def regex_render() -> None:
+        def replace(match: re.Match[str]) -> str:
+            return str(variables[match.group(1)])
+
+        PLACEHOLDER_PATTERN.sub(replace, BENCH_TEMPLATE)
+
+    compiled = compile_template(BENCH_TEMPLATE)
+    results: Dict[str, Any] = {"renders": renders}
+    for name, render in (("regex_sub", regex_render), ("compiled", lambda: render_compiled(compiled, variables))):
+        started = time.perf_counter()
+        for _ in range(renders):
+            render()
+        elapsed = time.perf_counter() - started
+        results[name] = {"total_ms": round(elapsed * 1000, 3), "renders_per_sec": round(renders / elapsed, 1)}
+    return results
@@ -0,0 +1,457 @@
+from __future__ import annotations
+
+import csv
+import json
+import os
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from pymongo import ReturnDocument
+from rest_framework import status
+from rest_framework.parsers import MultiPartParser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .auth import ApiKeyPrincipal, ApiKeySendPermission
+from .constants import ActorType, AuditAction, IngestStatus, MessageStatus
+from .job_notifier import notify_agent
+from .mongo import get_collection
+from .requests_api import load_send_targets, mark_duplicates, prepare_message, resolve_priority
+from .routing import AUTO_AGENT_ID, load_routable_agents, route_messages
+from .status_counts import apply_status_deltas, new_status_deltas, record_created
+from .template_cache import get_compiled_template
+from .usage import release_daily_quota, reserve_daily_quota
+from .utils import CompiledTemplate, chunked, ensure_uuid, now_utc, write_audit_log
+
+CAMPAIGN_FORMATS = {"csv", "ndjson"}
+CSV_RESERVED_COLUMNS = {"to", "schedule_at", "priority"}
+MAX_INGEST_ERRORS = 50
+# Rows of the chunk that was in flight when an ingest died are re-read with these fields.
+RESUME_PROJECTION = {"_id": 0, "ingest_row": 1, "status": 1, "last_error": 1, "agent_id": 1}
+
+
+class IngestClaimLost(Exception):
+    """Another process took over the ingest after this one's heartbeat went stale."""
+
+
+@dataclass
+class CampaignJob:
+    request_id: str
+    spool_path: str
+    file_format: str
+    principal: ApiKeyPrincipal
+    template_id: str
+    compiled_template: CompiledTemplate
+    agent_id: str
+    default_vars: Dict[str, Any]
+    default_priority: str
+    metadata: Any
+    created_at: datetime
+    day_bucket: str
+    owner: str
+    # Last row committed before a takeover; ``None`` for a fresh upload.
+    resume_after: Optional[int] = None
+
+
+def detect_format(explicit: Optional[str], filename: str) -> Optional[str]:
+    if explicit:
+        value = explicit.lower()
+        return value if value in CAMPAIGN_FORMATS else None
+    lowered = filename.lower()
+    if lowered.endswith(".csv"):
+        return "csv"
+    if lowered.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    return None
+
+
+def iter_campaign_rows(path: str, file_format: str) -> Iterator[Tuple[int, Optional[Dict[str, Any]]]]:
+    """Yield ``(row_number, message)`` one row at a time; ``message`` is ``None`` when the row cannot be parsed.
+
+    CSV files need a ``to`` column; every other non-reserved column becomes a template variable.
+    NDJSON lines use the same shape as an item of ``messages`` in ``POST /requests``.
+    """
+    with open(path, encoding="utf-8-sig", newline="") as handle:
+        if file_format == "csv":
+            for row_number, row in enumerate(csv.DictReader(handle), start=2):
+                yield row_number, {
+                    "to": row.get("to") or "",
+                    "schedule_at": row.get("schedule_at") or None,
+                    "priority": row.get("priority") or None,
+                    "variables": {
+                        key: value
+                        for key, value in row.items()
+                        if key and key not in CSV_RESERVED_COLUMNS and value not in (None, "")
+                    },
+                }
+            return
+        for row_number, line in enumerate(handle, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                yield row_number, None
+                continue
+            yield row_number, item if isinstance(item, dict) else None
+
+
+def _fail_ingest(job: CampaignJob, error: str) -> None:
+    _fail_ingest_request(job.request_id, error)
+
+
+def _fail_ingest_request(request_id: str, error: str) -> None:
+    get_collection("sms_requests").update_one(
+        {"request_id": request_id},
+        {
+            "$set": {
+                "ingest_status": IngestStatus.FAILED.value,
+                "ingest_error": error,
+                "updated_at": now_utc(),
+            }
+        },
+    )
+
+
+def _heartbeat(job: CampaignJob) -> None:
+    result = get_collection("sms_requests").update_one(
+        {"request_id": job.request_id, "ingest_owner": job.owner, "ingest_status": IngestStatus.PROCESSING.value},
+        {"$set": {"ingest_heartbeat_at": now_utc()}},
+    )
+    if not result.matched_count:
+        raise IngestClaimLost(job.request_id)
+
+
+def _ingest_chunk(job: CampaignJob, chunk: List[Tuple[int, Optional[Dict[str, Any]]]]) -> bool:
+    _heartbeat(job)
+    existing: List[Dict[str, Any]] = []
+    if job.resume_after is not None:
+        # Only the chunk after the last committed row can be partly inserted by the
+        # interrupted run; those rows are counted below but not inserted again.
+        existing = list(
+            get_collection("sms_messages").find(
+                {"request_id": job.request_id, "ingest_row": {"$in": [row_number for row_number, _ in chunk]}},
+                RESUME_PROJECTION,
+            )
+        )
+        job.resume_after = None
+    existing_rows = {doc["ingest_row"] for doc in existing}
+
+    prepared: List[Dict[str, Any]] = []
+    errors: List[Dict[str, Any]] = []
+    for row_number, item in chunk:
+        if row_number in existing_rows:
+            continue
+        if item is None:
+            errors.append({"row": row_number, "detail": "Invalid row"})
+            continue
+        if not isinstance(item.get("variables") or {}, dict):
+            errors.append({"row": row_number, "detail": "variables must be an object"})
+            continue
+        try:
+            doc = prepare_message(
+                item,
+                principal=job.principal,
+                template_id=job.template_id,
+                compiled_template=job.compiled_template,
+                agent_id=job.agent_id,
+                default_vars=job.default_vars,
+                default_priority=job.default_priority,
+                metadata=job.metadata,
+                now=job.created_at,
+            )
+        except (ValueError, TypeError) as exc:
+            errors.append({"row": row_number, "detail": str(exc)})
+            continue
+        doc["request_id"] = job.request_id
+        doc["ingest_row"] = row_number
+        prepared.append(doc)
+
+    duplicate_count = 0
+    if prepared:
+        # Earlier chunks are already inserted, so the recent-window query also
+        # catches repeats across the whole file.
+        duplicate_count = mark_duplicates(
+            prepared, job.created_at - timedelta(minutes=settings.ANTI_DUP_MINUTES)
+        )
+    agent_ids = [job.agent_id]
+    if prepared and job.agent_id == AUTO_AGENT_ID:
+        # Re-read the fleet for every chunk so long uploads follow agents going idle or offline.
+        routable_agents = load_routable_agents(now_utc())
+        if not routable_agents:
+            _fail_ingest(job, "No active agent available")
+            return False
+        agent_ids = sorted(route_messages(prepared, routable_agents))
+
+    accepted = len(prepared) - duplicate_count
+    if not reserve_daily_quota(job.principal._id, job.day_bucket, accepted, job.principal.rate_limit_per_day):
+        _fail_ingest(job, "Daily rate limit exceeded")
+        return False
+
+    if prepared:
+        try:
+            get_collection("sms_messages").insert_many(prepared)
+        except Exception:
+            release_daily_quota(job.principal._id, job.day_bucket, accepted)
+            raise
+        for agent_id in agent_ids:
+            notify_agent(agent_id)
+        deltas = new_status_deltas()
+        for doc in prepared:
+            record_created(deltas, doc)
+        apply_status_deltas(deltas)
+
+    # Quota and rollups of already inserted rows were booked before the interruption; the
+    # request counters below are committed together with ``last_row``, so they were not.
+    # Later status changes already moved their request counts, so add the created status.
+    created_statuses = [doc["status"] for doc in prepared]
+    for doc in existing:
+        existing_duplicate = doc.get("last_error") == "DUPLICATE_RECENT"
+        created_statuses.append(MessageStatus.CANCELED.value if existing_duplicate else MessageStatus.PENDING.value)
+        duplicate_count += existing_duplicate
+        accepted += not existing_duplicate
+    increments: Dict[str, int] = {
+        "rows_processed": len(chunk),
+        "total_created": accepted,
+        "total_accepted": accepted,
+        "total_skipped": duplicate_count,
+        "total_rejected": len(errors),
+    }
+    for status_value, count in Counter(created_statuses).items():
+        increments[f"status_counts.{status_value}"] = count
+    committed_at = now_utc()
+    update: Dict[str, Any] = {
+        "$inc": increments,
+        "$set": {"updated_at": committed_at, "ingest_heartbeat_at": committed_at, "ingest_job.last_row": chunk[-1][0]},
+    }
+    if job.agent_id == AUTO_AGENT_ID and (prepared or existing):
+        routed = set(agent_ids if prepared else []) | {doc["agent_id"] for doc in existing}
+        update["$addToSet"] = {"agent_ids": {"$each": sorted(routed)}}
+    if errors:
+        update["$push"] = {"ingest_errors": {"$each": errors, "$slice": MAX_INGEST_ERRORS}}
+    result = get_collection("sms_requests").update_one({"request_id": job.request_id, "ingest_owner": job.owner}, update)
+    if not result.matched_count:
+        raise IngestClaimLost(job.request_id)
+    return True
+
+
+def run_campaign_ingest(job: CampaignJob) -> None:
+    """Stream the spooled upload into ``sms_messages`` chunk by chunk, keeping memory bounded.
+
+    Progress (``ingest_job.last_row``) and a heartbeat are committed with every chunk, so
+    :func:`resume_stalled_ingests` can pick the upload up again after a worker dies.
+    """
+    final: Dict[str, Any] = {"ingest_status": IngestStatus.COMPLETED.value}
+    skip_through = job.resume_after or 0
+    try:
+        rows = (
+            (row_number, item)
+            for row_number, item in iter_campaign_rows(job.spool_path, job.file_format)
+            if row_number > skip_through
+        )
+        for chunk in chunked(rows, settings.CAMPAIGN_CHUNK_SIZE):
+            if not _ingest_chunk(job, chunk):
+                final = {}
+                break
+    except IngestClaimLost:
+        # The new owner keeps reading the spool file.
+        return
+    except Exception as exc:
+        final = {"ingest_status": IngestStatus.FAILED.value, "ingest_error": str(exc)}
+    try:
+        os.remove(job.spool_path)
+    except OSError:
+        pass
+    if final:
+        final["ingest_completed_at"] = now_utc()
+        final["updated_at"] = final["ingest_completed_at"]
+        get_collection("sms_requests").update_one({"request_id": job.request_id, "ingest_owner": job.owner}, {"$set": final})
+
+
+def _job_from_request(doc: Dict[str, Any], owner: str) -> Optional[CampaignJob]:
+    """Rebuild the :class:`CampaignJob` persisted on a campaign request, or ``None`` when it cannot resume."""
+    spec = doc.get("ingest_job")
+    if not spec or not os.path.isfile(spec.get("spool_path") or ""):
+        return None
+    try:
+        template, agent_id = load_send_targets(doc["template_id"], doc["agent_id"])
+    except ValueError:
+        return None
+    principal = ApiKeyPrincipal(
+        _id=doc["api_key_id"],
+        client_name=doc.get("client_name", "client"),
+        scopes=spec.get("scopes", []),
+        rate_limit_per_day=int(spec.get("rate_limit_per_day", settings.APIKEY_RATE_LIMIT_PER_DAY_DEFAULT)),
+    )
+    return CampaignJob(
+        request_id=doc["request_id"],
+        spool_path=spec["spool_path"],
+        file_format=doc["format"],
+        principal=principal,
+        template_id=doc["template_id"],
+        compiled_template=get_compiled_template(template),
+        agent_id=agent_id,
+        default_vars=spec.get("default_vars") or {},
+        default_priority=spec.get("default_priority") or resolve_priority(None),
+        metadata=doc.get("metadata"),
+        created_at=doc["created_at"],
+        day_bucket=doc["day_bucket"],
+        owner=owner,
+        resume_after=int(spec.get("last_row") or 0),
+    )
+
+
+def start_campaign_ingest(job: CampaignJob) -> None:
+    threading.Thread(target=run_campaign_ingest, args=(job,), name=f"sms-campaign-{job.request_id}", daemon=True).start()
+
+
+def resume_stalled_ingests(now: datetime, inline: bool = False) -> Dict[str, int]:
+    """Take over PROCESSING campaigns whose heartbeat is older than ``CAMPAIGN_INGEST_STALE_SECONDS``.
+
+    Each one is claimed with a fresh ``ingest_owner`` and continued after its last committed
+    row, in a thread of this process or, with ``inline``, to completion before returning
+    (a one-shot process would otherwise exit mid-chunk). Campaigns whose spool file or
+    template is gone are failed.
+    """
+    stale_before = now - timedelta(seconds=settings.CAMPAIGN_INGEST_STALE_SECONDS)
+    requests = get_collection("sms_requests")
+    counts = {"ingests_resumed": 0, "ingests_failed": 0}
+    while True:
+        owner = ensure_uuid()
+        doc = requests.find_one_and_update(
+            {
+                "ingest_status": IngestStatus.PROCESSING.value,
+                "$or": [
+                    {"ingest_heartbeat_at": {"$lt": stale_before}},
+                    {"ingest_heartbeat_at": None, "created_at": {"$lt": stale_before}},
+                ],
+            },
+            {"$set": {"ingest_owner": owner, "ingest_heartbeat_at": now}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if not doc:
+            return counts
+        job = _job_from_request(doc, owner)
+        if job is None:
+            _fail_ingest_request(doc["request_id"], "Ingest interrupted and cannot be resumed")
+            counts["ingests_failed"] += 1
+            continue
+        if inline:
+            run_campaign_ingest(job)
+        else:
+            start_campaign_ingest(job)
+        counts["ingests_resumed"] += 1
+
+
+class SmsCampaignCreateView(APIView):
+    permission_classes = [ApiKeySendPermission]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        principal = request.user
+        payload = request.data
+        upload = request.FILES.get("file")
+        template_id = payload.get("template_id")
+        raw_agent_id = payload.get("agent_id")
+        if not template_id or upload is None:
+            return Response({"detail": "template_id and file are required"}, status=status.HTTP_400_BAD_REQUEST)
+        if not raw_agent_id:
+            return Response({"detail": "agent_id is required"}, status=status.HTTP_400_BAD_REQUEST)
+        file_format = detect_format(payload.get("format"), upload.name or "")
+        if not file_format:
+            return Response({"detail": "format must be csv or ndjson"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            default_vars = json.loads(payload.get("variables") or "{}")
+            metadata = json.loads(payload["metadata"]) if payload.get("metadata") else None
+        except ValueError:
+            return Response({"detail": "variables/metadata must be JSON"}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(default_vars, dict):
+            return Response({"detail": "variables must be a JSON object"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            template, agent_id = load_send_targets(template_id, raw_agent_id)
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        request_id = ensure_uuid()
+        owner = ensure_uuid()
+        default_priority = resolve_priority(payload.get("priority"))
+        os.makedirs(settings.CAMPAIGN_SPOOL_DIR, exist_ok=True)
+        spool_path = os.path.join(settings.CAMPAIGN_SPOOL_DIR, f"{request_id}.{file_format}")
+        with open(spool_path, "wb") as handle:
+            for block in upload.chunks():
+                handle.write(block)
+
+        now = now_utc()
+        day_bucket = now.strftime("%Y-%m-%d")
+        get_collection("sms_requests").insert_one(
+            {
+                "request_id": request_id,
+                "api_key_id": principal._id,
+                "client_name": principal.client_name,
+                "template_id": template_id,
+                "agent_id": agent_id,
+                "agent_ids": [] if agent_id == AUTO_AGENT_ID else [agent_id],
+                "source": "campaign",
+                "format": file_format,
+                "ingest_status": IngestStatus.PROCESSING.value,
+                "ingest_owner": owner,
+                "ingest_heartbeat_at": now,
+                # Everything needed to resume the upload from another process.
+                "ingest_job": {
+                    "spool_path": spool_path,
+                    "default_vars": default_vars,
+                    "default_priority": default_priority,
+                    "scopes": principal.scopes,
+                    "rate_limit_per_day": principal.rate_limit_per_day,
+                    "last_row": 0,
+                },
+                "rows_processed": 0,
+                "total_created": 0,
+                "total_skipped": 0,
+                "total_accepted": 0,
+                "total_rejected": 0,
+                "ingest_errors": [],
+                "created_at": now,
+                "day_bucket": day_bucket,
+                "status_counts": {},
+                "metadata": metadata,
+            }
+        )
+        write_audit_log(
+            ActorType.API_KEY,
+            principal._id,
+            AuditAction.CREATE_SMS_REQUEST,
+            {"request_id": request_id, "agent_id": agent_id, "source": "campaign", "format": file_format},
+        )
+
+        job = CampaignJob(
+            request_id=request_id,
+            spool_path=spool_path,
+            file_format=file_format,
+            principal=principal,
+            template_id=template_id,
+            compiled_template=get_compiled_template(template),
+            agent_id=agent_id,
+            default_vars=default_vars,
+            default_priority=default_priority,
+            metadata=metadata,
+            created_at=now,
+            day_bucket=day_bucket,
+            owner=owner,
+        )
+        start_campaign_ingest(job)
+
+        return Response(
+            {
+                "request_id": request_id,
+                "agent_id": agent_id,
+                "ingest_status": IngestStatus.PROCESSING.value,
+            },
+            status=status.HTTP_202_ACCEPTED,
+        )
@@ -1,11 +1,16 @@
 from __future__ import annotations
 
+from datetime import datetime
+from typing import Optional
+
 from django.conf import settings
 
 from .mongo import get_collection
 from .utils import now_utc
 
 REGISTRATION_SECRET_KEY = "agent_registration_secret"
+AUTH_CACHE_VERSION_KEY = "auth_cache_version"
+ARCHIVE_WATERMARK_KEY = "sms_archive_watermark"
 APP_CONFIG_COLLECTION = "app_config"
 
 
@@ -34,3 +39,41 @@ def set_registration_secret(secret: str, updated_by: str) -> str:
         upsert=True,
     )
     return secret
+
+
+def get_auth_cache_version() -> int:
+    doc = get_collection(APP_CONFIG_COLLECTION).find_one({"key": AUTH_CACHE_VERSION_KEY}, {"value": 1})
+    return int(doc.get("value") or 0) if doc else 0
+
+
+def bump_auth_cache_version() -> None:
+    """Invalidate cached API key / agent principals in every worker."""
+    now = now_utc()
+    get_collection(APP_CONFIG_COLLECTION).update_one(
+        {"key": AUTH_CACHE_VERSION_KEY},
+        {
+            "$inc": {"value": 1},
+            "$set": {"updated_at": now},
+            "$setOnInsert": {"key": AUTH_CACHE_VERSION_KEY, "created_at": now},
+        },
+        upsert=True,
+    )
+
+
+def get_archive_watermark() -> Optional[datetime]:
+    """Messages created before this instant may live in ``sms_messages_archive``; ``None`` if never archived."""
+    doc = get_collection(APP_CONFIG_COLLECTION).find_one({"key": ARCHIVE_WATERMARK_KEY}, {"value": 1})
+    return doc.get("value") if doc else None
+
+
+def advance_archive_watermark(value: datetime) -> None:
+    now = now_utc()
+    get_collection(APP_CONFIG_COLLECTION).update_one(
+        {"key": ARCHIVE_WATERMARK_KEY},
+        {
+            "$max": {"value": value},
+            "$set": {"updated_at": now},
+            "$setOnInsert": {"key": ARCHIVE_WATERMARK_KEY, "created_at": now},
+        },
+        upsert=True,
+    )
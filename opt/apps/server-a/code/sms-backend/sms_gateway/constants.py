@@ -17,6 +17,22 @@ class MessagePriority(str, Enum):
     LOW = "LOW"
 
 
+class IngestStatus(str, Enum):
+    PROCESSING = "PROCESSING"
+    COMPLETED = "COMPLETED"
+    FAILED = "FAILED"
+
+
+class ReportResultCode(str, Enum):
+    ACCEPTED = "ACCEPTED"
+    INVALID = "INVALID"
+    NOT_FOUND = "NOT_FOUND"
+    NOT_OWNER = "NOT_OWNER"
+    INVALID_TRANSITION = "INVALID_TRANSITION"
+    CONFLICT = "CONFLICT"
+    DUPLICATE = "DUPLICATE"
+
+
 class AuditAction(str, Enum):
     CREATE_TEMPLATE = "CREATE_TEMPLATE"
     APPROVE_TEMPLATE = "APPROVE_TEMPLATE"
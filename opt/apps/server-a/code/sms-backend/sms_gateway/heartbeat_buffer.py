@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import atexit
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from bson import ObjectId
+from django.conf import settings
+from pymongo import UpdateOne
+
+from .mongo import get_collection
+
+
+class HeartbeatBuffer:
+    """Write-behind buffer that keeps the latest heartbeat fields per agent in this worker.
+
+    A background thread flushes everything with one unordered ``bulk_write`` every
+    ``AGENT_HEARTBEAT_MAX_STALENESS_SECONDS``; a non-positive value writes through.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._flusher: Optional[threading.Thread] = None
+
+    def record(self, agent_id: str, fields: Dict[str, Any]) -> None:
+        if settings.AGENT_HEARTBEAT_MAX_STALENESS_SECONDS <= 0:
+            self._write({agent_id: fields})
+            return
+        with self._lock:
+            self._pending.setdefault(agent_id, {}).update(fields)
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run, name="sms-heartbeat-flush", daemon=True)
+                self._flusher.start()
+
+    def overlay(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        """Return ``doc`` with any not-yet-flushed heartbeat fields applied."""
+        with self._lock:
+            fields = self._pending.get(str(doc.get("_id")))
+            return {**doc, **fields} if fields else doc
+
+    def flush(self) -> int:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            self._write(pending)
+        except Exception:
+            # Put the batch back without clobbering heartbeats received meanwhile.
+            with self._lock:
+                for agent_id, fields in pending.items():
+                    self._pending[agent_id] = {**fields, **self._pending.get(agent_id, {})}
+            raise
+        return len(pending)
+
+    def _write(self, updates: Dict[str, Dict[str, Any]]) -> None:
+        operations = [
+            UpdateOne({"_id": ObjectId(agent_id), "is_active": True}, {"$set": fields})
+            for agent_id, fields in updates.items()
+        ]
+        get_collection("agents").bulk_write(operations, ordered=False)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(settings.AGENT_HEARTBEAT_MAX_STALENESS_SECONDS)
+            try:
+                self.flush()
+            except Exception:
+                pass
+
+
+heartbeat_buffer = HeartbeatBuffer()
+
+
+@atexit.register
+def _drain_heartbeats() -> None:
+    try:
+        heartbeat_buffer.flush()
+    except Exception:
+        pass
@@ -1,32 +1,81 @@
 from pymongo import ASCENDING
 
+from .archive import ARCHIVE_COLLECTION
+from .audit import ensure_audit_collection
 from .mongo import get_collection
 
 
+# Keyset pagination on (created_at, _id) for each listing filter; shared by the archive.
+MESSAGE_PAGE_INDEXES = [
+    {"name": "created_id_idx", "fields": [("created_at", ASCENDING), ("_id", ASCENDING)]},
+    {
+        "name": "request_created_id_idx",
+        "fields": [("request_id", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)],
+    },
+    {
+        "name": "request_status_created_id_idx",
+        "fields": [("request_id", ASCENDING), ("status", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)],
+    },
+    {
+        "name": "status_created_id_idx",
+        "fields": [("status", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)],
+    },
+    {
+        "name": "agent_created_id_idx",
+        "fields": [("agent_id", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)],
+    },
+    {
+        "name": "to_created_id_idx",
+        "fields": [("to", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)],
+    },
+    {
+        "name": "api_key_created_id_idx",
+        "fields": [("api_key_id", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)],
+    },
+    # Filter pairs the listings expose (API keys always add api_key_id).
+    {
+        "name": "agent_status_created_id_idx",
+        "fields": [("agent_id", ASCENDING), ("status", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)],
+    },
+    {
+        "name": "api_key_status_created_id_idx",
+        "fields": [("api_key_id", ASCENDING), ("status", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)],
+    },
+    {
+        "name": "api_key_agent_created_id_idx",
+        "fields": [("api_key_id", ASCENDING), ("agent_id", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)],
+    },
+]
+
+
 INDEX_DEFINITIONS = {
     "sms_messages": [
+        # Lease candidates: equality on agent/status, sort on priority, range on
+        # available_at; _id is included so the candidate read is covered.
         {
-            "name": "status_lease_priority_created",
-            "fields": [
-                ("status", ASCENDING),
-                ("lease_until", ASCENDING),
-                ("priority_weight", ASCENDING),
-                ("created_at", ASCENDING),
-            ],
-        },
-        {
-            "name": "agent_status_lease_priority_created",
+            "name": "agent_status_priority_available",
             "fields": [
                 ("agent_id", ASCENDING),
                 ("status", ASCENDING),
-                ("lease_until", ASCENDING),
                 ("priority_weight", ASCENDING),
-                ("created_at", ASCENDING),
+                ("available_at", ASCENDING),
+                ("_id", ASCENDING),
             ],
         },
-        {"name": "request_id_idx", "fields": [("request_id", ASCENDING)]},
+        {"name": "lease_token_idx", "fields": [("lease_token", ASCENDING)]},
+        {"name": "sweep_token_idx", "fields": [("sweep_token", ASCENDING)]},
+        {"name": "status_updated_idx", "fields": [("status", ASCENDING), ("updated_at", ASCENDING)]},
         {"name": "agent_status_idx", "fields": [("agent_id", ASCENDING), ("status", ASCENDING)]},
-        {"name": "to_created_idx", "fields": [("to", ASCENDING), ("created_at", ASCENDING)]},
+        *MESSAGE_PAGE_INDEXES,
+        {"name": "fingerprint_created_idx", "fields": [("fingerprint", ASCENDING), ("created_at", ASCENDING)]},
+    ],
+    ARCHIVE_COLLECTION: [
+        {"name": "message_id_idx", "fields": [("message_id", ASCENDING)]},
+        *MESSAGE_PAGE_INDEXES,
+    ],
+    "sms_requests": [
+        {"name": "request_id_idx", "fields": [("request_id", ASCENDING)]},
+        {"name": "ingest_status_heartbeat_idx", "fields": [("ingest_status", ASCENDING), ("ingest_heartbeat_at", ASCENDING)]},
     ],
     "templates": [
         {"name": "approved_idx", "fields": [("approved", ASCENDING)]},
@@ -37,13 +86,58 @@ INDEX_DEFINITIONS = {
     "api_keys": [
         {"name": "is_active_idx", "fields": [("is_active", ASCENDING)]},
     ],
+    "api_key_usage": [
+        {
+            "name": "api_key_day_unique_idx",
+            "fields": [("api_key_id", ASCENDING), ("day_bucket", ASCENDING)],
+            "unique": True,
+        },
+    ],
+    "sms_daily_rollups": [
+        {
+            "name": "day_template_key_agent_unique_idx",
+            "fields": [
+                ("day", ASCENDING),
+                ("template_id", ASCENDING),
+                ("api_key_id", ASCENDING),
+                ("agent_id", ASCENDING),
+            ],
+            "unique": True,
+        },
+        {"name": "template_day_idx", "fields": [("template_id", ASCENDING), ("day", ASCENDING)]},
+    ],
     "app_config": [
         {"name": "key_unique_idx", "fields": [("key", ASCENDING)], "unique": True},
     ],
 }
 
 
+# Superseded by the indexes above (request_id_idx and to_created_idx are prefixes of
+# the keyset indexes, the lease indexes by agent_status_priority_available); every
+# extra index is paid on each insert and status update, so they are dropped.
+OBSOLETE_INDEXES = {
+    "sms_messages": [
+        "status_lease_priority_created",
+        "agent_status_lease_priority_created",
+        "agent_status_priority_created",
+        "request_id_idx",
+        "to_created_idx",
+    ],
+}
+
+
+def drop_obsolete_indexes() -> None:
+    for collection_name, names in OBSOLETE_INDEXES.items():
+        collection = get_collection(collection_name)
+        existing = collection.index_information()
+        for name in names:
+            if name in existing:
+                collection.drop_index(name)
+
+
 def create_indexes() -> None:
+    ensure_audit_collection()
+    drop_obsolete_indexes()
     for collection_name, defs in INDEX_DEFINITIONS.items():
         collection = get_collection(collection_name)
         for definition in defs:
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+from django.conf import settings
+
+from .constants import MessageStatus
+from .mongo import get_collection
+
+_CONDITION = threading.Condition()
+_VERSIONS: Dict[str, int] = {}
+_WATCHER_LOCK = threading.Lock()
+_WATCHER: Optional[threading.Thread] = None
+_PARKING_LOCK = threading.Lock()
+_PARKED = 0
+_REFUSED = 0
+_REFUSED_LOGGED_AT = 0.0
+# A full parking lot is logged at most this often per worker.
+REFUSED_LOG_INTERVAL_SECONDS = 60.0
+
+logger = logging.getLogger(__name__)
+
+
+def current_version(agent_id: str) -> int:
+    with _CONDITION:
+        return _VERSIONS.get(agent_id, 0)
+
+
+def notify_agent(agent_id: str) -> None:
+    """Wake every long-poll parked on ``agent_id`` in this worker."""
+    with _CONDITION:
+        _VERSIONS[agent_id] = _VERSIONS.get(agent_id, 0) + 1
+        _CONDITION.notify_all()
+
+
+def wait_for_jobs(agent_id: str, since_version: int, timeout: float) -> bool:
+    """Block until ``notify_agent(agent_id)`` is called after ``since_version`` or ``timeout`` elapses."""
+    ensure_change_stream_watcher()
+    deadline = time.monotonic() + max(0.0, timeout)
+    with _CONDITION:
+        while _VERSIONS.get(agent_id, 0) == since_version:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            _CONDITION.wait(remaining)
+        return True
+
+
+def acquire_parking_slot() -> bool:
+    """Reserve one of ``AGENT_LONG_POLL_MAX_PARKED`` long-poll slots in this worker.
+
+    Parked polls hold a gunicorn thread each; once the slots are taken, further polls
+    answer immediately (``long_poll: false``) so request creation and reports always find
+    a free thread. Refusals are counted and logged so an undersized pool is visible.
+    """
+    global _PARKED, _REFUSED, _REFUSED_LOGGED_AT
+    with _PARKING_LOCK:
+        if _PARKED < settings.AGENT_LONG_POLL_MAX_PARKED:
+            _PARKED += 1
+            return True
+        _REFUSED += 1
+        now = time.monotonic()
+        if now - _REFUSED_LOGGED_AT < REFUSED_LOG_INTERVAL_SECONDS:
+            return False
+        _REFUSED_LOGGED_AT, refused, _REFUSED = now, _REFUSED, 0
+    logger.warning(
+        "Long-poll slots full (%s per worker); %s polls fell back to short polling. Raise GUNICORN_THREADS.",
+        settings.AGENT_LONG_POLL_MAX_PARKED,
+        refused,
+    )
+    return False
+
+
+def release_parking_slot() -> None:
+    global _PARKED
+    with _PARKING_LOCK:
+        _PARKED = max(0, _PARKED - 1)
+
+
+def _watch_sms_messages() -> None:
+    pipeline = [
+        {"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}},
+        {"$match": {"fullDocument.status": MessageStatus.PENDING.value}},
+    ]
+    while True:
+        try:
+            with get_collection("sms_messages").watch(
+                pipeline, full_document="updateLookup", max_await_time_ms=1000
+            ) as stream:
+                for change in stream:
+                    agent_id = (change.get("fullDocument") or {}).get("agent_id")
+                    if agent_id:
+                        notify_agent(agent_id)
+        except Exception:
+            # Standalone mongod (no replica set) or a dropped connection: polls
+            # keep working through the periodic recheck in AgentJobsNextView.
+            time.sleep(settings.AGENT_LONG_POLL_RECHECK_SECONDS)
+
+
+def ensure_change_stream_watcher() -> None:
+    """Start the per-process change stream thread when enabled in settings."""
+    global _WATCHER
+    if not settings.AGENT_LONG_POLL_CHANGE_STREAM or _WATCHER is not None:
+        return
+    with _WATCHER_LOCK:
+        if _WATCHER is None:
+            _WATCHER = threading.Thread(target=_watch_sms_messages, name="sms-job-notifier", daemon=True)
+            _WATCHER.start()
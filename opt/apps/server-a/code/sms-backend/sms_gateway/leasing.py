@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+from django.conf import settings
+
+from .constants import MessageStatus
+from .mongo import get_collection
+from .routing import stale_agent_ids
+from .status_counts import apply_status_deltas, new_status_deltas, record_transition
+from .utils import ensure_uuid
+
+LEASE_SORT = [("priority_weight", 1), ("available_at", 1)]
+# Served without a FETCH stage by ``agent_status_priority_available``.
+LEASE_CANDIDATE_PROJECTION = {"_id": 1, "status": 1, "agent_id": 1}
+# A concurrent poll can steal some candidates between the read and the claim;
+# retry a fixed number of times so leasing stays O(1) round trips.
+MAX_LEASE_ROUNDS = 3
+
+
+def leasable_query(agent_id: Any, now: datetime) -> Dict[str, Any]:
+    """PENDING messages of ``agent_id`` (an id or an operator such as ``{"$in": [...]}``) due at ``now``.
+
+    ``available_at`` is ``schedule_at`` or ``created_at``, so one range predicate on the
+    ``agent_status_priority_available`` index replaces the ``schedule_at`` alternatives.
+    Expired leases are returned to PENDING by ``run_sms_scheduler``.
+    """
+    return {
+        "agent_id": agent_id,
+        "status": MessageStatus.PENDING.value,
+        "available_at": {"$lte": now},
+    }
+
+
+def _steal_query(agent_id: str, now: datetime) -> Optional[Dict[str, Any]]:
+    """Auto-routed PENDING messages of stale agents, or None when stealing is off or nobody is stale."""
+    if settings.AGENT_WORK_STEAL_AFTER_SECONDS <= 0:
+        return None
+    stale = [stale_id for stale_id in stale_agent_ids(now) if stale_id != agent_id]
+    if not stale:
+        return None
+    return {"auto_routed": True, **leasable_query({"$in": stale}, now)}
+
+
+def has_leasable_messages(agent_id: str, now: datetime) -> bool:
+    """Cheap probe run before taking pacing tokens, so an empty poll costs reads only.
+
+    The own-queue check is covered by ``agent_status_priority_available``.
+    """
+    collection = get_collection("sms_messages")
+    if collection.find_one(leasable_query(agent_id, now), {"_id": 1}) is not None:
+        return True
+    steal_query = _steal_query(agent_id, now)
+    return steal_query is not None and collection.find_one(steal_query, {"_id": 1}) is not None
+
+
+def _claim(
+    query: Dict[str, Any],
+    agent_id: str,
+    limit: int,
+    lease_token: str,
+    lease_until: datetime,
+    now: datetime,
+    previous: Dict[Any, Dict[str, Any]],
+) -> int:
+    collection = get_collection("sms_messages")
+    claimed = 0
+    for _ in range(MAX_LEASE_ROUNDS):
+        wanted = limit - claimed
+        candidates = list(collection.find(query, LEASE_CANDIDATE_PROJECTION).sort(LEASE_SORT).limit(wanted))
+        if not candidates:
+            break
+        candidate_ids = [doc["_id"] for doc in candidates]
+        previous.update((doc["_id"], doc) for doc in candidates)
+        result = collection.update_many(
+            {"_id": {"$in": candidate_ids}, **query},
+            {
+                "$set": {
+                    "status": MessageStatus.ASSIGNED.value,
+                    "agent_id": agent_id,
+                    "lease_until": lease_until,
+                    "lease_token": lease_token,
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+        )
+        claimed += result.modified_count
+        if claimed >= limit or len(candidate_ids) < wanted:
+            break
+    return claimed
+
+
+def lease_batch(agent_id: str, limit: int, lease_seconds: int, now: datetime) -> List[Dict[str, Any]]:
+    """Claim up to ``limit`` messages for ``agent_id`` in a constant number of round trips.
+
+    Candidates are read in lease order, claimed with a guarded ``update_many`` that
+    stamps a per-batch ``lease_token`` and then fetched back by that token. When the
+    agent's own queue runs short, auto-routed messages of stale agents are stolen.
+    """
+    if limit <= 0:
+        return []
+    lease_token = ensure_uuid()
+    lease_until = now + timedelta(seconds=lease_seconds)
+    previous: Dict[Any, Dict[str, Any]] = {}
+
+    claimed = _claim(leasable_query(agent_id, now), agent_id, limit, lease_token, lease_until, now, previous)
+    if claimed < limit:
+        steal_query = _steal_query(agent_id, now)
+        if steal_query is not None:
+            claimed += _claim(steal_query, agent_id, limit - claimed, lease_token, lease_until, now, previous)
+
+    if not claimed:
+        return []
+    leased = list(get_collection("sms_messages").find({"lease_token": lease_token}).sort(LEASE_SORT))
+    deltas = new_status_deltas()
+    for doc in leased:
+        before = previous.get(doc["_id"], {})
+        record_transition(
+            deltas, doc, before.get("status"), MessageStatus.ASSIGNED.value, previous_agent_id=before.get("agent_id")
+        )
+    apply_status_deltas(deltas)
+    return leased
+
+
+def backfill_available_at(batch_size: int = 1000) -> int:
+    """Set ``available_at`` on messages written before it existed; walks ``_id`` order in batches."""
+    collection = get_collection("sms_messages")
+    updated = 0
+    last_id = None
+    while True:
+        query: Dict[str, Any] = {"available_at": {"$exists": False}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        ids = [doc["_id"] for doc in collection.find(query, {"_id": 1}).sort("_id", 1).limit(batch_size)]
+        if not ids:
+            return updated
+        result = collection.update_many(
+            {"_id": {"$in": ids}, "available_at": {"$exists": False}},
+            [{"$set": {"available_at": {"$ifNull": ["$schedule_at", "$created_at"]}}}],
+        )
+        updated += result.modified_count
+        last_id = ids[-1]
+
+
+def plan_stages(plan: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    yield plan
+    for key in ("inputStage", "queryPlan"):
+        if isinstance(plan.get(key), dict):
+            yield from plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from plan_stages(child)
+
+
+def explain_lease_candidates(agent_id: str, now: datetime, limit: int = 200) -> List[Dict[str, Any]]:
+    """Stages of the winning plan for the lease candidate read, outermost first."""
+    cursor = (
+        get_collection("sms_messages")
+        .find(leasable_query(agent_id, now), LEASE_CANDIDATE_PROJECTION)
+        .sort(LEASE_SORT)
+        .limit(limit)
+    )
+    return list(plan_stages(cursor.explain()["queryPlanner"]["winningPlan"]))
@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from sms_gateway.archive import archive_messages
+from sms_gateway.utils import now_utc
+
+
+class Command(BaseCommand):
+    help = "Move DELIVERED/FAILED/CANCELED messages older than N days into sms_messages_archive"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.SMS_ARCHIVE_AFTER_DAYS,
+            help="Archive messages created more than N days ago",
+        )
+        parser.add_argument(
+            "--export-dir",
+            default=settings.SMS_ARCHIVE_EXPORT_DIR,
+            help="Also append archived messages to a gzip JSONL file in this directory",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000, help="Messages moved per round trip")
+
+    def handle(self, *args, **options):
+        if options["days"] <= 0:
+            raise CommandError("--days must be positive")
+        cutoff = now_utc() - timedelta(days=options["days"])
+        result = archive_messages(cutoff, options["batch_size"], options.get("export_dir") or None)
+        message = f"Archived {result['moved']} messages created before {cutoff.isoformat()}."
+        if result["export_path"]:
+            message += f" Exported to {result['export_path']}."
+        self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from sms_gateway.leasing import backfill_available_at
+
+
+class Command(BaseCommand):
+    help = "Set sms_messages.available_at (schedule_at or created_at) on messages that predate it"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Messages updated per round trip")
+
+    def handle(self, *args, **options):
+        updated = backfill_available_at(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Backfilled available_at on {updated} messages."))
@@ -0,0 +1,105 @@
+import json
+import platform
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from sms_gateway import benchmark
+from sms_gateway.audit import audit_sink
+from sms_gateway.indexes import create_indexes
+from sms_gateway.mongo import get_client
+from sms_gateway.utils import now_utc
+
+SCENARIOS = ["create", "lease_report", "read", "export", "lease_strategies", "render"]
+
+
+def parse_sizes(value: str):
+    try:
+        sizes = [int(part) for part in value.split(",") if part.strip()]
+    except ValueError as exc:
+        raise CommandError("--sizes must be a comma separated list of integers") from exc
+    if not sizes or min(sizes) <= 0:
+        raise CommandError("--sizes must contain positive integers")
+    return sizes
+
+
+class Command(BaseCommand):
+    help = "Run the SMS gateway load-test scenarios against a scratch Mongo database and save the results as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--db", default=f"{settings.MONGO_DB}_bench", help="Scratch database (dropped first)")
+        parser.add_argument("--output", default="benchmark-results.json", help="Where to write the JSON results")
+        parser.add_argument("--label", default="", help="Free-form label stored with the results (e.g. a commit id)")
+        parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma separated subset of scenarios")
+        parser.add_argument("--sizes", default="1,10,100,1000", help="Recipients per request for the create scenario")
+        parser.add_argument("--iterations", type=int, default=20, help="Repetitions per measurement")
+        parser.add_argument("--phones", type=int, default=10, help="Simulated agent phones")
+        parser.add_argument("--messages-per-phone", type=int, default=2000, help="Backlog per phone for lease_report")
+        parser.add_argument("--limit", type=int, default=200, help="Lease batch size")
+        parser.add_argument("--renders", type=int, default=100000, help="Template renders for the render scenario")
+        parser.add_argument(
+            "--export-rows", type=int, default=0, help="Extra messages bulk-seeded before the export scenario"
+        )
+        parser.add_argument("--keep", action="store_true", help="Keep the scratch database afterwards")
+
+    def handle(self, *args, **options):
+        scenarios = [name for name in options["scenarios"].split(",") if name]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        if options["db"] == settings.MONGO_DB:
+            raise CommandError("--db must not be the service database; it is dropped before the run")
+        sizes = parse_sizes(options["sizes"])
+        iterations = max(1, options["iterations"])
+
+        client = get_client()
+        client.drop_database(options["db"])
+        service_db, settings.MONGO_DB = settings.MONGO_DB, options["db"]
+        try:
+            create_indexes()
+            fixture = benchmark.BenchFixture(max(1, options["phones"]))
+            results = {}
+            if "create" in scenarios:
+                self.stdout.write("Running create ...")
+                results["create"] = benchmark.bench_request_create(fixture, sizes, iterations)
+            if "lease_report" in scenarios:
+                self.stdout.write("Running lease_report ...")
+                results["lease_report"] = benchmark.bench_lease_report(
+                    fixture, options["messages_per_phone"], options["limit"]
+                )
+            if "read" in scenarios:
+                self.stdout.write("Running read ...")
+                request_id = fixture.create_request(fixture.agents[0].agent_id, 1000)["request_id"]
+                results["read"] = benchmark.bench_read_endpoints(fixture, request_id, iterations)
+            if "export" in scenarios:
+                if options["export_rows"] > 0:
+                    self.stdout.write(f"Seeding {options['export_rows']} export rows ...")
+                    benchmark.seed_export_rows(fixture, options["export_rows"])
+                self.stdout.write("Running export ...")
+                results["export"] = benchmark.bench_export(fixture, max(1, iterations // 5))
+            if "lease_strategies" in scenarios:
+                self.stdout.write("Running lease_strategies ...")
+                results["lease_strategies"] = benchmark.bench_lease_strategies(fixture, options["limit"], iterations)
+            if "render" in scenarios:
+                self.stdout.write("Running render ...")
+                results["render"] = benchmark.bench_render(options["renders"])
+        finally:
+            # Queued audit entries must land in the scratch database, not the service one.
+            audit_sink.flush()
+            settings.MONGO_DB = service_db
+            if not options["keep"]:
+                client.drop_database(options["db"])
+
+        report = {
+            "label": options["label"],
+            "created_at": now_utc().isoformat(),
+            "python": platform.python_version(),
+            "options": {
+                key: options[key]
+                for key in ("sizes", "iterations", "phones", "messages_per_phone", "limit", "renders", "export_rows")
+            },
+            "results": results,
+        }
+        with open(options["output"], "w", encoding="utf-8") as handle:
+            json.dump(report, handle, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Benchmark results written to {options['output']}."))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from sms_gateway.leasing import explain_lease_candidates
+from sms_gateway.utils import now_utc
+
+LEASE_INDEX_NAME = "agent_status_priority_available"
+# Stages that mean the read touched documents or sorted in memory.
+FORBIDDEN_STAGES = {"COLLSCAN", "FETCH", "SORT"}
+
+
+class Command(BaseCommand):
+    help = "Fail unless the lease candidate query is an index-only scan of agent_status_priority_available"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--agent-id", default="000000000000000000000000", help="Agent id to explain the query for")
+
+    def handle(self, *args, **options):
+        stages = explain_lease_candidates(options["agent_id"], now_utc())
+        names = [stage.get("stage") for stage in stages]
+        index_names = {stage.get("indexName") for stage in stages if stage.get("stage") == "IXSCAN"}
+        if LEASE_INDEX_NAME not in index_names:
+            raise CommandError(f"Lease query does not use {LEASE_INDEX_NAME}: {' <- '.join(map(str, names))}")
+        forbidden = FORBIDDEN_STAGES.intersection(names)
+        if forbidden:
+            raise CommandError(f"Lease query is not index-only ({', '.join(sorted(forbidden))}): {' <- '.join(map(str, names))}")
+        self.stdout.write(self.style.SUCCESS(f"Lease query is index-only: {' <- '.join(map(str, names))}"))
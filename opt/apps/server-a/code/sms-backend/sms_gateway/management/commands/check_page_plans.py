@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from sms_gateway.requests_api import explain_messages_page
+
+PLACEHOLDER_ID = "000000000000000000000000"
+# Listing filters the message APIs can send, with the keyset index meant to serve each.
+PAGE_FILTERS = [
+    ({"request_id": PLACEHOLDER_ID}, "request_created_id_idx"),
+    ({"request_id": PLACEHOLDER_ID, "status": "PENDING"}, "request_status_created_id_idx"),
+    ({"status": "PENDING"}, "status_created_id_idx"),
+    ({"agent_id": PLACEHOLDER_ID}, "agent_created_id_idx"),
+    ({"agent_id": PLACEHOLDER_ID, "status": "PENDING"}, "agent_status_created_id_idx"),
+    ({"to": "+10000000000"}, "to_created_id_idx"),
+    ({"api_key_id": PLACEHOLDER_ID}, "api_key_created_id_idx"),
+    ({"api_key_id": PLACEHOLDER_ID, "status": "PENDING"}, "api_key_status_created_id_idx"),
+    ({"api_key_id": PLACEHOLDER_ID, "agent_id": PLACEHOLDER_ID}, "api_key_agent_created_id_idx"),
+]
+# Stages that mean the page was read without its keyset index.
+FORBIDDEN_STAGES = {"COLLSCAN", "SORT"}
+
+
+class Command(BaseCommand):
+    help = "Fail if a message listing filter scans the collection or sorts in memory"
+
+    def handle(self, *args, **options):
+        failures = []
+        for query, expected_index in PAGE_FILTERS:
+            stages = explain_messages_page(query)
+            names = [stage.get("stage") for stage in stages]
+            index_names = {stage.get("indexName") for stage in stages if stage.get("stage") == "IXSCAN"}
+            plan = " <- ".join(map(str, names))
+            label = "+".join(query)
+            forbidden = FORBIDDEN_STAGES.intersection(names)
+            if forbidden:
+                failures.append(f"{label}: {', '.join(sorted(forbidden))} ({plan})")
+            elif expected_index not in index_names:
+                # The planner may prefer another keyset index on sparse data; only report it.
+                self.stdout.write(
+                    self.style.WARNING(f"{label}: uses {', '.join(sorted(map(str, index_names)))}, not {expected_index}")
+                )
+            else:
+                self.stdout.write(f"{label}: {expected_index} ({plan})")
+        if failures:
+            raise CommandError("Message listings without a keyset index:\n" + "\n".join(failures))
+        self.stdout.write(self.style.SUCCESS("Every message listing filter pages on an index"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from sms_gateway.usage import rebuild_daily_usage
+
+
+class Command(BaseCommand):
+    help = "Rebuild api_key_usage daily counters from sms_requests"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--day", help="Only rebuild this day bucket (YYYY-MM-DD)")
+
+    def handle(self, *args, **options):
+        written = rebuild_daily_usage(options.get("day"))
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} api_key_usage counters."))
@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from dateutil import parser as date_parser
+from django.core.management.base import BaseCommand, CommandError
+
+from sms_gateway.rollups import rebuild_daily_rollups
+from sms_gateway.utils import start_of_day
+
+
+class Command(BaseCommand):
+    help = "Rebuild sms_daily_rollups from sms_messages for a range of days"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="day_from", help="First day to rebuild (YYYY-MM-DD); default: all history")
+        parser.add_argument("--to", dest="day_to", help="Last day to rebuild, inclusive (YYYY-MM-DD)")
+
+    def handle(self, *args, **options):
+        try:
+            day_from = start_of_day(date_parser.isoparse(options["day_from"])) if options.get("day_from") else None
+            day_to = start_of_day(date_parser.isoparse(options["day_to"])) + timedelta(days=1) if options.get("day_to") else None
+        except ValueError as exc:
+            raise CommandError("Days must be YYYY-MM-DD") from exc
+        written = rebuild_daily_rollups(day_from, day_to)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} sms_daily_rollups rows."))
@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from sms_gateway.status_counts import reconcile_status_counts
+from sms_gateway.utils import now_utc
+
+
+class Command(BaseCommand):
+    help = "Recompute sms_requests.status_counts from sms_messages"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--request-id", help="Only reconcile this request")
+        parser.add_argument("--days", type=int, default=0, help="Only reconcile requests created in the last N days")
+
+    def handle(self, *args, **options):
+        created_since = now_utc() - timedelta(days=options["days"]) if options["days"] > 0 else None
+        rewritten = reconcile_status_counts(options.get("request_id"), created_since)
+        self.stdout.write(self.style.SUCCESS(f"Reconciled status_counts for {rewritten} requests."))
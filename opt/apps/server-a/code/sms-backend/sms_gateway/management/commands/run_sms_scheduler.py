@@ -0,0 +1,53 @@
+import math
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from sms_gateway.mongo import get_collection
+from sms_gateway.scheduler import run_scheduler_pass
+from sms_gateway.utils import now_utc
+
+
+class Command(BaseCommand):
+    help = "Release expired leases, schedule FAILED messages for retry and resume stalled campaign ingests, in a loop"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=settings.SMS_SCHEDULER_INTERVAL_SECONDS,
+            help="Seconds between passes",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Run a single pass and exit (resumed ingests run to completion first)"
+        )
+
+    def _check_long_poll_capacity(self):
+        capacity = settings.GUNICORN_WORKERS * settings.AGENT_LONG_POLL_MAX_PARKED
+        agents = get_collection("agents").count_documents({"is_active": True})
+        if agents > capacity:
+            threads = math.ceil(agents / max(1, settings.GUNICORN_WORKERS)) + settings.AGENT_LONG_POLL_RESERVED_THREADS
+            self.stderr.write(
+                f"{agents} active agents but only {capacity} long-poll slots per sms container; "
+                f"the rest short-poll. Set GUNICORN_THREADS={threads} (or run more containers)."
+            )
+
+    def handle(self, *args, **options):
+        self._check_long_poll_capacity()
+        while True:
+            started = time.monotonic()
+            counts = run_scheduler_pass(now_utc(), inline_ingests=options["once"])
+            if options["once"] or any(counts.values()):
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f"Released {counts['released']} expired leases, failed {counts['exhausted']}, "
+                        f"scheduled {counts['retried']} retries, resumed {counts['ingests_resumed']} campaign ingests "
+                        f"(failed {counts['ingests_failed']})."
+                    )
+                )
+            if options["once"]:
+                return
+            # A full batch means there is more to do; go again without sleeping.
+            if max(counts.values()) < settings.SMS_SCHEDULER_BATCH_SIZE:
+                time.sleep(max(0.0, options["interval"] - (time.monotonic() - started)))
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from pymongo import ReturnDocument
+
+from .mongo import get_collection
+
+PACING_COLLECTION = "agent_pacing"
+# Blend factor for the observed send rate; each closed window moves the estimate 30% of the way.
+OBSERVED_RATE_ALPHA = 0.3
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+@dataclass
+class LeaseGrant:
+    count: int
+    lease_seconds: int
+    retry_after_seconds: int
+
+
+def bucket_capacity(rate_per_min: int) -> int:
+    return max(1, math.ceil(rate_per_min * settings.AGENT_PACING_BURST_SECONDS / 60))
+
+
+def _elapsed_seconds(since: Any, now: datetime) -> Dict[str, Any]:
+    return {"$divide": [{"$subtract": [now, {"$ifNull": [since, now]}]}, 1000]}
+
+
+def _epoch_ms(value: datetime) -> int:
+    # BSON dates keep milliseconds, so mirror the truncation the server sees.
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - EPOCH) // timedelta(milliseconds=1)
+
+
+def _refilled_tokens(doc: Optional[Dict[str, Any]], capacity: int, rate_per_min: int, now: datetime) -> float:
+    """The first stage of the ``acquire_lease_tokens`` pipeline, evaluated on the document it started from."""
+    doc = doc or {}
+    refilled_at = doc.get("refilled_at")
+    elapsed = (_epoch_ms(now) - _epoch_ms(refilled_at)) / 1000 if refilled_at else 0
+    tokens = doc.get("tokens")
+    return min(capacity, (capacity if tokens is None else tokens) + elapsed * (rate_per_min / 60))
+
+
+def acquire_lease_tokens(agent_id: str, rate_per_min: int, wanted: int, now: datetime) -> LeaseGrant:
+    """Take up to ``wanted`` tokens from the agent's bucket in one atomic ``find_one_and_update``.
+
+    The bucket refills at ``rate_per_min`` and holds ``AGENT_PACING_BURST_SECONDS`` worth of
+    sends, so an agent can never lease faster than it is allowed to send. The grant is not
+    stored; it is recomputed from the document as it was before the update.
+    """
+    if settings.AGENT_PACING_BURST_SECONDS <= 0 or rate_per_min <= 0:
+        return LeaseGrant(wanted, lease_seconds_for(wanted, rate_per_min, None), 0)
+    capacity = bucket_capacity(rate_per_min)
+    refill = {"$multiply": [_elapsed_seconds("$refilled_at", now), rate_per_min / 60]}
+    before = get_collection(PACING_COLLECTION).find_one_and_update(
+        {"_id": agent_id},
+        [
+            {"$set": {"tokens": {"$min": [capacity, {"$add": [{"$ifNull": ["$tokens", capacity]}, refill]}]}}},
+            {"$set": {"granted": {"$min": [wanted, {"$floor": "$tokens"}]}}},
+            {"$set": {"tokens": {"$subtract": ["$tokens", "$granted"]}, "refilled_at": now}},
+            {"$unset": "granted"},
+        ],
+        projection={"tokens": 1, "refilled_at": 1, "observed_rate_per_min": 1},
+        upsert=True,
+        return_document=ReturnDocument.BEFORE,
+    )
+    tokens = _refilled_tokens(before, capacity, rate_per_min, now)
+    granted = int(min(wanted, math.floor(tokens)))
+    retry_after = 0 if granted else math.ceil((1 - tokens) * 60 / rate_per_min)
+    observed = (before or {}).get("observed_rate_per_min")
+    return LeaseGrant(granted, lease_seconds_for(granted, rate_per_min, observed), retry_after)
+
+
+def release_lease_tokens(agent_id: str, count: int, rate_per_min: int) -> None:
+    """Return tokens granted for messages that could not be leased."""
+    if count <= 0 or settings.AGENT_PACING_BURST_SECONDS <= 0:
+        return
+    capacity = bucket_capacity(rate_per_min)
+    get_collection(PACING_COLLECTION).update_one(
+        {"_id": agent_id},
+        [{"$set": {"tokens": {"$min": [capacity, {"$add": [{"$ifNull": ["$tokens", 0]}, count]}]}}}],
+    )
+
+
+def record_sends(agent_id: str, count: int, now: datetime) -> None:
+    """Count attempted sends and fold each ``AGENT_PACING_WINDOW_SECONDS`` window into ``observed_rate_per_min``.
+
+    Only windows with at least ``AGENT_PACING_MIN_SAMPLE`` sends update the estimate, so an
+    idle phone is not mistaken for a slow one.
+    """
+    if count <= 0:
+        return
+    window_rate = {"$divide": ["$window_count", {"$divide": ["$_elapsed", 60]}]}
+    closed = {"$gte": ["$_elapsed", settings.AGENT_PACING_WINDOW_SECONDS]}
+    sampled = {"$and": [closed, {"$gte": ["$window_count", settings.AGENT_PACING_MIN_SAMPLE]}]}
+    get_collection(PACING_COLLECTION).update_one(
+        {"_id": agent_id},
+        [
+            {
+                "$set": {
+                    "window_count": {"$add": [{"$ifNull": ["$window_count", 0]}, count]},
+                    "window_started_at": {"$ifNull": ["$window_started_at", now]},
+                }
+            },
+            {"$set": {"_elapsed": _elapsed_seconds("$window_started_at", now)}},
+            {
+                "$set": {
+                    "observed_rate_per_min": {
+                        "$cond": [
+                            sampled,
+                            {
+                                "$cond": [
+                                    {"$eq": [{"$ifNull": ["$observed_rate_per_min", None]}, None]},
+                                    window_rate,
+                                    {
+                                        "$add": [
+                                            {"$multiply": [OBSERVED_RATE_ALPHA, window_rate]},
+                                            {"$multiply": [1 - OBSERVED_RATE_ALPHA, "$observed_rate_per_min"]},
+                                        ]
+                                    },
+                                ]
+                            },
+                            "$observed_rate_per_min",
+                        ]
+                    },
+                    "window_count": {"$cond": [closed, 0, "$window_count"]},
+                    "window_started_at": {"$cond": [closed, now, "$window_started_at"]},
+                }
+            },
+            {"$unset": "_elapsed"},
+        ],
+        upsert=True,
+    )
+
+
+def lease_seconds_for(count: int, rate_per_min: int, observed_rate_per_min: Optional[float]) -> int:
+    """Lease long enough for the agent to work through ``count`` messages at its real pace.
+
+    The configured rate is an upper bound; a lower observed rate stretches the lease so
+    it does not expire (and get re-leased) while the phone is still sending.
+    """
+    rate = rate_per_min
+    if observed_rate_per_min:
+        rate = min(rate, observed_rate_per_min) if rate > 0 else observed_rate_per_min
+    if count <= 0 or rate <= 0:
+        return settings.LEASE_SECONDS
+    estimate = math.ceil(count * 60 / rate * settings.AGENT_LEASE_SAFETY_FACTOR)
+    return int(min(max(estimate, settings.LEASE_SECONDS), max(settings.AGENT_LEASE_MAX_SECONDS, settings.LEASE_SECONDS)))
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from django.conf import settings
+
+from .config_store import bump_auth_cache_version, get_auth_cache_version
+
+CacheKey = Tuple[str, str]
+
+
+class PrincipalCache:
+    """Per-process LRU of authenticated principals keyed by ``(kind, credential_hash)``.
+
+    Entries expire after ``AUTH_CACHE_TTL_SECONDS``. The shared version stamp in
+    ``app_config`` is re-read at most every ``AUTH_CACHE_VERSION_CHECK_SECONDS``;
+    when an admin action bumps it, the whole cache is dropped. A miss reads the stamp
+    before and after its load and only stores the result if no bump landed in between,
+    so a principal loaded just before a revocation is not cached past it.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[CacheKey, Tuple[float, Any]]" = OrderedDict()
+        self._version: Optional[int] = None
+        self._version_checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.load_seconds = 0.0
+
+    def _sync_version(self, now: float) -> None:
+        if now - self._version_checked_at < settings.AUTH_CACHE_VERSION_CHECK_SECONDS:
+            return
+        version = get_auth_cache_version()
+        with self._lock:
+            self._version_checked_at = now
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+
+    def get_or_load(self, key: CacheKey, loader: Callable[[], Optional[Any]]) -> Optional[Any]:
+        if settings.AUTH_CACHE_TTL_SECONDS <= 0:
+            return loader()
+        now = time.monotonic()
+        self._sync_version(now)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+        version_before = get_auth_cache_version()
+        started = time.perf_counter()
+        value = loader()
+        elapsed = time.perf_counter() - started
+        version_after = get_auth_cache_version() if value is not None else version_before
+        with self._lock:
+            self.misses += 1
+            self.load_seconds += elapsed
+            if value is None:
+                self._entries.pop(key, None)
+                return None
+            if version_after != self._version:
+                self._entries.clear()
+                self._version = version_after
+                self._version_checked_at = time.monotonic()
+            if version_after != version_before:
+                # Bumped mid-load: the value may predate the change, so serve it uncached.
+                return value
+            self._entries[key] = (now + settings.AUTH_CACHE_TTL_SECONDS, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.AUTH_CACHE_MAX_ENTRIES:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            avg_load_ms = (self.load_seconds / self.misses * 1000) if self.misses else 0.0
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "avg_load_ms": round(avg_load_ms, 3),
+                # Estimated Mongo time avoided: each hit skips one average lookup.
+                "saved_ms": round(self.hits * avg_load_ms, 1),
+                "version": self._version,
+            }
+
+
+principal_cache = PrincipalCache()
+
+
+def invalidate_cached_principals() -> None:
+    """Drop cached principals here and, through the version stamp, in every other worker."""
+    bump_auth_cache_version()
+    principal_cache.clear()
@@ -2,16 +2,23 @@ from __future__ import annotations
 
 import csv
 import io
+import zlib
 from datetime import datetime, timezone
-from typing import Any, Dict, Iterable
+from typing import Any, Dict, Iterable, Iterator
 
 from dateutil import parser
+from django.conf import settings
 from django.http import StreamingHttpResponse
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from .archive import ARCHIVE_COLLECTION, archive_may_match, merge_sorted
 from .auth import JWTOnlyPermission
 from .mongo import get_collection
+from .rollups import ROLLUP_COLLECTION
+
+EXPORT_COLUMNS = ["message_id", "request_id", "to", "status", "created_at", "updated_at"]
+EXPORT_PROJECTION = {"_id": 0, **{column: 1 for column in EXPORT_COLUMNS}}
 
 
 def parse_date(value: str | None) -> datetime | None:
@@ -26,6 +33,15 @@ def parse_date(value: str | None) -> datetime | None:
     return dt
 
 
+def gzip_stream(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
 class ReportsSummaryView(APIView):
     permission_classes = [JWTOnlyPermission]
 
@@ -37,38 +53,31 @@ class ReportsSummaryView(APIView):
             return Response({"detail": str(exc)}, status=400)
         template_id = request.query_params.get("template_id")
 
+        # Rollups are bucketed per UTC day, so partial-day bounds widen to the whole day.
         match: Dict[str, Any] = {}
         if template_id:
             match["template_id"] = template_id
         if date_from or date_to:
-            match["created_at"] = {}
+            match["day"] = {}
             if date_from:
-                match["created_at"]["$gte"] = date_from
+                match["day"]["$gte"] = date_from.astimezone(timezone.utc).strftime("%Y-%m-%d")
             if date_to:
-                match["created_at"]["$lte"] = date_to
+                match["day"]["$lte"] = date_to.astimezone(timezone.utc).strftime("%Y-%m-%d")
 
         pipeline = [
-            {"$match": match or {}},
+            {"$match": match},
             {
                 "$group": {
-                    "_id": {
-                        "$dateToString": {"format": "%Y-%m-%d", "date": "$created_at", "timezone": "UTC"}
-                    },
-                    "total": {"$sum": 1},
-                    "sent": {
-                        "$sum": {"$cond": [{"$eq": ["$status", "SENT"]}, 1, 0]},
-                    },
-                    "delivered": {
-                        "$sum": {"$cond": [{"$eq": ["$status", "DELIVERED"]}, 1, 0]},
-                    },
-                    "failed": {
-                        "$sum": {"$cond": [{"$eq": ["$status", "FAILED"]}, 1, 0]},
-                    },
+                    "_id": "$day",
+                    "total": {"$sum": "$total"},
+                    "sent": {"$sum": "$status_counts.SENT"},
+                    "delivered": {"$sum": "$status_counts.DELIVERED"},
+                    "failed": {"$sum": "$status_counts.FAILED"},
                 }
             },
             {"$sort": {"_id": 1}},
         ]
-        cursor = get_collection("sms_messages").aggregate(pipeline)
+        cursor = get_collection(ROLLUP_COLLECTION).aggregate(pipeline)
         data = [
             {
                 "date": doc["_id"],
@@ -105,12 +114,16 @@ class ReportsExportView(APIView):
         def row_generator() -> Iterable[bytes]:
             buffer = io.StringIO()
             writer = csv.writer(buffer)
-            writer.writerow(["message_id", "request_id", "to", "status", "created_at", "updated_at"])
-            yield buffer.getvalue().encode("utf-8")
-            buffer.seek(0)
-            buffer.truncate(0)
-            cursor = get_collection("sms_messages").find(match or {}).sort("created_at")
-            for doc in cursor:
+            writer.writerow(EXPORT_COLUMNS)
+            names = ["sms_messages", ARCHIVE_COLLECTION] if archive_may_match(match) else ["sms_messages"]
+            cursors = [
+                get_collection(name)
+                .find(match, EXPORT_PROJECTION)
+                .sort("created_at")
+                .batch_size(settings.EXPORT_BATCH_SIZE)
+                for name in names
+            ]
+            for doc in merge_sorted(cursors, ["created_at"]):
                 writer.writerow(
                     [
                         doc.get("message_id"),
@@ -121,10 +134,18 @@ class ReportsExportView(APIView):
                         doc.get("updated_at").isoformat() if doc.get("updated_at") else None,
                     ]
                 )
+                if buffer.tell() >= settings.EXPORT_CHUNK_BYTES:
+                    yield buffer.getvalue().encode("utf-8")
+                    buffer.seek(0)
+                    buffer.truncate(0)
+            if buffer.tell():
                 yield buffer.getvalue().encode("utf-8")
-                buffer.seek(0)
-                buffer.truncate(0)
 
-        response = StreamingHttpResponse(row_generator(), content_type="text/csv")
+        use_gzip = "gzip" in request.META.get("HTTP_ACCEPT_ENCODING", "").lower()
+        body = gzip_stream(row_generator()) if use_gzip else row_generator()
+        response = StreamingHttpResponse(body, content_type="text/csv")
         response["Content-Disposition"] = "attachment; filename=reports.csv"
+        response["Vary"] = "Accept-Encoding"
+        if use_gzip:
+            response["Content-Encoding"] = "gzip"
         return response
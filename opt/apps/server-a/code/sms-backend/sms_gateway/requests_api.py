@@ -1,8 +1,10 @@
 from __future__ import annotations
 
+import base64
+import json
 from collections import Counter
 from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Tuple
 
 from bson import ObjectId
 from bson.errors import InvalidId
@@ -12,25 +14,35 @@ from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from .archive import ARCHIVE_COLLECTION, archive_may_match, merge_sorted
 from .auth import ApiKeyPrincipal, ApiKeySendPermission, JwtOrApiKeyReadPermission
-from .constants import ActorType, AuditAction, MessagePriority, MessageStatus
-PRIORITY_VALUES = {p.value for p in MessagePriority}
-PRIORITY_ORDER = {
-    MessagePriority.HIGH.value: 0,
-    MessagePriority.NORMAL.value: 1,
-    MessagePriority.LOW.value: 2,
-}
-
+from .constants import ActorType, AuditAction, IngestStatus, MessagePriority, MessageStatus
+from .job_notifier import notify_agent
+from .leasing import plan_stages
 from .mongo import get_collection
+from .routing import AUTO_AGENT_ID, load_routable_agents, route_messages
+from .status_counts import apply_status_deltas, new_status_deltas, record_created
+from .template_cache import get_compiled_template
+from .usage import release_daily_quota, reserve_daily_quota
 from .utils import (
+    CompiledTemplate,
     ensure_uuid,
+    message_fingerprint,
     now_utc,
     normalize_phone,
-    render_template,
+    render_compiled,
     vars_hash,
     write_audit_log,
 )
 
+PRIORITY_VALUES = {p.value for p in MessagePriority}
+PRIORITY_ORDER = {
+    MessagePriority.HIGH.value: 0,
+    MessagePriority.NORMAL.value: 1,
+    MessagePriority.LOW.value: 2,
+}
+MESSAGE_PAGE_SORT = [("created_at", 1), ("_id", 1)]
+
 
 def parse_schedule(value: Any) -> datetime | None:
     if not value:
@@ -39,13 +51,25 @@ def parse_schedule(value: Any) -> datetime | None:
     return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
 
 
-def evaluate_rate_limit(api_key_id: str, day_bucket: str) -> int:
-    pipeline = [
-        {"$match": {"api_key_id": api_key_id, "day_bucket": day_bucket}},
-        {"$group": {"_id": None, "total": {"$sum": "$total_accepted"}}},
-    ]
-    result = list(get_collection("sms_requests").aggregate(pipeline))
-    return result[0]["total"] if result else 0
+def mark_duplicates(prepared_messages: List[Dict[str, Any]], recent_cutoff: datetime) -> int:
+    """Cancel messages whose ``(to, text)`` fingerprint was sent since ``recent_cutoff`` or repeats in the batch."""
+    fingerprints = list({doc["fingerprint"] for doc in prepared_messages})
+    seen = {
+        doc["fingerprint"]
+        for doc in get_collection("sms_messages").find(
+            {"fingerprint": {"$in": fingerprints}, "created_at": {"$gte": recent_cutoff}},
+            {"_id": 0, "fingerprint": 1},
+        )
+    }
+    duplicate_count = 0
+    for doc in prepared_messages:
+        if doc["fingerprint"] in seen:
+            doc["status"] = MessageStatus.CANCELED.value
+            doc["last_error"] = "DUPLICATE_RECENT"
+            duplicate_count += 1
+        else:
+            seen.add(doc["fingerprint"])
+    return duplicate_count
 
 
 def resolve_priority(value: Any) -> str:
@@ -55,6 +79,81 @@ def resolve_priority(value: Any) -> str:
     return upper if upper in PRIORITY_VALUES else MessagePriority.NORMAL.value
 
 
+def load_send_targets(template_id: str, raw_agent_id: str) -> Tuple[Dict[str, Any], str]:
+    """Return the approved template document and active agent id for a send; raises ``ValueError``.
+
+    ``agent_id="auto"`` is passed through as :data:`AUTO_AGENT_ID`; the caller routes each message.
+    """
+    try:
+        template_oid = ObjectId(template_id)
+    except InvalidId as exc:
+        raise ValueError("Invalid template_id") from exc
+    if raw_agent_id != AUTO_AGENT_ID:
+        try:
+            agent_oid = ObjectId(raw_agent_id)
+        except InvalidId as exc:
+            raise ValueError("Invalid agent_id") from exc
+
+    template = get_collection("templates").find_one(
+        {"_id": template_oid},
+        {"content": 1, "approved": 1, "updated_at": 1},
+    )
+    if not template or not template.get("approved"):
+        raise ValueError("Template not approved")
+    if raw_agent_id == AUTO_AGENT_ID:
+        return template, AUTO_AGENT_ID
+    agent = get_collection("agents").find_one({"_id": agent_oid, "is_active": True}, {"_id": 1})
+    if not agent:
+        raise ValueError("Agent not found or inactive")
+    return template, str(agent_oid)
+
+
+def prepare_message(
+    msg: Dict[str, Any],
+    *,
+    principal: ApiKeyPrincipal,
+    template_id: str,
+    compiled_template: CompiledTemplate,
+    agent_id: str,
+    default_vars: Dict[str, Any],
+    default_priority: str,
+    metadata: Any,
+    now: datetime,
+) -> Dict[str, Any]:
+    """Build the ``sms_messages`` document for one recipient; raises ``ValueError`` on invalid input."""
+    normalized_to = normalize_phone(msg.get("to", ""))
+    variables = {**default_vars, **(msg.get("variables") or {})}
+    text = render_compiled(compiled_template, variables)
+    if len(text) > settings.MAX_TEXT_LENGTH:
+        raise ValueError("Text exceeds MAX_TEXT_LENGTH")
+    priority = resolve_priority(msg.get("priority") or default_priority)
+    schedule_at = parse_schedule(msg.get("schedule_at"))
+    return {
+        "message_id": ensure_uuid(),
+        "request_id": None,
+        "api_key_id": principal._id,
+        "client_name": principal.client_name,
+        "template_id": template_id,
+        "to": normalized_to,
+        "text": text,
+        "fingerprint": message_fingerprint(normalized_to, text),
+        "variables": variables,
+        "vars_hash": vars_hash(variables),
+        "schedule_at": schedule_at,
+        "available_at": schedule_at or now,
+        "status": MessageStatus.PENDING.value,
+        "priority": priority,
+        "priority_weight": PRIORITY_ORDER.get(priority, 1),
+        "lease_until": None,
+        "agent_id": agent_id,
+        "attempts": 0,
+        "last_error": None,
+        "created_at": now,
+        "updated_at": now,
+        "metadata": metadata,
+    }
+
+
 def serialize_message(doc: Dict[str, Any]) -> Dict[str, Any]:
     return {
         "message_id": doc.get("message_id"),
@@ -72,6 +171,55 @@ def serialize_message(doc: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
+def encode_page_cursor(doc: Dict[str, Any]) -> str:
+    raw = json.dumps({"t": doc["created_at"].isoformat(), "i": str(doc["_id"])}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_page_cursor(value: str) -> Dict[str, Any]:
+    """Turn an opaque cursor into the keyset predicate for rows after it; raises ``ValueError``."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(value + "=" * (-len(value) % 4)))
+        created_at = parser.isoparse(data["t"])
+        last_id = ObjectId(data["i"])
+    except (ValueError, KeyError, TypeError, InvalidId) as exc:
+        raise ValueError("Invalid cursor") from exc
+    return {
+        "$or": [
+            {"created_at": {"$gt": created_at}},
+            {"created_at": created_at, "_id": {"$gt": last_id}},
+        ]
+    }
+
+
+def list_messages_page(query: Dict[str, Any], limit: int, skip: int, page_cursor: str | None) -> Dict[str, Any]:
+    """Page through ``sms_messages`` on ``(created_at, _id)``; ``skip`` is only honoured without a cursor.
+
+    When archived messages can match, ``sms_messages_archive`` is read with the same keyset
+    and both sorted streams are merged, so paging is seamless across the two tiers.
+    """
+    if page_cursor:
+        query = {**query, **decode_page_cursor(page_cursor)}
+    skip = skip if skip > 0 and not page_cursor else 0
+    collections = [get_collection("sms_messages")]
+    if archive_may_match(query):
+        collections.append(get_collection(ARCHIVE_COLLECTION))
+    if len(collections) == 1:
+        docs = list(collections[0].find(query).sort(MESSAGE_PAGE_SORT).skip(skip).limit(limit + 1))
+    else:
+        sources = [list(c.find(query).sort(MESSAGE_PAGE_SORT).limit(skip + limit + 1)) for c in collections]
+        docs = list(merge_sorted(sources, [field for field, _ in MESSAGE_PAGE_SORT]))[skip : skip + limit + 1]
+    next_cursor = encode_page_cursor(docs[limit - 1]) if len(docs) > limit else None
+    items = [serialize_message(doc) for doc in docs[:limit]]
+    return {"items": items, "count": len(items), "next_cursor": next_cursor}
+
+
+def explain_messages_page(query: Dict[str, Any], limit: int = 50) -> List[Dict[str, Any]]:
+    """Stages of the winning plan for one ``sms_messages`` listing page, outermost first."""
+    cursor = get_collection("sms_messages").find(query).sort(MESSAGE_PAGE_SORT).limit(limit + 1)
+    return list(plan_stages(cursor.explain()["queryPlanner"]["winningPlan"]))
+
+
 class SmsRequestCreateView(APIView):
     permission_classes = [ApiKeySendPermission]
 
@@ -91,98 +239,58 @@ class SmsRequestCreateView(APIView):
             return Response({"detail": "Too many recipients"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            template_oid = ObjectId(template_id)
-        except InvalidId:
-            return Response({"detail": "Invalid template_id"}, status=status.HTTP_400_BAD_REQUEST)
-        try:
-            agent_oid = ObjectId(raw_agent_id)
-        except InvalidId:
-            return Response({"detail": "Invalid agent_id"}, status=status.HTTP_400_BAD_REQUEST)
-
-        template = get_collection("templates").find_one({"_id": template_oid})
-        if not template or not template.get("approved"):
-            return Response({"detail": "Template not approved"}, status=status.HTTP_400_BAD_REQUEST)
-        agent = get_collection("agents").find_one({"_id": agent_oid, "is_active": True})
-        if not agent:
-            return Response({"detail": "Agent not found or inactive"}, status=status.HTTP_400_BAD_REQUEST)
-        agent_id = str(agent_oid)
+            template, agent_id = load_send_targets(template_id, raw_agent_id)
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
         now = now_utc()
         day_bucket = now.strftime("%Y-%m-%d")
-        usage_today = evaluate_rate_limit(principal._id, day_bucket)
 
+        compiled_template = get_compiled_template(template)
         prepared_messages: List[Dict[str, Any]] = []
-        duplicate_count = 0
         for msg in messages_payload:
             try:
-                normalized_to = normalize_phone(msg.get("to", ""))
+                prepared_messages.append(
+                    prepare_message(
+                        msg,
+                        principal=principal,
+                        template_id=template_id,
+                        compiled_template=compiled_template,
+                        agent_id=agent_id,
+                        default_vars=default_vars,
+                        default_priority=default_priority,
+                        metadata=payload.get("metadata"),
+                        now=now,
+                    )
+                )
             except ValueError as exc:
                 return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
-            variables = {**default_vars, **(msg.get("variables") or {})}
-            try:
-                text = render_template(template.get("content", ""), variables)
-            except ValueError as exc:
-                return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
-            if len(text) > settings.MAX_TEXT_LENGTH:
-                return Response({"detail": "Text exceeds MAX_TEXT_LENGTH"}, status=status.HTTP_400_BAD_REQUEST)
-
-            schedule_at = parse_schedule(msg.get("schedule_at"))
-            vars_digest = vars_hash(variables)
-            recent_cutoff = now - timedelta(minutes=settings.ANTI_DUP_MINUTES)
-            duplicate = get_collection("sms_messages").find_one(
-                {
-                    "to": normalized_to,
-                    "text": text,
-                    "created_at": {"$gte": recent_cutoff},
-                }
-            )
-            priority = resolve_priority(msg.get("priority") or default_priority)
-            status_value = MessageStatus.CANCELED.value if duplicate else MessageStatus.PENDING.value
-            if duplicate:
-                duplicate_count += 1
 
-            prepared_messages.append(
-                {
-                    "message_id": ensure_uuid(),
-                    "request_id": None,
-                    "api_key_id": principal._id,
-                    "client_name": principal.client_name,
-                    "template_id": template_id,
-                    "to": normalized_to,
-                    "text": text,
-                    "variables": variables,
-                    "vars_hash": vars_digest,
-                    "schedule_at": schedule_at,
-                    "status": status_value,
-                    "priority": priority,
-                    "priority_weight": PRIORITY_ORDER.get(priority, 1),
-                    "lease_until": None,
-                    "agent_id": agent_id,
-                    "attempts": 0,
-                    "last_error": "DUPLICATE_RECENT" if duplicate else None,
-                    "created_at": now,
-                    "updated_at": now,
-                    "metadata": payload.get("metadata"),
-                }
-            )
+        duplicate_count = mark_duplicates(prepared_messages, now - timedelta(minutes=settings.ANTI_DUP_MINUTES))
+        if agent_id == AUTO_AGENT_ID:
+            routable_agents = load_routable_agents(now)
+            if not routable_agents:
+                return Response({"detail": "No active agent available"}, status=status.HTTP_400_BAD_REQUEST)
+            agent_ids = sorted(route_messages(prepared_messages, routable_agents))
+        else:
+            agent_ids = [agent_id]
 
         accepted = len(prepared_messages) - duplicate_count
-        if usage_today + accepted > principal.rate_limit_per_day:
+        if not reserve_daily_quota(principal._id, day_bucket, accepted, principal.rate_limit_per_day):
             return Response({"detail": "Daily rate limit exceeded"}, status=status.HTTP_429_TOO_MANY_REQUESTS)
 
         request_id = ensure_uuid()
         for doc in prepared_messages:
             doc["request_id"] = request_id
 
-        get_collection("sms_messages").insert_many(prepared_messages)
         status_counts = Counter(doc["status"] for doc in prepared_messages)
-
         request_doc = {
             "request_id": request_id,
             "api_key_id": principal._id,
             "client_name": principal.client_name,
             "template_id": template_id,
             "agent_id": agent_id,
+            "agent_ids": agent_ids,
             "total_created": accepted,
             "total_skipped": duplicate_count,
             "total_accepted": accepted,
@@ -191,7 +299,26 @@ class SmsRequestCreateView(APIView):
             "status_counts": dict(status_counts),
             "metadata": payload.get("metadata"),
         }
-        get_collection("sms_requests").insert_one(request_doc)
+        # The request doc (with its initial status_counts) goes in first: lease and report
+        # deltas $inc it without upsert, so it must exist before any agent can see a message.
+        try:
+            get_collection("sms_requests").insert_one(request_doc)
+        except Exception:
+            release_daily_quota(principal._id, day_bucket, accepted)
+            raise
+        try:
+            get_collection("sms_messages").insert_many(prepared_messages)
+        except Exception:
+            get_collection("sms_messages").delete_many({"request_id": request_id})
+            get_collection("sms_requests").delete_one({"request_id": request_id})
+            release_daily_quota(principal._id, day_bucket, accepted)
+            raise
+        deltas = new_status_deltas()
+        for doc in prepared_messages:
+            record_created(deltas, doc)
+        apply_status_deltas(deltas)
+        for target_agent_id in agent_ids:
+            notify_agent(target_agent_id)
         write_audit_log(
             ActorType.API_KEY,
             principal._id,
@@ -208,6 +335,7 @@ class SmsRequestCreateView(APIView):
             {
                 "request_id": request_id,
                 "agent_id": agent_id,
+                "agent_ids": agent_ids,
                 "total_created": accepted,
                 "total_skipped": duplicate_count,
             },
@@ -225,20 +353,27 @@ class SmsRequestDetailView(APIView):
         if isinstance(request.user, ApiKeyPrincipal) and request_doc.get("api_key_id") != request.user._id:
             return Response({"detail": "Not authorized"}, status=status.HTTP_403_FORBIDDEN)
 
-        pipeline = [
-            {"$match": {"request_id": request_id}},
-            {"$group": {"_id": "$status", "count": {"$sum": 1}}},
-        ]
-        counts = {doc["_id"]: doc["count"] for doc in get_collection("sms_messages").aggregate(pipeline)}
+        counts = {key: value for key, value in (request_doc.get("status_counts") or {}).items() if value}
         response = {
             "request_id": request_doc.get("request_id"),
             "template_id": request_doc.get("template_id"),
             "agent_id": request_doc.get("agent_id"),
+            "agent_ids": request_doc.get("agent_ids") or [request_doc.get("agent_id")],
             "total_created": request_doc.get("total_created", 0),
             "total_skipped": request_doc.get("total_skipped", 0),
             "created_at": request_doc.get("created_at").isoformat() if request_doc.get("created_at") else None,
             "status_counts": counts,
+            "ingest_status": request_doc.get("ingest_status", IngestStatus.COMPLETED.value),
         }
+        if request_doc.get("source") == "campaign":
+            response.update(
+                {
+                    "rows_processed": request_doc.get("rows_processed", 0),
+                    "total_rejected": request_doc.get("total_rejected", 0),
+                    "ingest_errors": request_doc.get("ingest_errors", []),
+                    "ingest_error": request_doc.get("ingest_error"),
+                }
+            )
         return Response(response)
 
 
@@ -251,7 +386,7 @@ class SmsMessageListView(APIView):
             return Response({"detail": "request_id required"}, status=status.HTTP_400_BAD_REQUEST)
         status_filter = request.query_params.get("status")
         try:
-            limit = min(int(request.query_params.get("limit", 50)), 500)
+            limit = max(min(int(request.query_params.get("limit", 50)), 500), 1)
             skip = int(request.query_params.get("skip", 0))
         except ValueError:
             return Response({"detail": "limit/skip must be integers"}, status=status.HTTP_400_BAD_REQUEST)
@@ -263,15 +398,11 @@ class SmsMessageListView(APIView):
         if isinstance(request.user, ApiKeyPrincipal):
             query["api_key_id"] = request.user._id
 
-        cursor = (
-            get_collection("sms_messages")
-            .find(query)
-            .skip(skip)
-            .limit(limit)
-            .sort("created_at")
-        )
-        messages = [serialize_message(doc) for doc in cursor]
-        return Response({"items": messages, "count": len(messages)})
+        try:
+            page = list_messages_page(query, limit, skip, request.query_params.get("cursor"))
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(page)
 
 
 class SmsMessageAllListView(APIView):
@@ -283,7 +414,7 @@ class SmsMessageAllListView(APIView):
         agent_id = request.query_params.get("agent_id")
         phone = request.query_params.get("to")
         try:
-            limit = min(int(request.query_params.get("limit", 50)), 500)
+            limit = max(min(int(request.query_params.get("limit", 50)), 500), 1)
             skip = int(request.query_params.get("skip", 0))
         except ValueError:
             return Response({"detail": "limit/skip must be integers"}, status=status.HTTP_400_BAD_REQUEST)
@@ -301,12 +432,8 @@ class SmsMessageAllListView(APIView):
         if isinstance(request.user, ApiKeyPrincipal):
             query["api_key_id"] = request.user._id
 
-        cursor = (
-            get_collection("sms_messages")
-            .find(query)
-            .skip(skip)
-            .limit(limit)
-            .sort("created_at")
-        )
-        messages = [serialize_message(doc) for doc in cursor]
-        return Response({"items": messages, "count": len(messages)})
+        try:
+            page = list_messages_page(query, limit, skip, request.query_params.get("cursor"))
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(page)
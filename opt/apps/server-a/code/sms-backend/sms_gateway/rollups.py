@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from .archive import ARCHIVE_COLLECTION
+from .mongo import get_collection
+from .utils import chunked, now_utc
+
+ROLLUP_COLLECTION = "sms_daily_rollups"
+REBUILD_BATCH_SIZE = 1000
+RollupKey = Tuple[str, Optional[str], Optional[str], Optional[str]]
+
+
+def rollup_key(doc: Dict[str, Any]) -> Optional[RollupKey]:
+    """``(day, template_id, api_key_id, agent_id)`` of a message, bucketed by its UTC ``created_at`` day."""
+    created_at: Optional[datetime] = doc.get("created_at")
+    if not created_at:
+        return None
+    return created_at.strftime("%Y-%m-%d"), doc.get("template_id"), doc.get("api_key_id"), doc.get("agent_id")
+
+
+def rollup_filter(key: RollupKey) -> Dict[str, Any]:
+    day, template_id, api_key_id, agent_id = key
+    return {"day": day, "template_id": template_id, "api_key_id": api_key_id, "agent_id": agent_id}
+
+
+def apply_rollup_deltas(deltas: Dict[RollupKey, Counter]) -> None:
+    now = now_utc()
+    operations = []
+    for key, counter in deltas.items():
+        increments = {field: delta for field, delta in counter.items() if delta}
+        if increments:
+            operations.append(
+                UpdateOne(rollup_filter(key), {"$inc": increments, "$set": {"updated_at": now}}, upsert=True)
+            )
+    if operations:
+        get_collection(ROLLUP_COLLECTION).bulk_write(operations, ordered=False)
+
+
+def rebuild_daily_rollups(day_from: Optional[datetime] = None, day_to: Optional[datetime] = None) -> int:
+    """Recompute rollups from ``sms_messages`` and its archive for ``[day_from, day_to)``; returns the number of rollup rows written."""
+    match: Dict[str, Any] = {}
+    day_match: Dict[str, Any] = {}
+    if day_from or day_to:
+        match["created_at"] = {}
+        if day_from:
+            match["created_at"]["$gte"] = day_from
+            day_match["$gte"] = day_from.strftime("%Y-%m-%d")
+        if day_to:
+            match["created_at"]["$lt"] = day_to
+            day_match["$lt"] = day_to.strftime("%Y-%m-%d")
+    pipeline = [
+        {"$match": match},
+        # Archived messages still count towards their day.
+        {"$unionWith": {"coll": ARCHIVE_COLLECTION, "pipeline": [{"$match": match}]}},
+        {
+            "$group": {
+                "_id": {
+                    "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at", "timezone": "UTC"}},
+                    "template_id": "$template_id",
+                    "api_key_id": "$api_key_id",
+                    "agent_id": "$agent_id",
+                    "status": "$status",
+                },
+                "count": {"$sum": 1},
+            }
+        },
+    ]
+    rows: Dict[RollupKey, Counter] = {}
+    for doc in get_collection("sms_messages").aggregate(pipeline, allowDiskUse=True):
+        group = doc["_id"]
+        key = (group["day"], group.get("template_id"), group.get("api_key_id"), group.get("agent_id"))
+        counter = rows.setdefault(key, Counter())
+        counter["total"] += doc["count"]
+        counter[f"status_counts.{group['status']}"] += doc["count"]
+
+    # Rows are overwritten in place and only keys missing from the aggregate are deleted,
+    # so the unique key is never vacated and keys created by live $inc during the rebuild
+    # (updated_at after ``now``) survive.
+    collection = get_collection(ROLLUP_COLLECTION)
+    now = now_utc()
+    operations: List[UpdateOne] = []
+    for key, counter in rows.items():
+        status_counts = {field.split(".", 1)[1]: value for field, value in counter.items() if field != "total"}
+        operations.append(
+            UpdateOne(
+                rollup_filter(key),
+                {"$set": {"total": counter["total"], "status_counts": status_counts, "updated_at": now}},
+                upsert=True,
+            )
+        )
+    for batch in chunked(operations, REBUILD_BATCH_SIZE):
+        collection.bulk_write(batch, ordered=False)
+    stale: Dict[str, Any] = {"updated_at": {"$lt": now}}
+    if day_match:
+        stale["day"] = day_match
+    collection.delete_many(stale)
+    return len(operations)
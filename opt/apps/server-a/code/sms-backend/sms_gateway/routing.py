@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import heapq
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Set, Tuple
+
+from django.conf import settings
+
+from .constants import MessageStatus
+from .heartbeat_buffer import heartbeat_buffer
+from .mongo import get_collection
+
+AUTO_AGENT_ID = "auto"
+BACKLOG_STATUSES = [MessageStatus.PENDING.value, MessageStatus.ASSIGNED.value, MessageStatus.SENDING.value]
+# Stale-agent lookups run on every short poll, so keep the answer for a few seconds per worker.
+STALE_AGENTS_CACHE_SECONDS = 5.0
+
+
+@dataclass
+class AgentCapacity:
+    agent_id: str
+    rate_per_min: int
+    backlog: int
+
+
+def load_routable_agents(now: datetime) -> List[AgentCapacity]:
+    """Active agents with a fresh heartbeat and enough battery, with their current backlog."""
+    fresh_since = now - timedelta(seconds=settings.AGENT_ROUTING_FRESH_SECONDS)
+    candidates: Dict[str, int] = {}
+    cursor = get_collection("agents").find(
+        {"is_active": True},
+        {"_id": 1, "rate_limit_per_min": 1, "battery_level": 1, "last_seen_at": 1},
+    )
+    for doc in cursor:
+        doc = heartbeat_buffer.overlay(doc)
+        last_seen_at = doc.get("last_seen_at")
+        if not last_seen_at or last_seen_at < fresh_since:
+            continue
+        battery = doc.get("battery_level")
+        if isinstance(battery, (int, float)) and battery < settings.AGENT_ROUTING_MIN_BATTERY:
+            continue
+        rate = int(doc.get("rate_limit_per_min") or settings.AGENT_RATE_LIMIT_PER_MIN)
+        if rate > 0:
+            candidates[str(doc["_id"])] = rate
+    if not candidates:
+        return []
+
+    backlog: Dict[str, int] = {}
+    pipeline = [
+        {"$match": {"agent_id": {"$in": list(candidates)}, "status": {"$in": BACKLOG_STATUSES}}},
+        {"$group": {"_id": "$agent_id", "count": {"$sum": 1}}},
+    ]
+    for doc in get_collection("sms_messages").aggregate(pipeline):
+        backlog[doc["_id"]] = doc["count"]
+    return [AgentCapacity(agent_id, rate, backlog.get(agent_id, 0)) for agent_id, rate in candidates.items()]
+
+
+def plan_assignments(agents: List[AgentCapacity], count: int) -> List[str]:
+    """Spread ``count`` messages so every agent drains its queue at about the same time.
+
+    Each message goes to the agent whose estimated finish time ``(backlog + 1) / rate``
+    is lowest, so faster and idler phones take proportionally more of the request.
+    """
+    heap: List[Tuple[float, str, int, int]] = [
+        ((agent.backlog + 1) / agent.rate_per_min, agent.agent_id, agent.backlog, agent.rate_per_min)
+        for agent in agents
+    ]
+    heapq.heapify(heap)
+    assignments: List[str] = []
+    for _ in range(count):
+        _, agent_id, queued, rate = heap[0]
+        assignments.append(agent_id)
+        queued += 1
+        heapq.heapreplace(heap, ((queued + 1) / rate, agent_id, queued, rate))
+    return assignments
+
+
+def route_messages(docs: List[Dict[str, Any]], agents: List[AgentCapacity]) -> Set[str]:
+    """Assign prepared ``sms_messages`` documents to ``agents``; returns the agent ids used."""
+    queued = [doc for doc in docs if doc["status"] != MessageStatus.CANCELED.value]
+    # Suppressed duplicates never reach a phone; keep them on the first pick for reporting.
+    assignments = plan_assignments(agents, len(queued) or 1)
+    for doc, agent_id in zip(queued, assignments):
+        doc["agent_id"] = agent_id
+        doc["auto_routed"] = True
+    for doc in docs:
+        if doc["status"] == MessageStatus.CANCELED.value:
+            doc["agent_id"] = assignments[0]
+            doc["auto_routed"] = True
+    return {doc["agent_id"] for doc in docs}
+
+
+_stale_lock = threading.Lock()
+_stale_cache: Tuple[float, List[str]] = (0.0, [])
+
+
+def stale_agent_ids(now: datetime) -> List[str]:
+    """Agents whose auto-routed backlog may be stolen.
+
+    Active agents qualify once silent for ``AGENT_WORK_STEAL_AFTER_SECONDS``; unregistered
+    (inactive) agents qualify at once while they still hold auto-routed PENDING messages,
+    since nothing else would drain them. Usually empty, in which case ``lease_batch``
+    skips the steal query altogether.
+    """
+    global _stale_cache
+    with _stale_lock:
+        expires_at, cached = _stale_cache
+        if time.monotonic() < expires_at:
+            return cached
+    cutoff = now - timedelta(seconds=settings.AGENT_WORK_STEAL_AFTER_SECONDS)
+    cursor = get_collection("agents").find(
+        {"is_active": True, "$or": [{"last_seen_at": {"$lt": cutoff}}, {"last_seen_at": None}]},
+        {"_id": 1, "last_seen_at": 1},
+    )
+    stale = []
+    for doc in cursor:
+        # A heartbeat still waiting in this worker's buffer means the agent is alive.
+        last_seen_at = heartbeat_buffer.overlay(doc).get("last_seen_at")
+        if not last_seen_at or last_seen_at < cutoff:
+            stale.append(str(doc["_id"]))
+    inactive = [str(doc["_id"]) for doc in get_collection("agents").find({"is_active": False}, {"_id": 1})]
+    if inactive:
+        stale.extend(
+            get_collection("sms_messages").distinct(
+                "agent_id",
+                {"agent_id": {"$in": inactive}, "status": MessageStatus.PENDING.value, "auto_routed": True},
+            )
+        )
+    with _stale_lock:
+        _stale_cache = (time.monotonic() + STALE_AGENTS_CACHE_SECONDS, stale)
+    return stale
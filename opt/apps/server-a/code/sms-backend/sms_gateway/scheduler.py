@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from django.conf import settings
+
+from .campaigns_api import resume_stalled_ingests
+from .constants import MessageStatus
+from .mongo import get_collection
+from .status_counts import apply_status_deltas, new_status_deltas, record_transition
+from .utils import ensure_uuid
+
+LEASE_EXPIRED_ERROR = "LEASE_EXPIRED"
+SWEEP_PROJECTION = {"_id": 1, "status": 1, "request_id": 1, "template_id": 1, "api_key_id": 1, "agent_id": 1, "created_at": 1}
+
+
+def _sweep(query: Dict[str, Any], pipeline: List[Dict[str, Any]], batch_size: int) -> int:
+    """Apply ``pipeline`` to up to ``batch_size`` messages matching ``query`` and book the status changes.
+
+    Like leasing, the batch is stamped with a ``sweep_token`` so the documents that were
+    really changed can be read back and counted without racing concurrent reports.
+    """
+    collection = get_collection("sms_messages")
+    candidates = {doc["_id"]: doc for doc in collection.find(query, SWEEP_PROJECTION).limit(batch_size)}
+    if not candidates:
+        return 0
+    sweep_token = ensure_uuid()
+    result = collection.update_many(
+        {"_id": {"$in": list(candidates)}, **query},
+        pipeline + [{"$set": {"sweep_token": sweep_token}}],
+    )
+    if not result.modified_count:
+        return 0
+    deltas = new_status_deltas()
+    for doc in collection.find({"sweep_token": sweep_token}, {"_id": 1, "status": 1}):
+        before = candidates[doc["_id"]]
+        record_transition(deltas, before, before.get("status"), doc["status"])
+    apply_status_deltas(deltas)
+    return result.modified_count
+
+
+def release_expired_leases(now: datetime, batch_size: int) -> Dict[str, int]:
+    """Return expired ASSIGNED/SENDING leases to PENDING, or fail them once ``SMS_MAX_ATTEMPTS`` is used up."""
+    expired = {
+        "status": {"$in": [MessageStatus.ASSIGNED.value, MessageStatus.SENDING.value]},
+        "lease_until": {"$lte": now},
+    }
+    released = _sweep(
+        {**expired, "attempts": {"$lt": settings.SMS_MAX_ATTEMPTS}},
+        [{"$set": {"status": MessageStatus.PENDING.value, "lease_until": None, "lease_token": None, "updated_at": now}}],
+        batch_size,
+    )
+    exhausted = _sweep(
+        {**expired, "attempts": {"$gte": settings.SMS_MAX_ATTEMPTS}},
+        [
+            {
+                "$set": {
+                    "status": MessageStatus.FAILED.value,
+                    "lease_until": None,
+                    "lease_token": None,
+                    "last_error": LEASE_EXPIRED_ERROR,
+                    "updated_at": now,
+                }
+            }
+        ],
+        batch_size,
+    )
+    return {"released": released, "exhausted": exhausted}
+
+
+def schedule_retries(now: datetime, batch_size: int) -> int:
+    """Put recently FAILED messages back to PENDING with ``schedule_at`` backed off exponentially by attempt."""
+    if settings.SMS_RETRY_BASE_SECONDS <= 0:
+        return 0
+    backoff_ms = {
+        "$multiply": [
+            1000,
+            {
+                "$min": [
+                    settings.SMS_RETRY_MAX_DELAY_SECONDS,
+                    {
+                        "$multiply": [
+                            settings.SMS_RETRY_BASE_SECONDS,
+                            {"$pow": [2, {"$max": [0, {"$subtract": [{"$ifNull": ["$attempts", 1]}, 1]}]}]},
+                        ]
+                    },
+                ]
+            },
+        ]
+    }
+    retry_at = {"$add": [now, backoff_ms]}
+    return _sweep(
+        {
+            "status": MessageStatus.FAILED.value,
+            "attempts": {"$lt": settings.SMS_MAX_ATTEMPTS},
+            "updated_at": {"$gte": now - timedelta(hours=settings.SMS_RETRY_LOOKBACK_HOURS)},
+        },
+        [
+            {
+                "$set": {
+                    "status": MessageStatus.PENDING.value,
+                    "schedule_at": retry_at,
+                    "available_at": retry_at,
+                    "updated_at": now,
+                }
+            }
+        ],
+        batch_size,
+    )
+
+
+def run_scheduler_pass(now: datetime, inline_ingests: bool = False) -> Dict[str, int]:
+    """One sweep; ``inline_ingests`` finishes resumed campaign ingests before returning (``--once``)."""
+    batch_size = settings.SMS_SCHEDULER_BATCH_SIZE
+    counts = release_expired_leases(now, batch_size)
+    counts["retried"] = schedule_retries(now, batch_size)
+    counts.update(resume_stalled_ingests(now, inline=inline_ingests))
+    return counts
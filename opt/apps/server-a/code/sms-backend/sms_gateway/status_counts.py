@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Any, DefaultDict, Dict, Optional
+
+from pymongo import UpdateOne
+
+from .archive import ARCHIVE_COLLECTION
+from .mongo import get_collection
+from .rollups import RollupKey, apply_rollup_deltas, rollup_key
+
+
+class StatusDeltas:
+    """Status count changes collected during one operation, keyed by request and by daily rollup."""
+
+    def __init__(self) -> None:
+        self.requests: DefaultDict[str, Counter] = defaultdict(Counter)
+        self.rollups: DefaultDict[RollupKey, Counter] = defaultdict(Counter)
+
+
+def new_status_deltas() -> StatusDeltas:
+    return StatusDeltas()
+
+
+def record_created(deltas: StatusDeltas, doc: Dict[str, Any]) -> None:
+    """Count a newly inserted message in its daily rollup (request counts are written with the request)."""
+    key = rollup_key(doc)
+    if key:
+        deltas.rollups[key]["total"] += 1
+        deltas.rollups[key][f"status_counts.{doc['status']}"] += 1
+
+
+def record_transition(
+    deltas: StatusDeltas,
+    doc: Dict[str, Any],
+    old_status: Optional[str],
+    new_status: str,
+    previous_agent_id: Optional[str] = None,
+) -> None:
+    """Record a status change of ``doc``; ``previous_agent_id`` moves it between agent rollups (work stealing)."""
+    old_key = rollup_key({**doc, "agent_id": previous_agent_id}) if previous_agent_id else rollup_key(doc)
+    new_key = rollup_key(doc)
+    if old_status == new_status and old_key == new_key:
+        return
+    request_id = doc.get("request_id")
+    if request_id and old_status != new_status:
+        if old_status:
+            deltas.requests[request_id][old_status] -= 1
+        deltas.requests[request_id][new_status] += 1
+    if old_key != new_key:
+        if old_key:
+            deltas.rollups[old_key]["total"] -= 1
+            if old_status:
+                deltas.rollups[old_key][f"status_counts.{old_status}"] -= 1
+        if new_key:
+            deltas.rollups[new_key]["total"] += 1
+            deltas.rollups[new_key][f"status_counts.{new_status}"] += 1
+        return
+    if new_key:
+        if old_status:
+            deltas.rollups[new_key][f"status_counts.{old_status}"] -= 1
+        deltas.rollups[new_key][f"status_counts.{new_status}"] += 1
+
+
+def apply_status_deltas(deltas: StatusDeltas) -> None:
+    """Apply ``$inc`` deltas to ``sms_requests.status_counts`` and ``sms_daily_rollups`` in bulk writes."""
+    operations = []
+    for request_id, counter in deltas.requests.items():
+        increments = {f"status_counts.{status}": delta for status, delta in counter.items() if delta}
+        if increments:
+            operations.append(UpdateOne({"request_id": request_id}, {"$inc": increments}))
+    if operations:
+        get_collection("sms_requests").bulk_write(operations, ordered=False)
+    apply_rollup_deltas(deltas.rollups)
+
+
+def reconcile_status_counts(request_id: Optional[str] = None, created_since: Optional[datetime] = None) -> int:
+    """Recompute ``status_counts`` from ``sms_messages`` and its archive; returns the number of requests rewritten."""
+    match: Dict[str, Any] = {}
+    if request_id:
+        match["request_id"] = request_id
+    if created_since:
+        match["created_at"] = {"$gte": created_since}
+    pipeline = [
+        {"$match": match},
+        {"$unionWith": {"coll": ARCHIVE_COLLECTION, "pipeline": [{"$match": match}]}},
+        {"$group": {"_id": {"request_id": "$request_id", "status": "$status"}, "count": {"$sum": 1}}},
+    ]
+    counts: DefaultDict[str, Dict[str, int]] = defaultdict(dict)
+    for doc in get_collection("sms_messages").aggregate(pipeline, allowDiskUse=True):
+        counts[doc["_id"]["request_id"]][doc["_id"]["status"]] = doc["count"]
+
+    operations = [
+        UpdateOne({"request_id": rid}, {"$set": {"status_counts": status_counts}})
+        for rid, status_counts in counts.items()
+        if rid
+    ]
+    if operations:
+        get_collection("sms_requests").bulk_write(operations, ordered=False)
+    return len(operations)
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from .utils import CompiledTemplate, compile_template
+
+MAX_CACHED_TEMPLATES = 256
+
+_LOCK = threading.Lock()
+_COMPILED: "OrderedDict[Tuple[str, Optional[datetime]], CompiledTemplate]" = OrderedDict()
+
+
+def get_compiled_template(template: Dict[str, Any]) -> CompiledTemplate:
+    """Return the compiled form of a template document, compiling it at most once per version.
+
+    Entries are keyed by ``(_id, updated_at)``, so an edit made through another
+    worker produces a new key instead of serving stale content.
+    """
+    key = (str(template["_id"]), template.get("updated_at"))
+    with _LOCK:
+        compiled = _COMPILED.get(key)
+        if compiled is not None:
+            _COMPILED.move_to_end(key)
+            return compiled
+    compiled = compile_template(template.get("content", ""))
+    with _LOCK:
+        _COMPILED[key] = compiled
+        while len(_COMPILED) > MAX_CACHED_TEMPLATES:
+            _COMPILED.popitem(last=False)
+    return compiled
+
+
+def invalidate_template(template_id: str) -> None:
+    with _LOCK:
+        for key in [key for key in _COMPILED if key[0] == template_id]:
+            del _COMPILED[key]
@@ -10,6 +10,7 @@ from rest_framework.views import APIView
 from .auth import JWTOnlyPermission
 from .constants import ActorType, AuditAction
 from .mongo import get_collection
+from .template_cache import invalidate_template
 from .utils import extract_template_variables, now_utc, write_audit_log
 
 
@@ -88,6 +89,7 @@ class TemplateDetailView(APIView):
         )
         if not result:
             return Response({"detail": "Template not found"}, status=status.HTTP_404_NOT_FOUND)
+        invalidate_template(template_id)
         return Response(serialize_template(result))
 
 
@@ -107,5 +109,6 @@ class TemplateApproveView(APIView):
         )
         if not doc:
             return Response({"detail": "Template not found"}, status=status.HTTP_404_NOT_FOUND)
+        invalidate_template(template_id)
         write_audit_log(ActorType.USER, request.user.user_id, AuditAction.APPROVE_TEMPLATE, {"template_id": str(doc["_id"])})
         return Response(serialize_template(doc))
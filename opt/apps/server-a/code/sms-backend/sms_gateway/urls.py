@@ -1,7 +1,15 @@
 from django.urls import path
 
-from .admin_api import AgentListView, AgentRegistrationSecretView, AgentUnregisterView, ApiKeyDisableView, ApiKeyListCreateView
+from .admin_api import (
+    AgentListView,
+    AgentRegistrationSecretView,
+    AgentUnregisterView,
+    ApiKeyDisableView,
+    ApiKeyListCreateView,
+    MetricsView,
+)
 from .agent_api import AgentHeartbeatView, AgentJobsNextView, AgentRegisterView, AgentReportView
+from .campaigns_api import SmsCampaignCreateView
 from .reports_api import ReportsExportView, ReportsSummaryView
 from .requests_api import SmsMessageAllListView, SmsMessageListView, SmsRequestCreateView, SmsRequestDetailView
 from .templates_api import TemplateApproveView, TemplateDetailView, TemplateListCreateView
@@ -14,10 +22,12 @@ urlpatterns = [
     path("admin/agents", AgentListView.as_view(), name="agents-list"),
     path("admin/agents/<str:agent_id>/unregister", AgentUnregisterView.as_view(), name="agent-unregister"),
     path("admin/agent/registration-secret", AgentRegistrationSecretView.as_view(), name="agent-registration-secret"),
+    path("admin/metrics", MetricsView.as_view(), name="admin-metrics"),
     path("templates", TemplateListCreateView.as_view(), name="templates"),
     path("templates/<str:template_id>", TemplateDetailView.as_view(), name="template-detail"),
     path("templates/<str:template_id>/approve", TemplateApproveView.as_view(), name="template-approve"),
     path("requests", SmsRequestCreateView.as_view(), name="requests-create"),
+    path("campaigns", SmsCampaignCreateView.as_view(), name="campaigns-create"),
     path("requests/<str:request_id>", SmsRequestDetailView.as_view(), name="requests-detail"),
     path("messages", SmsMessageListView.as_view(), name="messages-list"),
     path("messages/all", SmsMessageAllListView.as_view(), name="messages-all"),
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from .mongo import get_collection
+from .utils import now_utc
+
+USAGE_COLLECTION = "api_key_usage"
+
+
+def reserve_daily_quota(api_key_id: str, day_bucket: str, amount: int, limit: int) -> bool:
+    """Atomically add ``amount`` to the key's counter for the day unless it would exceed ``limit``.
+
+    The filter only matches while there is room left; when it does not, the upsert
+    collides with the unique ``(api_key_id, day_bucket)`` index and the reservation
+    is rejected, so concurrent workers can never overshoot the limit.
+    """
+    if amount <= 0:
+        return True
+    if amount > limit:
+        return False
+    now = now_utc()
+    for _ in range(2):
+        try:
+            get_collection(USAGE_COLLECTION).update_one(
+                {"api_key_id": api_key_id, "day_bucket": day_bucket, "count": {"$lte": limit - amount}},
+                {
+                    "$inc": {"count": amount},
+                    "$set": {"updated_at": now},
+                    "$setOnInsert": {"created_at": now},
+                },
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            # Either the counter is full, or another worker created it first; the
+            # second attempt tells those apart by matching the existing document.
+            continue
+    return False
+
+
+def release_daily_quota(api_key_id: str, day_bucket: str, amount: int) -> None:
+    if amount <= 0:
+        return
+    get_collection(USAGE_COLLECTION).update_one(
+        {"api_key_id": api_key_id, "day_bucket": day_bucket},
+        {"$inc": {"count": -amount}, "$set": {"updated_at": now_utc()}},
+    )
+
+
+def rebuild_daily_usage(day_bucket: Optional[str] = None) -> int:
+    """Recompute counters from ``sms_requests.total_accepted``; returns the number of counters written."""
+    match: Dict[str, Any] = {"api_key_id": {"$ne": None}}
+    if day_bucket:
+        match["day_bucket"] = day_bucket
+    pipeline = [
+        {"$match": match},
+        {
+            "$group": {
+                "_id": {"api_key_id": "$api_key_id", "day_bucket": "$day_bucket"},
+                "total": {"$sum": "$total_accepted"},
+            }
+        },
+    ]
+    now = now_utc()
+    operations: List[UpdateOne] = [
+        UpdateOne(
+            {"api_key_id": doc["_id"]["api_key_id"], "day_bucket": doc["_id"]["day_bucket"]},
+            {"$set": {"count": doc["total"], "updated_at": now}, "$setOnInsert": {"created_at": now}},
+            upsert=True,
+        )
+        for doc in get_collection("sms_requests").aggregate(pipeline)
+    ]
+    if operations:
+        get_collection(USAGE_COLLECTION).bulk_write(operations, ordered=False)
+    return len(operations)
@@ -3,13 +3,14 @@ import json
 import re
 import secrets
 import uuid
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, Iterable, List, Optional
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 from bson import ObjectId
 from django.conf import settings
 
-from .mongo import get_collection
+from .audit import audit_sink
 
 PLACEHOLDER_PATTERN = re.compile(r"\{([A-Z0-9_]+)\}")
 
@@ -62,15 +63,37 @@ def extract_template_variables(content: str) -> List[str]:
     return sorted(set(match.group(1) for match in PLACEHOLDER_PATTERN.finditer(content)))
 
 
-def render_template(content: str, variables: Dict[str, Any]) -> str:
-    def replace(match: re.Match[str]) -> str:
-        key = match.group(1)
+@dataclass(frozen=True)
+class CompiledTemplate:
+    """Template content split around placeholders: ``literals[0] keys[0] literals[1] ... literals[-1]``."""
+
+    literals: Tuple[str, ...]
+    keys: Tuple[str, ...]
+
+
+def compile_template(content: str) -> CompiledTemplate:
+    parts = PLACEHOLDER_PATTERN.split(content)
+    return CompiledTemplate(literals=tuple(parts[0::2]), keys=tuple(parts[1::2]))
+
+
+def render_compiled(compiled: CompiledTemplate, variables: Dict[str, Any]) -> str:
+    literals = compiled.literals
+    parts = [literals[0]]
+    for index, key in enumerate(compiled.keys, start=1):
         value = variables.get(key)
         if value is None:
             raise ValueError(f"Missing variable {key}")
-        return str(value)
+        parts.append(str(value))
+        parts.append(literals[index])
+    return "".join(parts)
+
+
+def render_template(content: str, variables: Dict[str, Any]) -> str:
+    return render_compiled(compile_template(content), variables)
+
 
-    return PLACEHOLDER_PATTERN.sub(replace, content)
+def message_fingerprint(to: str, text: str) -> str:
+    return sha256_hex(f"{to}\n{text}")
 
 
 def vars_hash(variables: Dict[str, Any]) -> str:
@@ -94,7 +117,7 @@ def write_audit_log(actor_type: str, actor_id: str, action: str, data: Dict[str,
         "data": data,
         "created_at": now_utc(),
     }
-    get_collection("audit_logs").insert_one(doc)
+    audit_sink.submit(doc)
 
 
 def parse_int(value: Optional[str], default: int) -> int:
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+from unittest.mock import MagicMock, patch
+
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
+
+from sms_gateway.audit import AuditSink
+
+
+@override_settings(AUDIT_LOG_SYNC=False, AUDIT_LOG_MAX_QUEUE=4, AUDIT_LOG_BATCH_SIZE=2, AUDIT_LOG_FLUSH_SECONDS=3600)
+@patch.object(AuditSink, "_run")
+class AuditSinkRequeueTests(SimpleTestCase):
+    def make_sink(self, *names: str) -> AuditSink:
+        sink = AuditSink()
+        for name in names:
+            sink.submit({"name": name})
+        return sink
+
+    def failing_insert(self, sink: AuditSink, *names: str) -> MagicMock:
+        """A collection whose insert_many queues ``names`` (as if submitted concurrently) and then fails."""
+
+        def insert_many(batch, ordered=False):
+            for name in names:
+                sink.submit({"name": name})
+            raise ConnectionError("mongo down")
+
+        collection = MagicMock()
+        collection.insert_many.side_effect = insert_many
+        return collection
+
+    def queued(self, sink: AuditSink) -> list:
+        return [doc["name"] for doc in sink._queue]
+
+    def test_failed_flush_on_full_queue_keeps_newest_entries(self, _run):
+        sink = self.make_sink("a0", "a1", "a2", "a3")
+        collection = self.failing_insert(sink, "n0", "n1")
+        with patch("sms_gateway.audit.get_collection", return_value=collection):
+            with self.assertRaises(ConnectionError):
+                sink.flush()
+        self.assertEqual(self.queued(sink), ["a2", "a3", "n0", "n1"])
+        self.assertEqual(sink.dropped, 2)
+
+    def test_failed_flush_drops_oldest_of_batch_when_partly_full(self, _run):
+        sink = self.make_sink("a0", "a1", "a2", "a3")
+        collection = self.failing_insert(sink, "n0")
+        with patch("sms_gateway.audit.get_collection", return_value=collection):
+            with self.assertRaises(ConnectionError):
+                sink.flush()
+        self.assertEqual(self.queued(sink), ["a1", "a2", "a3", "n0"])
+        self.assertEqual(sink.dropped, 1)
+
+    def test_failed_flush_with_room_requeues_whole_batch(self, _run):
+        sink = self.make_sink("a0", "a1", "a2")
+        collection = self.failing_insert(sink)
+        with patch("sms_gateway.audit.get_collection", return_value=collection):
+            with self.assertRaises(ConnectionError):
+                sink.flush()
+        self.assertEqual(self.queued(sink), ["a0", "a1", "a2"])
+        self.assertEqual(sink.dropped, 0)
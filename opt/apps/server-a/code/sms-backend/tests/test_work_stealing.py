@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+from datetime import timedelta
+from unittest.mock import patch
+
+import mongomock
+from bson import ObjectId
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
+
+from sms_gateway import routing
+from sms_gateway.constants import MessageStatus
+from sms_gateway.leasing import lease_batch
+from sms_gateway.utils import now_utc
+
+
+@override_settings(AGENT_WORK_STEAL_AFTER_SECONDS=600)
+class UnregisteredAgentBacklogTests(SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.db = mongomock.MongoClient(tz_aware=True)["test_sms"]
+        patcher = patch("sms_gateway.mongo.get_db", return_value=self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        routing._stale_cache = (0.0, [])
+        self.addCleanup(setattr, routing, "_stale_cache", (0.0, []))
+        self.now = now_utc()
+        self.poller = self.create_agent(is_active=True)
+        self.unregistered = self.create_agent(is_active=False)
+        self.db.sms_requests.insert_one(
+            {"request_id": "req-1", "status_counts": {MessageStatus.PENDING.value: 2}}
+        )
+
+    def create_agent(self, is_active: bool) -> str:
+        # Both agents heartbeat recently: the unregistered one must not wait out the steal timer.
+        agent_id = ObjectId()
+        self.db.agents.insert_one({"_id": agent_id, "is_active": is_active, "last_seen_at": self.now})
+        return str(agent_id)
+
+    def create_message(self, agent_id: str, auto_routed: bool) -> ObjectId:
+        created_at = self.now - timedelta(minutes=1)
+        return self.db.sms_messages.insert_one(
+            {
+                "request_id": "req-1",
+                "agent_id": agent_id,
+                "auto_routed": auto_routed,
+                "status": MessageStatus.PENDING.value,
+                "priority_weight": 1,
+                "available_at": created_at,
+                "created_at": created_at,
+                "attempts": 0,
+            }
+        ).inserted_id
+
+    def test_unregistered_agent_with_auto_routed_backlog_is_stale(self):
+        self.create_message(self.unregistered, auto_routed=True)
+        self.assertEqual(routing.stale_agent_ids(self.now), [self.unregistered])
+
+    def test_unregistered_agent_without_backlog_is_not_stale(self):
+        self.create_message(self.unregistered, auto_routed=False)
+        self.assertEqual(routing.stale_agent_ids(self.now), [])
+
+    def test_active_agent_leases_backlog_of_unregistered_agent(self):
+        stolen_id = self.create_message(self.unregistered, auto_routed=True)
+        pinned_id = self.create_message(self.unregistered, auto_routed=False)
+
+        leased = lease_batch(self.poller, 10, 300, self.now)
+
+        self.assertEqual([doc["_id"] for doc in leased], [stolen_id])
+        stolen = self.db.sms_messages.find_one({"_id": stolen_id})
+        self.assertEqual(stolen["agent_id"], self.poller)
+        self.assertEqual(stolen["status"], MessageStatus.ASSIGNED.value)
+        pinned = self.db.sms_messages.find_one({"_id": pinned_id})
+        self.assertEqual(pinned["agent_id"], self.unregistered)
+        self.assertEqual(pinned["status"], MessageStatus.PENDING.value)
+        counts = self.db.sms_requests.find_one({"request_id": "req-1"})["status_counts"]
+        self.assertEqual(counts, {MessageStatus.PENDING.value: 1, MessageStatus.ASSIGNED.value: 1})